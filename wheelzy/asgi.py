@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wheelzy.settings')
+# no persistent connections under ASGI (see CONN_MAX_AGE in settings)
+os.environ.setdefault('WHEELZY_DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,20 +43,58 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wheelzy_app.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wheelzy_app.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'wheelzy.urls'
 
+# request.user comes from the cache (see wheelzy_app.auth) when every worker
+# shares it (WHEELZY_CACHE=file, below); a per-process cache would miss
+# password changes made in other workers. Logging in still checks the
+# password against the database.
+AUTHENTICATION_BACKENDS = [
+    'wheelzy_app.auth.CachedModelBackend'
+    if os.environ.get('WHEELZY_CACHE') == 'file'
+    else 'django.contrib.auth.backends.ModelBackend'
+]
+
+# WHEELZY_SESSIONS: cached_db (default: cache in front of the session
+# table), cache (cache only; sessions go when it is cleared), signed_cookies
+# (no server state; the data rides along in the cookie) or db
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[os.environ.get('WHEELZY_SESSIONS', 'cached_db')]
+
+# login attempts allowed per (attempts, seconds), per client address and
+# per username from one address, before the login form answers 429 without
+# checking the password. Not per username alone: anyone could then lock
+# any account out.
+WHEELZY_LOGIN_RATES = {
+    'ip': (20, 60),
+    'username': (5, 60),
+}
+
+# Behind a reverse proxy every request comes from the proxy's address, so
+# name the META key of the header it sets (e.g. HTTP_X_FORWARDED_FOR); the
+# last address in it, the one the proxy saw, is taken as the client's.
+# Leave unset when clients connect directly: they could send the header.
+WHEELZY_CLIENT_IP_HEADER = os.environ.get('WHEELZY_CLIENT_IP_HEADER') or None
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render time reported to the profiler
+        'BACKEND': 'wheelzy_app.profiling.TimedDjangoTemplates',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,13 +112,96 @@ WSGI_APPLICATION = 'wheelzy.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+# SQLite by default. WHEELZY_DB=postgres switches to Postgres (needs
+# psycopg[pool]) configured from the POSTGRES_* variables; setting
+# POSTGRES_REPLICA_HOST adds a "replica" alias for catalogue reads.
+
+if os.environ.get('WHEELZY_DB') == 'postgres':
+    def postgres_database(host):
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'wheelzy'),
+            'USER': os.environ.get('POSTGRES_USER', 'wheelzy'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # the pool keeps connections open, so Django must not
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
+
+    DATABASES = {
+        'default': postgres_database(os.environ.get('POSTGRES_HOST', 'localhost')),
+    }
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **postgres_database(os.environ['POSTGRES_REPLICA_HOST']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # reuse each thread's connection for a minute, checking it is
+            # still usable before a request picks it up again. WSGI only:
+            # under ASGI the sync work of requests runs on executor threads
+            # whose connections are never closed by the request cycle, so
+            # asgi.py defaults this to 0
+            'CONN_MAX_AGE': int(os.environ.get('WHEELZY_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # take the write lock at BEGIN so concurrent bookings queue up
+                # instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                # busy timeout, in seconds
+                'timeout': 20,
+                # run on every new connection: NORMAL sync is safe under WAL
+                # (which migration 0015 switches the file to, once), and the
+                # page cache / mmap keep hot tables in memory
+                'init_command': (
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+            # a file (not shared-cache memory) so the concurrency tests see the
+            # same locking behaviour as the real database
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DATABASE_ROUTERS = ['wheelzy_app.routers.CatalogueReplicaRouter']
+
+
+# Cache
+# Local memory by default; set WHEELZY_CACHE=file to share the cache (and
+# its invalidation versions) between worker processes on one machine.
+
+if os.environ.get('WHEELZY_CACHE') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'wheelzy',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
     }
-}
 
 
 # Password validation
@@ -121,8 +243,82 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# WHEELZY_STATIC_MANIFEST=1 for deployments: collectstatic then writes
+# content-hashed, precompressed files that are served with far-future
+# Cache-Control. Without it {% static %} needs no collectstatic (runserver, tests).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'wheelzy_app.static_files.CompressedManifestStaticFilesStorage'
+            if os.environ.get('WHEELZY_STATIC_MANIFEST') == '1'
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# with DEBUG off the app serves /static/ and /media/ itself (see
+# wheelzy_app.static_files) unless a front server does; set
+# WHEELZY_SERVE_FILES=0 then. WHEELZY_SENDFILE=x-accel-redirect (nginx, files
+# under WHEELZY_SENDFILE_PREFIX) or x-sendfile (Apache) hands the bytes off.
+WHEELZY_SERVE_FILES = os.environ.get('WHEELZY_SERVE_FILES', '1') == '1'
+WHEELZY_SENDFILE = os.environ.get('WHEELZY_SENDFILE') or None
+WHEELZY_SENDFILE_PREFIX = os.environ.get('WHEELZY_SENDFILE_PREFIX', '/protected/')
+
+# background threads resizing uploads into WebP variants (0 = inline)
+WHEELZY_IMAGE_WORKERS = 2
+
+# seconds a booking may stay pending (unconfirmed) before run_scheduler
+# expires it and frees the vehicle
+WHEELZY_PENDING_TTL = 2 * 60 * 60
+# ...or once it has been due to start this many seconds, so short-notice
+# bookings leave the owner time to confirm
+WHEELZY_PENDING_GRACE = 30 * 60
+
+# longest booking create_booking accepts, in days
+WHEELZY_MAX_BOOKING_DAYS = 90
+
+# live availability (/events/availability/): the pub/sub class, the most
+# streams one process keeps open and how long each lasts before the
+# browser reconnects. LocalBroker only reaches streams in its own process.
+WHEELZY_EVENT_BROKER = 'wheelzy_app.events.LocalBroker'
+WHEELZY_SSE_MAX_STREAMS = 1000
+WHEELZY_SSE_MAX_SECONDS = 300
+
+# archive_bookings moves returned, cancelled and expired bookings that
+# ended this many days ago out of the live booking table
+WHEELZY_ARCHIVE_AFTER_DAYS = 90
+
+# /metrics is open to superusers, to scrapers sending "Authorization:
+# Bearer <WHEELZY_METRICS_TOKEN>" and to the client addresses listed here
+# (see WHEELZY_CLIENT_IP_HEADER). None by default.
+WHEELZY_METRICS_TOKEN = os.environ.get('WHEELZY_METRICS_TOKEN') or None
+WHEELZY_METRICS_IPS = []
+
+# most queries a view may run, keyed by URL name; over-budget requests log
+# a warning, or raise QueryBudgetExceeded when enforcement is on (tests)
+WHEELZY_QUERY_BUDGETS = {
+    'home': 3,
+    'all_vehicles': 6,
+    'vehicle_details': 6,
+    'book_vehicle': 20,
+    'my_bookings': 5,
+    'owner_vehicle_list': 5,
+    'owner_vehicle_bookings': 5,
+    'api_vehicles': 6,
+    'api_quotes': 6,
+    'api_vehicle_calendar': 4,
+    'owner_analytics_daily': 5,
+    'owner_analytics_vehicles': 5,
+    'admin_analytics': 6,
+}
+WHEELZY_ENFORCE_QUERY_BUDGETS = False
+
 
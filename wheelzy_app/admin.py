@@ -1,7 +1,132 @@
-from django.contrib import admin
-from .models import Vehicle, Booking, DamageReport
-# Register your models here.
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
 
-admin.site.register(Vehicle)
-admin.site.register(Booking)
-admin.site.register(DamageReport)
\ No newline at end of file
+from .bookings import bulk_transition
+from .models import ArchivedBooking, Vehicle, Booking, DamageReport, PriceRule
+from .search import search_vehicles
+
+# changelists count at most this many rows exactly
+COUNT_LIMIT = 10000
+
+
+def estimated_row_count(queryset):
+    # planner statistics on Postgres, the highest id elsewhere; both are
+    # index or catalogue lookups instead of a scan
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return model._default_manager.using(queryset.db).aggregate(last=Max("pk"))["last"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    # COUNT(*) over millions of bookings is the slowest part of a changelist:
+    # count up to COUNT_LIMIT rows exactly, beyond that estimate an
+    # unfiltered table and stop at the limit for a filtered one
+    count_limit = COUNT_LIMIT
+
+    @cached_property
+    def count(self):
+        exact = self.object_list[:self.count_limit].count()
+        if exact < self.count_limit:
+            return exact
+        if not self.object_list.query.where:
+            return max(estimated_row_count(self.object_list), self.count_limit)
+        return self.count_limit
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class PriceRuleInline(admin.TabularInline):
+    model = PriceRule
+    extra = 0
+
+
+@admin.register(Vehicle)
+class VehicleAdmin(ScalableAdmin):
+    list_display = (
+        "id", "vehicle_name", "number_plate", "vehicle_type", "owner",
+        "price_per_hour", "current_status", "next_free_at",
+    )
+    list_select_related = ("owner",)
+    list_filter = ("vehicle_type", "current_status")
+    search_fields = ("number_plate", "vehicle_name")
+    autocomplete_fields = ("owner",)
+    readonly_fields = ("current_status", "next_free_at")
+    inlines = [PriceRuleInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        # the catalogue's full-text index instead of LIKE over every row
+        if not search_term:
+            return queryset, False
+        return search_vehicles(queryset, search_term), False
+
+
+@admin.register(Booking)
+class BookingAdmin(ScalableAdmin):
+    list_display = (
+        "id", "vehicle", "user", "start_time", "end_time", "status", "total_price", "ordered_at",
+    )
+    list_select_related = ("vehicle", "user")
+    # status and status + start_time are indexed
+    list_filter = ("status", "start_time")
+    # exact matches only, each served by a unique index
+    search_fields = ("=id", "=vehicle__number_plate", "=user__username")
+    autocomplete_fields = ("user", "vehicle")
+    # status only moves through the actions below, which check TRANSITIONS
+    # and refresh the vehicle like any other transition
+    readonly_fields = ("status", "total_price", "ordered_at")
+    actions = ["confirm_bookings", "cancel_bookings", "expire_bookings"]
+
+    def _move(self, request, queryset, target):
+        # bookings whose status does not allow the move are left alone
+        moved = bulk_transition(queryset, target)
+        level = messages.SUCCESS if moved else messages.WARNING
+        self.message_user(request, f"{moved} booking(s) now {target}", level)
+
+    @admin.action(description="Confirm selected pending bookings")
+    def confirm_bookings(self, request, queryset):
+        self._move(request, queryset, "confirmed")
+
+    @admin.action(description="Cancel selected bookings")
+    def cancel_bookings(self, request, queryset):
+        self._move(request, queryset, "cancelled")
+
+    @admin.action(description="Expire selected pending bookings")
+    def expire_bookings(self, request, queryset):
+        self._move(request, queryset, "expired")
+
+
+@admin.register(DamageReport)
+class DamageReportAdmin(ScalableAdmin):
+    list_display = ("id", "booking", "damage_cost")
+    list_select_related = ("booking__vehicle",)
+    raw_id_fields = ("booking",)
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ScalableAdmin):
+    list_display = (
+        "id", "vehicle", "user", "start_time", "end_time", "status", "total_price", "archived_at",
+    )
+    list_select_related = ("vehicle", "user")
+    list_filter = ("status",)
+    search_fields = ("=id", "=user__username")
+    raw_id_fields = ("user", "vehicle")
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,300 @@
+from collections import defaultdict
+from itertools import chain
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import (
+    ArchivedBooking, ArchivedDamageReport, Booking, DailyVehicleStats, DamageReport, Vehicle,
+)
+
+# bookings that earn money and keep the vehicle busy; pending ones have
+# not been paid for and the rest never happened
+EARNING_STATUSES = ("confirmed", "in_use", "overdue", "returned")
+
+HOUR = Decimal(3600)
+CENT = Decimal("0.01")
+ROLLUP_BATCH_SIZE = 200
+
+DEFAULT_DAYS = 30
+# per-day series are capped; longer histories are asked for by month
+MAX_DAILY_DAYS = 366
+MAX_MONTHLY_DAYS = 366 * 10
+
+SERIES = ("bookings", "revenue", "booked_hours", "damage_cost")
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def affects_rollup(old_status, new_status):
+    return (old_status in EARNING_STATUSES) != (new_status in EARNING_STATUSES)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def first_day(start):
+    return timezone.localdate(start)
+
+
+def last_day(end):
+    # bookings are half-open, so one ending at midnight ends the day before
+    return timezone.localdate(end - timedelta(microseconds=1))
+
+
+def _days(first, last):
+    day = first
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _compute(bookings, damages):
+    # {(vehicle_id, day): [bookings, revenue, booked seconds, damage]}
+    # from (vehicle_id, start, end, total_price) and (vehicle_id, end, cost)
+    cells = defaultdict(lambda: [0, Decimal(0), 0, Decimal(0)])
+    for vehicle_id, start, end, price in bookings:
+        cell = cells[vehicle_id, first_day(start)]
+        cell[0] += 1
+        cell[1] += price
+        for day in _days(first_day(start), last_day(end)):
+            lo = max(start, day_start(day))
+            hi = min(end, day_start(day + timedelta(days=1)))
+            cells[vehicle_id, day][2] += (hi - lo).total_seconds()
+    for vehicle_id, end, cost in damages:
+        cells[vehicle_id, last_day(end)][3] += cost
+    return cells
+
+
+def _rows(cells, owners, keep=None):
+    return [
+        DailyVehicleStats(
+            vehicle_id=vehicle_id,
+            owner_id=owners[vehicle_id],
+            day=day,
+            bookings=count,
+            revenue=revenue,
+            booked_hours=(Decimal(seconds) / HOUR).quantize(CENT),
+            damage_cost=damage,
+        )
+        for (vehicle_id, day), (count, revenue, seconds, damage) in cells.items()
+        if vehicle_id in owners and (keep is None or keep(vehicle_id, day))
+    ]
+
+
+def _booking_rows(query):
+    # (vehicle_id, start, end, total_price) of earning bookings, live and
+    # archived; `query` builds the filtered queryset for either model
+    return chain.from_iterable(
+        query(model).filter(status__in=EARNING_STATUSES).values_list(
+            "vehicle_id", "start_time", "end_time", "total_price"
+        )
+        for model in (Booking, ArchivedBooking)
+    )
+
+
+def _damage_rows(query):
+    return chain.from_iterable(
+        query(model).values_list("booking__vehicle_id", "booking__end_time", "damage_cost")
+        for model in (DamageReport, ArchivedDamageReport)
+    )
+
+
+def refresh_span(vehicle_id, first, last):
+    # Recomputes one vehicle's cells from `first` to `last` (local dates)
+    # out of the bookings and damage reports touching those days.
+    lo, hi = day_start(first), day_start(last + timedelta(days=1))
+    bookings = _booking_rows(
+        lambda model: model.objects.filter(
+            vehicle_id=vehicle_id, start_time__lt=hi, end_time__gt=lo,
+        )
+    )
+    damages = _damage_rows(
+        lambda model: model.objects.filter(
+            booking__vehicle_id=vehicle_id, booking__end_time__gt=lo, booking__end_time__lte=hi,
+        )
+    )
+    owners = dict(Vehicle.objects.filter(pk=vehicle_id).values_list("pk", "owner_id"))
+
+    rows = _rows(_compute(bookings, damages), owners, lambda _, day: first <= day <= last)
+    with transaction.atomic():
+        DailyVehicleStats.objects.filter(
+            vehicle_id=vehicle_id, day__gte=first, day__lte=last
+        ).delete()
+        DailyVehicleStats.objects.bulk_create(rows)
+
+
+def refresh_bookings(spans):
+    # spans: (vehicle_id, start_time, end_time) of bookings that changed;
+    # overlapping days of the same vehicle are refreshed together
+    by_vehicle = defaultdict(list)
+    for vehicle_id, start, end in spans:
+        by_vehicle[vehicle_id].append((first_day(start), last_day(end)))
+    for vehicle_id, ranges in by_vehicle.items():
+        ranges.sort()
+        first, last = ranges[0]
+        for lo, hi in ranges[1:]:
+            if lo > last + timedelta(days=1):
+                refresh_span(vehicle_id, first, last)
+                first = lo
+            last = max(last, hi)
+        refresh_span(vehicle_id, first, last)
+
+
+def rebuild_rollup(vehicle_ids=None, batch_size=ROLLUP_BATCH_SIZE):
+    # Rewrites every cell of the given vehicles (all of them by default)
+    # from scratch. Returns the number of rows written.
+    vehicles = Vehicle.objects.order_by("pk")
+    if vehicle_ids is not None:
+        vehicles = vehicles.filter(pk__in=vehicle_ids)
+    owners_all = list(vehicles.values_list("pk", "owner_id"))
+    if vehicle_ids is None:
+        DailyVehicleStats.objects.exclude(vehicle_id__in=vehicles.values("pk")).delete()
+
+    written = 0
+    for i in range(0, len(owners_all), batch_size):
+        owners = dict(owners_all[i:i + batch_size])
+        bookings = _booking_rows(lambda model: model.objects.filter(vehicle_id__in=owners))
+        damages = _damage_rows(
+            lambda model: model.objects.filter(booking__vehicle_id__in=owners)
+        )
+        rows = _rows(_compute(bookings, damages), owners)
+        with transaction.atomic():
+            DailyVehicleStats.objects.filter(vehicle_id__in=owners).delete()
+            DailyVehicleStats.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+def date_range(params, today=None):
+    # (first, last, group) from ?from=YYYY-MM-DD&to=YYYY-MM-DD&group=day|month
+    today = today or timezone.localdate()
+    group = params.get("group") or "day"
+    if group not in ("day", "month"):
+        raise AnalyticsError("group must be day or month")
+    try:
+        last = date.fromisoformat(params["to"]) if params.get("to") else today
+        first = (
+            date.fromisoformat(params["from"]) if params.get("from")
+            else last - timedelta(days=DEFAULT_DAYS - 1)
+        )
+    except ValueError:
+        raise AnalyticsError("Dates must look like 2024-01-31")
+    if first > last:
+        raise AnalyticsError("from must not be after to")
+    limit = MAX_DAILY_DAYS if group == "day" else MAX_MONTHLY_DAYS
+    if (last - first).days >= limit:
+        raise AnalyticsError(f"At most {limit} days per {group} chart")
+    return first, last, group
+
+
+def _totals():
+    return {
+        "bookings": Sum("bookings"),
+        "revenue": Sum("revenue"),
+        "booked_hours": Sum("booked_hours"),
+        "damage_cost": Sum("damage_cost"),
+    }
+
+
+def _number(value):
+    if value is None:
+        return 0
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _labels(first, last, group):
+    if group == "day":
+        return list(_days(first, last))
+    months, month = [], first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def time_series(stats, first, last, group="day"):
+    # one point per day (or month) from first to last, gaps filled with 0,
+    # ready to hand to a chart
+    stats = stats.filter(day__gte=first, day__lte=last)
+    bucket = "day"
+    if group == "month":
+        stats = stats.annotate(month=TruncMonth("day"))
+        bucket = "month"
+    rows = {
+        row[bucket]: row
+        for row in stats.values(bucket).annotate(**_totals()).order_by(bucket)
+    }
+    labels = _labels(first, last, group)
+    series = {
+        name: [_number(rows[label][name]) if label in rows else 0 for label in labels]
+        for name in SERIES
+    }
+    return {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "group": group,
+        "labels": [label.isoformat() for label in labels],
+        "series": series,
+        "totals": {name: round(sum(values), 2) for name, values in series.items()},
+    }
+
+
+def vehicle_breakdown(owner, first, last):
+    # per-vehicle totals over the range, busiest first; utilization is
+    # booked hours over the hours in the range
+    hours = ((last - first).days + 1) * 24
+    rows = (
+        DailyVehicleStats.objects.filter(owner=owner, day__gte=first, day__lte=last)
+        .values("vehicle_id", "vehicle__vehicle_name", "vehicle__number_plate")
+        .annotate(**_totals())
+        .order_by("-revenue", "vehicle_id")
+    )
+    return {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "vehicles": [
+            {
+                "vehicle_id": row["vehicle_id"],
+                "label": f'{row["vehicle__vehicle_name"]} - {row["vehicle__number_plate"]}',
+                "bookings": row["bookings"],
+                "revenue": _number(row["revenue"]),
+                "booked_hours": _number(row["booked_hours"]),
+                "damage_cost": _number(row["damage_cost"]),
+                "utilization": round(_number(row["booked_hours"]) * 100 / hours, 1),
+            }
+            for row in rows
+        ],
+    }
+
+
+def owner_breakdown(first, last):
+    rows = (
+        DailyVehicleStats.objects.filter(day__gte=first, day__lte=last)
+        .values("owner_id", "owner__username")
+        .annotate(vehicles=Count("vehicle_id", distinct=True), **_totals())
+        .order_by("-revenue", "owner_id")
+    )
+    return {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "owners": [
+            {
+                "owner_id": row["owner_id"],
+                "label": row["owner__username"] or "No owner",
+                "vehicles": row["vehicles"],
+                "bookings": row["bookings"],
+                "revenue": _number(row["revenue"]),
+                "booked_hours": _number(row["booked_hours"]),
+                "damage_cost": _number(row["damage_cost"]),
+            }
+            for row in rows
+        ],
+    }
@@ -0,0 +1,126 @@
+import base64
+
+from django.db.models import Max
+from django.http import Http404
+from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .caching import CATALOGUE, get_version, vehicle_scope
+from .catalogue import PAGE_SIZE, catalogue_order, vehicle_catalogue
+from .conditional import changed_at, fleet_changed_at, not_modified, set_validators, validators
+from .models import Vehicle, VehicleOccupancy
+from .occupancy import OccupancyError, month_bounds, month_hours, pack, parse_month
+from .pricing import quote_many
+from .serializers import QuoteRequestSerializer, VehicleSerializer
+
+
+class VehicleCursorPagination(CursorPagination):
+    # keyset pagination: each page seeks from the last row of the previous
+    # one, so deep pages cost the same as the first
+    page_size = PAGE_SIZE
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    ordering = ("id",)
+
+
+class VehicleListAPI(generics.ListAPIView):
+    serializer_class = VehicleSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = VehicleCursorPagination
+    filter_backends = [OrderingFilter]
+    # ?ordering=price_per_hour,id pages on (price_per_hour, id)
+    ordering_fields = ["id", "price_per_hour"]
+
+    @property
+    def ordering(self):
+        return [catalogue_order(self.request.query_params)]
+
+    def get_queryset(self):
+        return vehicle_catalogue(self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        # the browsable API and JSON are different bodies, hence Accept
+        version = get_version(CATALOGUE)
+        etag, last_modified = validators(
+            [version, request.GET.urlencode(), request.headers.get("Accept"), request.user.pk],
+            changed_at(CATALOGUE, version, fleet_changed_at),
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        return set_validators(super().list(request, *args, **kwargs), etag, last_modified)
+
+
+class QuoteAPI(APIView):
+    # POST {"vehicle_ids": [...], "ranges": [{"start": ..., "end": ...}]}
+    # prices every vehicle for every range in one call
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = QuoteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        vehicle_ids = serializer.validated_data["vehicle_ids"]
+        ranges = [(r["start"], r["end"]) for r in serializer.validated_data["ranges"]]
+
+        totals = quote_many(vehicle_ids, ranges)
+        quotes = [
+            {
+                "vehicle_id": vehicle_id,
+                "start": start,
+                "end": end,
+                "total_price": str(totals[vehicle_id, index]),
+            }
+            for vehicle_id in dict.fromkeys(vehicle_ids)
+            if (vehicle_id, 0) in totals
+            for index, (start, end) in enumerate(ranges)
+        ]
+        missing = [v for v in dict.fromkeys(vehicle_ids) if (v, 0) not in totals]
+        return Response({"quotes": quotes, "missing": missing})
+
+
+class VehicleCalendarAPI(APIView):
+    # GET ?month=2024-03 (this month by default): one bit per hour of the
+    # month, set where the vehicle is booked, packed as in occupancy.py and
+    # base64 encoded
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, vehicle_id):
+        try:
+            month = parse_month(request.query_params.get("month"))
+        except OccupancyError as exc:
+            raise ValidationError({"month": str(exc)})
+        # a booking anywhere in the calendar may have changed without
+        # touching the vehicle row
+        vehicle = Vehicle.objects.filter(pk=vehicle_id).only(
+            "current_status", "next_free_at", "updated_at"
+        ).annotate(bookings_changed_at=Max("booking__updated_at")).first()
+        if vehicle is None:
+            raise Http404
+        etag, last_modified = validators(
+            [get_version(vehicle_scope(vehicle.pk)), month, request.headers.get("Accept"),
+             request.user.pk],
+            max(vehicle.updated_at, vehicle.bookings_changed_at or vehicle.updated_at),
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        stored = VehicleOccupancy.objects.filter(vehicle=vehicle, month=month).values_list(
+            "hours", flat=True
+        ).first()
+        bitmap = bytes(stored) if stored is not None else pack(0, month)
+        response = Response({
+            "vehicle_id": vehicle.pk,
+            "month": f"{month:%Y-%m}",
+            "start": month_bounds(month)[0],
+            "hours": month_hours(month),
+            "bit_order": "little",
+            "bitmap": base64.b64encode(bitmap).decode(),
+            "current_status": vehicle.current_status,
+            "next_free_at": vehicle.next_free_at,
+        })
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from heapq import merge
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    ArchivedBooking, ArchivedDamageReport, Booking, DamageReport, IdempotencyKey,
+)
+
+# bookings in these statuses never change again
+FINAL_STATUSES = ("returned", "cancelled", "expired")
+ARCHIVE_BATCH_SIZE = 1000
+HISTORY_PAGE_SIZE = 20
+
+BOOKING_FIELDS = (
+    "id", "user_id", "vehicle_id", "start_time", "end_time", "total_price",
+    "security_deposit", "status", "ordered_at",
+)
+DAMAGE_FIELDS = ("id", "booking_id", "damage_description", "damage_cost", "images")
+
+
+def archive_cutoff(days=None, now=None):
+    days = settings.WHEELZY_ARCHIVE_AFTER_DAYS if days is None else days
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_bookings(days=None, batch_size=ARCHIVE_BATCH_SIZE, now=None):
+    # Moves finished bookings that ended more than `days` ago, with their
+    # damage reports, into the archive tables; one transaction per batch.
+    # Returns the number of bookings moved.
+    cutoff = archive_cutoff(days, now)
+    due = Booking.objects.filter(status__in=FINAL_STATUSES, end_time__lt=cutoff)
+    moved, last = 0, 0
+    while True:
+        ids = list(due.filter(pk__gt=last).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return moved
+        with transaction.atomic():
+            moved += _archive_batch(ids)
+        last = ids[-1]
+
+
+def _archive_batch(ids):
+    # the status check again, under the transaction, in case a row moved
+    rows = list(Booking.objects.select_for_update().filter(
+        pk__in=ids, status__in=FINAL_STATUSES
+    ).values(*BOOKING_FIELDS))
+    if not rows:
+        return 0
+    ids = [row["id"] for row in rows]
+    ArchivedBooking.objects.bulk_create([ArchivedBooking(**row) for row in rows])
+    ArchivedDamageReport.objects.bulk_create([
+        ArchivedDamageReport(**row)
+        for row in DamageReport.objects.filter(booking_id__in=ids).values(*DAMAGE_FIELDS)
+    ])
+    # Plain DELETEs without signals: the archived copies keep availability
+    # and the analytics rollup exactly as they were. Retry keys only
+    # matter for the minutes after a booking is made.
+    _delete_rows(IdempotencyKey, "booking_id", ids)
+    _delete_rows(DamageReport, "booking_id", ids)
+    _delete_rows(Booking, "id", ids)
+    return len(rows)
+
+
+def _delete_rows(model, column, ids):
+    # DELETE ... WHERE column IN (ids), skipping the signals and cascade
+    # collection of QuerySet.delete()
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})", ids
+        )
+
+
+def _newest(queryset, before, size):
+    queryset = queryset.order_by("-id")
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    return list(queryset[:size + 1])
+
+
+def booking_history(filters, before=None, size=HISTORY_PAGE_SIZE, related=("vehicle",)):
+    # One page of bookings, newest first, from the live and the archive
+    # table together; ids are unique across both, so ?before=<id> seeks
+    # in each. Returns (bookings, cursor for the next page or None).
+    before = int(before) if str(before or "").isdigit() else None
+    live = _newest(Booking.objects.filter(**filters).select_related(*related), before, size)
+    archived = _newest(
+        ArchivedBooking.objects.filter(**filters).select_related(*related), before, size
+    )
+    rows = list(merge(live, archived, key=lambda booking: booking.id, reverse=True))
+    if len(rows) <= size:
+        return rows, None
+    return rows[:size], rows[size - 1].id
+
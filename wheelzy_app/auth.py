@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import UserProfile
+
+# The user row (with its profile) behind every authenticated request.
+# Signals drop the entry whenever either is saved or deleted, but only from
+# the cache of the process that saved it, so settings only pick this backend
+# when every worker shares the cache, and entries are short-lived: a
+# password change or deactivation elsewhere takes effect within a minute.
+USER_TIMEOUT = 60
+
+# Cached as plain values, without the password hash; the session hash
+# derived from it is kept instead so sessions can still be verified.
+USER_FIELDS = tuple(f.attname for f in User._meta.concrete_fields if f.attname != "password")
+PROFILE_FIELDS = tuple(f.attname for f in UserProfile._meta.concrete_fields)
+
+
+def _cache_key(user_id):
+    return f"authuser:{user_id}"
+
+
+def _entry(user):
+    # select_related also remembers a missing profile, so templates asking
+    # for request.user.profile never query
+    profile = getattr(user, "profile", None)
+    return {
+        "user": [getattr(user, name) for name in USER_FIELDS],
+        "session_hash": user.get_session_auth_hash(),
+        "profile": None if profile is None else [getattr(profile, name) for name in PROFILE_FIELDS],
+    }
+
+
+def _user(entry):
+    # the password stays deferred, so reading it or saving the user goes
+    # to the database and never writes a blank hash
+    user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, entry["user"])
+    session_hash = entry["session_hash"]
+    user.get_session_auth_hash = lambda: session_hash
+    profile = None
+    if entry["profile"] is not None:
+        profile = UserProfile.from_db(DEFAULT_DB_ALIAS, PROFILE_FIELDS, entry["profile"])
+        profile._state.fields_cache["user"] = user
+    user._state.fields_cache["profile"] = profile
+    return user
+
+
+def load_user(user_id):
+    key = _cache_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        user = User.objects.select_related("profile").filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, _entry(user), USER_TIMEOUT)
+        return user
+    return _user(entry)
+
+
+def forget_user(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    # ModelBackend whose per-request user lookup (AuthenticationMiddleware
+    # -> get_user) is served from the cache instead of auth_user
+    def get_user(self, user_id):
+        user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
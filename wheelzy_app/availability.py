@@ -0,0 +1,151 @@
+from collections import defaultdict
+
+from django.db.models import BooleanField, Exists, ExpressionWrapper, OuterRef, Q
+from django.utils import timezone
+
+from .events import availability_delta, publish_availability
+from .models import Booking, Vehicle
+
+# statuses that keep a vehicle blocked for the booked time range; the
+# scheduler moves bookings out of these so the set stays small
+ACTIVE_STATUSES = ("pending", "confirmed", "in_use", "overdue")
+# the vehicle has been picked up and is out until returned, whatever the
+# booked end time says
+OUT_STATUSES = ("in_use", "overdue")
+
+REFRESH_BATCH_SIZE = 1000
+# the stored columns are compared with the bookings on the primary, where
+# the bookings are; a lagging replica would hide writes still needed
+PRIMARY = "default"
+
+
+def overlap_q(start, end, prefix=""):
+    # bookings are half-open [start_time, end_time); a zero length window
+    # (start == end) asks "is the vehicle booked at this instant"
+    if end <= start:
+        return Q(**{
+            f"{prefix}start_time__lte": start,
+            f"{prefix}end_time__gt": start,
+        })
+    return Q(**{
+        f"{prefix}start_time__lt": end,
+        f"{prefix}end_time__gt": start,
+    })
+
+
+def active_bookings(start, end):
+    # served by the (vehicle, status, start_time, end_time) index on Booking
+    return Booking.objects.filter(
+        overlap_q(start, end),
+        status__in=ACTIVE_STATUSES,
+    )
+
+
+def _clashes(vehicle, start, end, exclude_booking=None):
+    bookings = active_bookings(start, end).filter(vehicle=vehicle)
+    if exclude_booking is not None:
+        bookings = bookings.exclude(pk=exclude_booking.pk)
+    return bookings
+
+
+def is_free(vehicle, start, end, exclude_booking=None):
+    return not _clashes(vehicle, start, end, exclude_booking).exists()
+
+
+async def ais_free(vehicle, start, end, exclude_booking=None):
+    return not await _clashes(vehicle, start, end, exclude_booking).aexists()
+
+
+def with_availability(queryset, start, end):
+    # one correlated EXISTS per row, evaluated in the same query
+    clash = active_bookings(start, end).filter(vehicle=OuterRef("pk"))
+    return queryset.annotate(is_available=~Exists(clash))
+
+
+def with_current_availability(queryset):
+    # "available right now" straight from the denormalized column
+    return queryset.annotate(is_available=ExpressionWrapper(
+        Q(current_status="available"), output_field=BooleanField()
+    ))
+
+
+def available_vehicles(start, end, filters=None, queryset=None):
+    vehicles = Vehicle.objects.all() if queryset is None else queryset
+    if filters:
+        vehicles = vehicles.filter(**filters)
+    return with_availability(vehicles, start, end).filter(is_available=True)
+
+
+def vehicle_states(vehicle_ids, now=None):
+    # {vehicle_id: (current_status, next_free_at)} worked out from bookings
+    now = now or timezone.now()
+    rows = defaultdict(list)
+    for vehicle_id, status, start, end in Booking.objects.filter(
+        Q(end_time__gt=now) | Q(status__in=OUT_STATUSES),
+        vehicle_id__in=vehicle_ids,
+        status__in=ACTIVE_STATUSES,
+    ).order_by("start_time").values_list("vehicle_id", "status", "start_time", "end_time"):
+        rows[vehicle_id].append((status, start, end))
+
+    states = {}
+    for vehicle_id in vehicle_ids:
+        bookings = rows.get(vehicle_id, ())
+        out = [end for status, _, end in bookings if status in OUT_STATUSES]
+        covering = [end for _, start, end in bookings if start <= now < end]
+        if not out and not covering:
+            states[vehicle_id] = ("available", None)
+            continue
+        # follow back-to-back bookings to when the vehicle is really free
+        free_at = max(out + covering)
+        for _, start, end in bookings:
+            if start <= free_at < end:
+                free_at = end
+        states[vehicle_id] = ("in_use" if out else "reserved", free_at)
+    return states
+
+
+def refresh_vehicle_status(vehicle_ids, now=None):
+    # Rewrites the denormalized columns of the given vehicles, only where
+    # they changed, and pushes the changes to live availability streams.
+    # Call it in the same transaction as the booking write.
+    vehicle_ids = list(set(vehicle_ids))
+    changed = 0
+    for i in range(0, len(vehicle_ids), REFRESH_BATCH_SIZE):
+        batch = vehicle_ids[i:i + REFRESH_BATCH_SIZE]
+        states = vehicle_states(batch, now)
+        written = timezone.now()
+        stale = [
+            Vehicle(id=vehicle_id, current_status=states[vehicle_id][0],
+                    next_free_at=states[vehicle_id][1], updated_at=written)
+            for vehicle_id, status, free_at in Vehicle.objects.using(PRIMARY).filter(id__in=batch).values_list(
+                "id", "current_status", "next_free_at"
+            )
+            if states[vehicle_id] != (status, free_at)
+        ]
+        Vehicle.objects.bulk_update(stale, Vehicle.DERIVED_FIELDS + ("updated_at",))
+        publish_availability(
+            availability_delta(v.id, v.current_status, v.next_free_at) for v in stale
+        )
+        changed += len(stale)
+    return changed
+
+
+def availability_mismatches(now=None, batch_size=REFRESH_BATCH_SIZE):
+    # [(vehicle_id, stored, expected)] for every vehicle whose columns
+    # disagree with its bookings
+    now = now or timezone.now()
+    mismatches = []
+    last = 0
+    while True:
+        stored = list(
+            Vehicle.objects.using(PRIMARY).filter(id__gt=last).order_by("id").values_list(
+                "id", "current_status", "next_free_at"
+            )[:batch_size]
+        )
+        if not stored:
+            return mismatches
+        states = vehicle_states([vehicle_id for vehicle_id, _, _ in stored], now)
+        for vehicle_id, status, free_at in stored:
+            if states[vehicle_id] != (status, free_at):
+                mismatches.append((vehicle_id, (status, free_at), states[vehicle_id]))
+        last = stored[-1][0]
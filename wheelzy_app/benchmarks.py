@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+PERCENTILES = (0.5, 0.95, 0.99)
+# a run is flagged when an endpoint's p95 is this much slower than baseline
+DEFAULT_TOLERANCE = 0.25
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Endpoint:
+    def __init__(self, name, path, user):
+        self.name = name
+        self.path = path
+        self.user = user
+
+
+def default_endpoints(customer, owner, vehicle):
+    # the pages customers and owners hit most
+    return [
+        Endpoint("home", reverse("home"), customer),
+        Endpoint("all_vehicles", reverse("all_vehicles"), customer),
+        Endpoint("book_vehicle", reverse("book_vehicle", args=[vehicle.pk]), customer),
+        Endpoint("my_bookings", reverse("my_bookings"), customer),
+        Endpoint("owner_vehicle_bookings", reverse("owner_vehicle_bookings"), owner),
+    ]
+
+
+def summarize(timings, elapsed, errors):
+    ordered = sorted(timings)
+    summary = {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+    }
+    for p in PERCENTILES:
+        summary[f"p{int(p * 100)}"] = round(percentile(ordered, p) * 1000, 2) if ordered else None
+    return summary
+
+
+def _test_hosts():
+    # the test clients always send Host: testserver
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"])
+
+
+@_test_hosts()
+def run_client(endpoints, requests=100, warmup=5):
+    # in-process through the test client: no network, one request at a time
+    clients = {}
+    results = {}
+    for endpoint in endpoints:
+        client = clients.get(endpoint.user.pk)
+        if client is None:
+            client = clients[endpoint.user.pk] = Client()
+            client.force_login(endpoint.user)
+
+        for _ in range(warmup):
+            client.get(endpoint.path)
+        timings, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            response = client.get(endpoint.path)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            timings.append(time.perf_counter() - t0)
+            if response.status_code != 200:
+                errors += 1
+        results[endpoint.name] = summarize(timings, time.perf_counter() - started, errors)
+    return results
+
+
+@_test_hosts()
+def run_asgi(endpoints, requests=100, concurrency=8, warmup=5):
+    # through the ASGI handler on one event loop, the way uvicorn serves
+    # it; up to `concurrency` requests are in flight at once
+    async def drive():
+        clients = {}
+        for endpoint in endpoints:
+            if endpoint.user.pk not in clients:
+                client = clients[endpoint.user.pk] = AsyncClient()
+                await client.aforce_login(endpoint.user)
+
+        gate = asyncio.Semaphore(concurrency)
+
+        async def fetch(endpoint):
+            async with gate:
+                t0 = time.perf_counter()
+                response = await clients[endpoint.user.pk].get(endpoint.path)
+                if response.streaming:
+                    async for _ in response.streaming_content:
+                        pass
+                return time.perf_counter() - t0, response.status_code == 200
+
+        results = {}
+        for endpoint in endpoints:
+            await asyncio.gather(*(fetch(endpoint) for _ in range(warmup)))
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*(fetch(endpoint) for _ in range(requests)))
+            elapsed = time.perf_counter() - started
+            results[endpoint.name] = summarize(
+                [t for t, _ in outcomes], elapsed, sum(1 for _, ok in outcomes if not ok)
+            )
+        return results
+
+    return asyncio.run(drive())
+
+
+def session_cookie(user):
+    # a logged-in session created directly, so the HTTP driver needs no
+    # login form or CSRF round trip
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+
+def run_http(endpoints, base_url, requests=100, concurrency=8, warmup=5, timeout=30):
+    # against a running server (runserver, gunicorn, ...) from a pool of
+    # threads; being sent to another page (the login form) counts as an error
+    cookies = {}
+    for endpoint in endpoints:
+        if endpoint.user.pk not in cookies:
+            cookies[endpoint.user.pk] = session_cookie(endpoint.user)
+
+    def fetch(endpoint):
+        url = base_url.rstrip("/") + endpoint.path
+        request = urllib.request.Request(url, headers={"Cookie": cookies[endpoint.user.pk]})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200 and response.url == url
+        except OSError:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for endpoint in endpoints:
+            list(pool.map(fetch, [endpoint] * warmup))
+            started = time.perf_counter()
+            outcomes = list(pool.map(fetch, [endpoint] * requests))
+            elapsed = time.perf_counter() - started
+            results[endpoint.name] = summarize(
+                [t for t, _ in outcomes], elapsed, sum(1 for _, ok in outcomes if not ok)
+            )
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # [(endpoint, baseline p95, current p95)] for every regression
+    regressions = []
+    for name, current in results.items():
+        before = (baseline or {}).get(name)
+        if not before or not before.get("p95") or current.get("p95") is None:
+            continue
+        if current["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append((name, before["p95"], current["p95"]))
+    return regressions
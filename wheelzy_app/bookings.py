@@ -0,0 +1,141 @@
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from .analytics import affects_rollup, refresh_bookings
+from .availability import is_free, refresh_vehicle_status
+from .caching import CATALOGUE, bump_version, vehicle_scope
+from .models import Booking, IdempotencyKey, Vehicle
+from .occupancy import affects_occupancy, refresh_occupancy
+
+
+class BookingError(Exception):
+    pass
+
+
+class VehicleUnavailable(BookingError):
+    pass
+
+
+# bookings moved per UPDATE by bulk_transition
+TRANSITION_BATCH_SIZE = 500
+
+# what a client may send as an Idempotency-Key: fits IdempotencyKey.key
+# (64 characters) and covers UUIDs, hex tokens and the like
+IDEMPOTENCY_KEY_RE = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+# SQLite reports "database is locked" when writers collide; the booking is
+# simply retried since nothing was written.
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05
+
+
+def valid_idempotency_key(key):
+    return IDEMPOTENCY_KEY_RE.fullmatch(key) is not None
+
+
+def create_booking(user, vehicle_id, start, end, idempotency_key=None):
+    if end <= start:
+        raise BookingError("End time must be after start time")
+    max_days = settings.WHEELZY_MAX_BOOKING_DAYS
+    if end - start > timedelta(days=max_days):
+        raise BookingError(f"A booking can last at most {max_days} days")
+
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return _create_booking(user, vehicle_id, start, end, idempotency_key)
+        except OperationalError as exc:
+            if "locked" not in str(exc) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(LOCK_BACKOFF * (attempt + 1))
+
+
+def _create_booking(user, vehicle_id, start, end, idempotency_key):
+    with transaction.atomic():
+        # serialises every booking attempt on this vehicle, including
+        # retries of the same request
+        vehicle = Vehicle.objects.select_for_update().get(pk=vehicle_id)
+
+        if idempotency_key:
+            replay = _replayed_booking(user, idempotency_key)
+            if replay is not None:
+                if replay.vehicle_id != vehicle.id:
+                    raise BookingError("This request was already submitted")
+                return replay
+
+        if not is_free(vehicle, start, end):
+            raise VehicleUnavailable("This vehicle is already booked for the selected time")
+
+        booking = Booking(
+            user=user,
+            vehicle=vehicle,
+            start_time=start,
+            end_time=end,
+            status="pending"
+        )
+        booking.save()
+
+        if idempotency_key:
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        user=user, key=idempotency_key, booking=booking
+                    )
+            except IntegrityError:
+                # the same key raced in through a booking on another vehicle
+                raise BookingError("This request was already submitted")
+
+    return booking
+
+
+def _replayed_booking(user, key):
+    entry = IdempotencyKey.objects.filter(
+        user=user, key=key
+    ).select_related("booking").first()
+    return entry.booking if entry else None
+
+
+def bulk_transition(queryset, target, sources=None, now=None, batch_size=TRANSITION_BATCH_SIZE):
+    # Moves the bookings in queryset that may go to `target` (or only those
+    # in `sources`) there, one UPDATE per batch, keeping the vehicle columns,
+    # the analytics rollup, the occupancy bitmaps and the caches in step.
+    # Returns how many moved.
+    if sources is None:
+        sources = [s for s, targets in Booking.TRANSITIONS.items() if target in targets]
+    moved = 0
+    vehicles = set()
+    for source in sources:
+        while True:
+            rows = list(
+                queryset.filter(status=source)
+                .order_by("pk")
+                .values_list("pk", "vehicle_id", "start_time", "end_time")[:batch_size]
+            )
+            if not rows:
+                break
+            batch_vehicles = {row[1] for row in rows}
+            with transaction.atomic():
+                # status=source again, in case a booking changed since the read
+                moved += Booking.objects.filter(
+                    pk__in=[row[0] for row in rows], status=source
+                ).update(status=target, updated_at=timezone.now())
+                refresh_vehicle_status(batch_vehicles, now)
+                if affects_rollup(source, target):
+                    refresh_bookings([row[1:] for row in rows])
+                if affects_occupancy(source, target):
+                    refresh_occupancy([row[1:] for row in rows])
+            vehicles |= batch_vehicles
+            if len(rows) < batch_size:
+                break
+
+    # update() sends no signals; under an outer atomic block the bumps
+    # wait for it to commit
+    for vehicle_id in vehicles:
+        bump_version(vehicle_scope(vehicle_id))
+    if vehicles:
+        bump_version(CATALOGUE)
+    return moved
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Availability also changes when a booked time range starts or ends, which
+# fires no signal, so rendered fragments only live this long.
+FRAGMENT_TIMEOUT = 60
+
+CATALOGUE = "catalogue"
+
+_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def _version_key(scope):
+    return f"version:{scope}"
+
+
+def get_version(scope):
+    # Seeded from the clock so a version evicted from the cache can never
+    # come back as a value that old fragments were stored under.
+    return cache.get_or_set(_version_key(scope), time.time_ns, None)
+
+
+async def aget_version(scope):
+    return await cache.aget_or_set(_version_key(scope), time.time_ns, None)
+
+
+def _bump(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns(), None)
+
+
+def bump_version(scope):
+    # Once the caller's transaction commits (right away outside one):
+    # bumped earlier, a request could cache the old rows under the new
+    # version before the write becomes visible to it.
+    transaction.on_commit(lambda: _bump(scope))
+
+
+def vehicle_scope(vehicle_id):
+    return f"vehicle:{vehicle_id}"
+
+
+def vehicle_changed(vehicle_id):
+    bump_version(vehicle_scope(vehicle_id))
+    bump_version(CATALOGUE)
+
+
+def _fragment_key(name, scope, version, params):
+    key = f"fragment:{name}:{scope}:{version}"
+    if params:
+        digest = hashlib.md5(repr(sorted(params.lists())).encode()).hexdigest()
+        key = f"{key}:{digest}"
+    return key
+
+
+def fragment_key(name, scope, params=None):
+    return _fragment_key(name, scope, get_version(scope), params)
+
+
+def _count(name, hit):
+    with _lock:
+        if hit:
+            _hits[name] += 1
+        else:
+            _misses[name] += 1
+
+
+def cached_fragment(name, scope, build, params=None, timeout=FRAGMENT_TIMEOUT):
+    # name groups the hit/miss counters; scope is the version that
+    # invalidates the fragment
+    key = fragment_key(name, scope, params)
+    html = cache.get(key)
+    _count(name, html is not None)
+    if html is None:
+        html = build()
+        cache.set(key, html, timeout)
+    return html
+
+
+async def acached_fragment(name, scope, build, params=None, timeout=FRAGMENT_TIMEOUT):
+    # cached_fragment for async views; build is a coroutine function
+    key = _fragment_key(name, scope, await aget_version(scope), params)
+    html = await cache.aget(key)
+    _count(name, html is not None)
+    if html is None:
+        html = await build()
+        await cache.aset(key, html, timeout)
+    return html
+
+
+def cache_stats():
+    with _lock:
+        names = set(_hits) | set(_misses)
+        return {
+            name: {"hits": _hits[name], "misses": _misses[name]}
+            for name in sorted(names)
+        }
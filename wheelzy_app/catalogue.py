@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import with_availability, with_current_availability
+from .geo import parse_near, within_radius
+from .models import Vehicle
+from .search import search_vehicles
+
+PAGE_SIZE = 24
+
+# columns the vehicle cards and the API actually render
+LIST_FIELDS = (
+    "id",
+    "vehicle_name",
+    "vehicle_type",
+    "number_plate",
+    "price_per_hour",
+    "seats",
+    "image",
+    "current_status",
+    "next_free_at",
+    "latitude",
+    "longitude",
+)
+
+
+def parse_datetime_input(value):
+    # datetime-local inputs come without a timezone
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def requested_window(params):
+    start = parse_datetime_input(params.get("start"))
+    end = parse_datetime_input(params.get("end"))
+    if start is None:
+        start = timezone.now()
+    if end is None or end < start:
+        end = start
+    return start, end
+
+
+def vehicle_catalogue(params):
+    # shared by the vehicle list page and /api/vehicles/
+    vehicles = Vehicle.objects.only(*LIST_FIELDS)
+
+    search_query = params.get("q")
+    vehicle_type = params.get("type")
+    seats = params.get("seats")
+    available = params.get("available")
+
+    if search_query:
+        vehicles = search_vehicles(vehicles, search_query)
+    if vehicle_type:
+        vehicles = vehicles.filter(vehicle_type=vehicle_type)
+    if seats and seats.isdigit():
+        vehicles = vehicles.filter(seats=seats)
+    near = parse_near(params)
+    if near:
+        vehicles = within_radius(vehicles, *near)
+    if params.get("start") or params.get("end"):
+        start, end = requested_window(params)
+        vehicles = with_availability(vehicles, start, end)
+        if available == "1":
+            vehicles = vehicles.filter(is_available=True)
+    else:
+        # "right now" is a column on the vehicle, no booking scan needed
+        vehicles = with_current_availability(vehicles)
+        if available == "1":
+            vehicles = vehicles.filter(current_status="available")
+    return vehicles
+
+
+def catalogue_order(params):
+    # nearest first for a radius search, search results in relevance
+    # order, everything else by id
+    if parse_near(params):
+        return "distance"
+    return "search_rank" if params.get("q") else "id"
+
+
+def _seek_distance(queryset, after):
+    # distances tie (vehicles sharing a depot), so the cursor is
+    # "distance:id" and the id breaks ties
+    queryset = queryset.order_by("distance", "id")
+    distance, _, last_id = str(after or "").partition(":")
+    try:
+        distance = float(distance)
+    except ValueError:
+        return queryset
+    if not last_id.isdigit():
+        return queryset
+    return queryset.filter(Q(distance__gt=distance) | Q(distance=distance, id__gt=int(last_id)))
+
+
+def _seek(queryset, after, key):
+    if key == "distance":
+        return _seek_distance(queryset, after)
+    queryset = queryset.order_by(key)
+    if after and str(after).isdigit():
+        queryset = queryset.filter(**{f"{key}__gt": int(after)})
+    return queryset
+
+
+def _split_page(rows, size, key):
+    if len(rows) <= size:
+        return rows, None
+    last = rows[size - 1]
+    if key == "distance":
+        return rows[:size], f"{last.distance!r}:{last.id}"
+    return rows[:size], getattr(last, key)
+
+
+def keyset_page(queryset, after=None, size=PAGE_SIZE, key="id"):
+    # seek on a unique key instead of OFFSET so every page costs the same
+    rows = list(_seek(queryset, after, key)[:size + 1])
+    return _split_page(rows, size, key)
+
+
+async def akeyset_page(queryset, after=None, size=PAGE_SIZE, key="id"):
+    rows = [row async for row in _seek(queryset, after, key)[:size + 1]]
+    return _split_page(rows, size, key)
@@ -0,0 +1,84 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .caching import FRAGMENT_TIMEOUT
+from .models import Vehicle
+
+# Validators come from the cache version counters (ETag) and updated_at
+# columns (Last-Modified, looked up once per version), so a client holding
+# the current page gets a 304 before any rendering or catalogue query runs. Availability also moves as
+# booked ranges start and end, which nothing records, so both change at
+# least every FRAGMENT_TIMEOUT seconds: the staleness the fragment cache
+# already allows.
+
+
+def validators(parts, changed_at=None, now=None):
+    # (ETag, Last-Modified as a timestamp) for a response built from
+    # `parts` (versions, query string, user...) and last changed at
+    # `changed_at`
+    now = time.time() if now is None else now
+    window = int(now // FRAGMENT_TIMEOUT)
+    digest = hashlib.md5(repr((window, *parts)).encode()).hexdigest()
+    last_modified = window * FRAGMENT_TIMEOUT
+    if changed_at is not None:
+        last_modified = max(last_modified, int(changed_at.timestamp()))
+    return quote_etag(digest), last_modified
+
+
+def not_modified(request, etag, last_modified, private=True):
+    # a 304 carrying the validators, or None when the page must be built
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified, private)
+    return response
+
+
+def set_validators(response, etag, last_modified, private=True):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # cache, but ask again every time; the answer is usually a 304
+    patch_cache_control(response, no_cache=True)
+    if private:
+        patch_cache_control(response, private=True)
+    return response
+
+
+def _changed_at_key(scope, version):
+    return f"changed_at:{scope}:{version}"
+
+
+def changed_at(scope, version, fetch):
+    # the updated_at behind one version of a scope, read from the database
+    # once per version so repeat requests stay off it
+    key = _changed_at_key(scope, version)
+    value = cache.get(key)
+    if value is None:
+        value = fetch()
+        if value is not None:
+            cache.set(key, value, FRAGMENT_TIMEOUT)
+    return value
+
+
+async def achanged_at(scope, version, fetch):
+    # changed_at for async views; fetch is a coroutine function
+    key = _changed_at_key(scope, version)
+    value = await cache.aget(key)
+    if value is None:
+        value = await fetch()
+        if value is not None:
+            await cache.aset(key, value, FRAGMENT_TIMEOUT)
+    return value
+
+
+def fleet_changed_at():
+    # index-only MAX over every vehicle
+    return Vehicle.objects.aggregate(last=Max("updated_at"))["last"]
+
+
+async def afleet_changed_at():
+    return (await Vehicle.objects.aaggregate(last=Max("updated_at")))["last"]
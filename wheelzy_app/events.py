@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# events a subscriber may fall behind by before it is told to reload
+QUEUE_SIZE = 100
+# recent events kept for clients reconnecting with Last-Event-ID
+REPLAY_SIZE = 500
+
+AVAILABILITY = "availability"
+# sent instead of events a subscriber missed
+RESET = "reset"
+
+
+class Subscription:
+    def __init__(self, broker, loop, topics):
+        self.broker = broker
+        self.loop = loop
+        self.topics = topics
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.lagging = False
+
+    def deliver(self, event):
+        # runs on the subscriber's event loop
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # drop what is queued; the client reloads instead
+            self.lagging = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((None, RESET, {}))
+
+    async def get(self):
+        event = await self.queue.get()
+        if event[1] == RESET:
+            self.lagging = False
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    # In-process pub/sub. publish() may be called from any thread (sync
+    # views run in worker threads); each subscriber gets the event on its
+    # own event loop. Subscribers only hear publishers in the same process,
+    # so deployments with several ASGI workers set WHEELZY_EVENT_BROKER to
+    # a class with the same interface backed by a shared broker.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=REPLAY_SIZE)
+        self._last_id = 0
+
+    def publish(self, topic, data):
+        with self._lock:
+            self._last_id += 1
+            event = (self._last_id, topic, data)
+            self._recent.append(event)
+            subscribers = [s for s in self._subscribers if topic in s.topics]
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # its loop has closed; the stream is gone
+                self.unsubscribe(subscriber)
+        return event[0]
+
+    def subscribe(self, topics, last_id=None):
+        # must be called from the event loop that will read the events;
+        # with last_id, events published since then are queued first
+        subscription = Subscription(self, asyncio.get_running_loop(), set(topics))
+        with self._lock:
+            self._subscribers.add(subscription)
+            if last_id is not None and last_id != self._last_id:
+                oldest = self._recent[0][0] if self._recent else self._last_id + 1
+                if last_id > self._last_id or oldest > last_id + 1:
+                    # from before a restart, or older than anything kept
+                    missed = [(None, RESET, {})]
+                else:
+                    missed = [e for e in self._recent if e[0] > last_id and e[1] in topics]
+                for event in missed:
+                    subscription.deliver(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, "WHEELZY_EVENT_BROKER", "wheelzy_app.events.LocalBroker")
+            _broker = import_string(path)()
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def format_event(event):
+    # one text/event-stream message
+    event_id, topic, data = event
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"event: {topic}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def availability_delta(vehicle_id, status, next_free_at):
+    return {
+        "vehicle_id": vehicle_id,
+        "status": status,
+        "next_free_at": next_free_at.isoformat() if next_free_at else None,
+    }
+
+
+def publish_availability(deltas):
+    # once the transaction commits, so clients never see a rolled back
+    # booking
+    deltas = list(deltas)
+    if not deltas:
+        return
+
+    def send():
+        broker = get_broker()
+        for delta in deltas:
+            broker.publish(AVAILABILITY, delta)
+
+    transaction.on_commit(send)
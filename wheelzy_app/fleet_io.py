@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+from heapq import merge
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from .caching import CATALOGUE, bump_version
+from .geo import parse_point, point_geohash
+from .models import ArchivedBooking, Booking, Vehicle, default_seats, normalize_plate
+
+IMPORT_BATCH_SIZE = 1000
+# errors beyond this are counted but not listed
+MAX_REPORTED_ERRORS = 100
+
+VEHICLE_COLUMNS = [
+    "vehicle_name", "vehicle_type", "number_plate", "price_per_hour", "seats",
+    "latitude", "longitude",
+]
+BOOKING_COLUMNS = [
+    "id", "vehicle", "number_plate", "customer", "start_time", "end_time",
+    "total_price", "status", "ordered_at",
+]
+VEHICLE_TYPES = {value for value, _ in Vehicle.VEHICLE_TYPES}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Line {line}: {message}")
+
+
+def read_rows(stream, fmt):
+    # yields (line number, row dict) without loading the whole file
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "jsonl":
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                yield line, None
+                continue
+            yield line, row if isinstance(row, dict) else None
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def clean_vehicle_row(row):
+    # returns (fields, error)
+    if row is None:
+        return None, "not a valid record"
+    name = str(row.get("vehicle_name") or "").strip()
+    vehicle_type = str(row.get("vehicle_type") or "").strip().lower()
+    plate = str(row.get("number_plate") or "").strip()
+    if not name or not plate:
+        return None, "vehicle_name and number_plate are required"
+    if vehicle_type not in VEHICLE_TYPES:
+        return None, f"vehicle_type must be one of {', '.join(sorted(VEHICLE_TYPES))}"
+    try:
+        price = int(row.get("price_per_hour"))
+        seats = int(row.get("seats") or 0)
+    except (TypeError, ValueError):
+        return None, "price_per_hour and seats must be whole numbers"
+    if price < 0 or seats < 0:
+        return None, "price_per_hour and seats cannot be negative"
+    try:
+        # optional pickup point
+        latitude, longitude = parse_point(row.get("latitude"), row.get("longitude"))
+    except ValueError:
+        return None, "latitude and longitude must both be given as a valid point"
+    return {
+        "vehicle_name": name[:255],
+        "vehicle_type": vehicle_type,
+        "number_plate": plate[:50],
+        "price_per_hour": price,
+        "seats": seats or default_seats(vehicle_type),
+        "latitude": latitude,
+        "longitude": longitude,
+    }, None
+
+
+def import_vehicles(owner, stream, fmt="csv", batch_size=IMPORT_BATCH_SIZE):
+    result = ImportResult()
+    seen_plates = set()
+    batch = []
+
+    for line, row in read_rows(stream, fmt):
+        fields, error = clean_vehicle_row(row)
+        if error:
+            result.error(line, error)
+            continue
+        if fields["number_plate"] in seen_plates:
+            result.error(line, f"duplicate number plate {fields['number_plate']}")
+            continue
+        seen_plates.add(fields["number_plate"])
+        batch.append((line, fields))
+        if len(batch) >= batch_size:
+            _write_batch(owner, batch, result)
+            batch = []
+    if batch:
+        _write_batch(owner, batch, result)
+
+    if result.created:
+        # bulk_create sends no post_save, so invalidate cached pages here
+        bump_version(CATALOGUE)
+    return result
+
+
+def _without_taken(batch, result):
+    # reports and drops the rows whose plate is already in the table; read
+    # on the primary, where the INSERT will go
+    plates = [fields["number_plate"] for _, fields in batch]
+    taken = set(
+        Vehicle.objects.using(DEFAULT_DB_ALIAS).filter(number_plate__in=plates)
+        .values_list("number_plate", flat=True)
+    )
+    for line, fields in batch:
+        if fields["number_plate"] in taken:
+            result.error(line, f"number plate {fields['number_plate']} already exists")
+    return [(line, fields) for line, fields in batch if fields["number_plate"] not in taken]
+
+
+def _write_batch(owner, batch, result):
+    # A plate another writer inserts between the check and the INSERT
+    # fails the whole batch; its rows are then reported like any other
+    # duplicate and the rest retried.
+    while batch:
+        try:
+            with transaction.atomic():
+                batch = _without_taken(batch, result)
+                Vehicle.objects.bulk_create([
+                    Vehicle(
+                        owner=owner,
+                        plate_key=normalize_plate(fields["number_plate"]),
+                        geohash=point_geohash(fields["latitude"], fields["longitude"]),
+                        **fields
+                    )
+                    for _, fields in batch
+                ])
+        except IntegrityError:
+            remaining = _without_taken(batch, result)
+            if len(remaining) == len(batch):
+                # not a plate clash; skip the batch rather than loop
+                for line, _ in batch:
+                    result.error(line, "could not be saved")
+                return
+            batch = remaining
+            continue
+        result.created += len(batch)
+        return
+
+
+class Echo:
+    # csv.writer target that hands each row straight back
+    def write(self, value):
+        return value
+
+
+def _stream(rows, columns, fmt):
+    if fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), default=str) + "\n"
+        return
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_vehicles(owner, fmt="csv"):
+    rows = Vehicle.objects.filter(owner=owner).order_by("id").values_list(
+        *VEHICLE_COLUMNS
+    ).iterator(chunk_size=2000)
+    return _stream(rows, VEHICLE_COLUMNS, fmt)
+
+
+def export_bookings(owner, fmt="csv"):
+    # live and archived bookings, merged in id order
+    tables = [
+        model.objects.filter(vehicle__owner=owner).order_by("id").values_list(
+            "id", "vehicle__vehicle_name", "vehicle__number_plate", "user__username",
+            "start_time", "end_time", "total_price", "status", "ordered_at",
+        ).iterator(chunk_size=2000)
+        for model in (Booking, ArchivedBooking)
+    ]
+    return _stream(merge(*tables, key=lambda row: row[0]), BOOKING_COLUMNS, fmt)
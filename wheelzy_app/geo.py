@@ -0,0 +1,179 @@
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+# precision of the stored geohash: cells of about 5 x 5 metres
+GEOHASH_PRECISION = 9
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 200
+# a search box is covered by at most this many geohash prefixes
+MAX_CELLS = 16
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def valid_point(lat, lon):
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # bits alternate between longitude and latitude, longitude first
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            bit = lon >= mid
+            lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            bit = lat >= mid
+            lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+        value = value * 2 + bit
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def parse_point(lat, lon):
+    # (lat, lon) from two form or import values; both blank means no
+    # location. Raises ValueError for anything else that is not a point.
+    lat, lon = str(lat or "").strip(), str(lon or "").strip()
+    if not lat and not lon:
+        return None, None
+    point = float(lat), float(lon)
+    if not valid_point(*point):
+        raise ValueError("latitude must be within -90..90 and longitude within -180..180")
+    return point
+
+
+def point_geohash(lat, lon):
+    if lat is None or lon is None:
+        return ""
+    return encode(float(lat), float(lon))
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) one cell spans
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** (5 * precision - lat_bits)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # haversine, the same formula distance_expression runs in SQL
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + (
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, radius_km):
+    # (min_lat, max_lat, min_lon, max_lon); the longitudes may run past
+    # +-180 when the circle crosses the antimeridian
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 89.9:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest))))
+    if dlon >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+def covering_cells(box):
+    # the longest geohash prefixes (at most MAX_CELLS of them) whose cells
+    # together cover the box; [] when only the whole world would do
+    min_lat, max_lat, min_lon, max_lon = box
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        first_row = math.floor((min_lat + 90) / height)
+        last_row = min(math.floor((max_lat + 90) / height), round(180 / height) - 1)
+        first_col = math.floor((min_lon + 180) / width)
+        last_col = math.floor((max_lon + 180) / width)
+        if (last_row - first_row + 1) * (last_col - first_col + 1) > MAX_CELLS:
+            continue
+        cells = set()
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                lat = (row + 0.5) * height - 90
+                lon = ((col + 0.5) * width) % 360 - 180
+                cells.add(encode(lat, lon, precision))
+        return sorted(cells)
+    return []
+
+
+def _next_prefix(prefix):
+    # the smallest string after every string starting with prefix
+    while prefix and prefix[-1] == _BASE32[-1]:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + _BASE32[_BASE32.index(prefix[-1]) + 1]
+
+
+def prefix_q(cells, field="geohash"):
+    # ranges rather than LIKE 'abc%', so any B-tree index on the column
+    # serves them whatever the database collation or LIKE settings
+    query = Q()
+    for cell in cells:
+        upper = _next_prefix(cell)
+        bounds = {f"{field}__gte": cell}
+        if upper is not None:
+            bounds[f"{field}__lt"] = upper
+        query |= Q(**bounds)
+    return query
+
+
+def distance_expression(lat, lon):
+    # great-circle distance in km from (lat, lon) to the row's point;
+    # SQLite gets these maths functions from Django, Postgres has them built in
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    dlat = Radians(F("latitude")) - Value(lat1)
+    dlon = Radians(F("longitude")) - Value(lon1)
+    a = Power(Sin(dlat / 2), 2) + Value(math.cos(lat1)) * Cos(Radians(F("latitude"))) * Power(
+        Sin(dlon / 2), 2
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a, output_field=FloatField()))
+
+
+def parse_near(params):
+    # (lat, lon, radius_km) from ?near=lat,lon&radius=km, or None when
+    # missing or malformed
+    near = params.get("near")
+    if not near:
+        return None
+    try:
+        lat, lon = (float(part) for part in near.split(","))
+        radius = float(params.get("radius") or DEFAULT_RADIUS_KM)
+    except ValueError:
+        return None
+    if not valid_point(lat, lon) or not math.isfinite(radius) or radius <= 0:
+        return None
+    return lat, lon, min(radius, MAX_RADIUS_KM)
+
+
+def within_radius(queryset, lat, lon, radius_km):
+    # Geohash prefixes narrow the scan to a few index ranges, the box
+    # trims their corners, and only what is left has its exact distance
+    # worked out. Adds a `distance` (km) annotation.
+    box = bounding_box(lat, lon, radius_km)
+    min_lat, max_lat, min_lon, max_lon = box
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if -180 <= min_lon and max_lon <= 180:
+        queryset = queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+    cells = covering_cells(box)
+    if cells:
+        queryset = queryset.filter(prefix_q(cells))
+    else:
+        queryset = queryset.exclude(geohash="")
+    return queryset.annotate(distance=distance_expression(lat, lon)).filter(
+        distance__lte=radius_km
+    )
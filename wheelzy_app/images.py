@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+# widths of the WebP copies generated next to every upload
+VARIANT_WIDTHS = (320, 640, 1024)
+VARIANT_QUALITY = 80
+
+
+@deconstructible
+class HashedStorage(FileSystemStorage):
+    # Names uploads after their content, so uploading the same picture twice
+    # reuses the stored file instead of writing maruthizen_fzFmhJt.avif.
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest.hexdigest()[:20] + ext)
+        if self.exists(name):
+            return name.replace("\\", "/")
+        return super().save(name, content, max_length)
+
+    def save_exact(self, name, content):
+        # derived files (variants) keep the name they are given
+        return super().save(name, content)
+
+
+def hashed_storage():
+    return HashedStorage()
+
+
+def variant_name(name, width):
+    return f"{os.path.splitext(name)[0]}_{width}w.webp"
+
+
+def variants_marker(name):
+    # written last, once every variant of `name` is in place
+    return f"{os.path.splitext(name)[0]}_variants.json"
+
+
+def finished_variants(storage, name):
+    # [(width, variant name)] once generation has finished, else None
+    marker = variants_marker(name)
+    if not storage.exists(marker):
+        return None
+    with storage.open(marker) as content:
+        widths = json.loads(content.read())
+    return [(width, variant_name(name, width)) for width in widths]
+
+
+def generate_variants(storage, name):
+    from PIL import Image
+
+    finished = finished_variants(storage, name)
+    if finished is not None:
+        # nothing to do, and no need to decode the original
+        return [target for _, target in finished]
+
+    try:
+        with storage.open(name) as source:
+            image = Image.open(source)
+            image.load()
+    except Exception:
+        logger.warning("Could not read image %s", name, exc_info=True)
+        return []
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    save = getattr(storage, "save_exact", storage.save)
+    widths = []
+    for width in VARIANT_WIDTHS:
+        target = variant_name(name, width)
+        if not storage.exists(target):
+            copy = image.copy()
+            copy.thumbnail((width, width * 10))
+            buffer = BytesIO()
+            copy.save(buffer, "WEBP", quality=VARIANT_QUALITY, method=4)
+            save(target, ContentFile(buffer.getvalue()))
+        widths.append(width)
+        if width >= image.width:
+            # the original is covered; never upscale past it
+            break
+    if not storage.exists(variants_marker(name)):
+        save(variants_marker(name), ContentFile(json.dumps(widths)))
+    return [variant_name(name, width) for width in widths]
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.WHEELZY_IMAGE_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def schedule_variants(field_file):
+    # called once the upload is committed; resizing happens off the
+    # request thread unless workers are disabled
+    if not field_file:
+        return
+    storage, name = field_file.storage, field_file.name
+    if settings.WHEELZY_IMAGE_WORKERS:
+        _get_executor().submit(generate_variants, storage, name)
+    else:
+        generate_variants(storage, name)
+
+
+_known_variants = {}
+
+
+def available_variants(field_file):
+    # Variants are immutable once written (content-hashed names), so the
+    # finished set is remembered for the life of the process. While the
+    # background job is still writing them, each render looks again.
+    name = field_file.name
+    found = _known_variants.get(name)
+    if found is None:
+        storage = field_file.storage
+        found = finished_variants(storage, name)
+        if found is not None:
+            _known_variants[name] = found
+        else:
+            found = [
+                (width, variant_name(name, width))
+                for width in VARIANT_WIDTHS
+                if storage.exists(variant_name(name, width))
+            ]
+    return [(width, field_file.storage.url(v)) for width, v in found]
@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wheelzy_app.archive import ARCHIVE_BATCH_SIZE, archive_bookings
+
+
+class Command(BaseCommand):
+    help = "Move finished bookings (and their damage reports) into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="only bookings that ended more than this many days ago "
+                                 f"(default: WHEELZY_ARCHIVE_AFTER_DAYS, {settings.WHEELZY_ARCHIVE_AFTER_DAYS})")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE,
+                            help="bookings moved per transaction")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moved = archive_bookings(options["days"], options["batch_size"])
+        self.stdout.write(f"Archived {moved} bookings in {time.perf_counter() - started:.1f}s")
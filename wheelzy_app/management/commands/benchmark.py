@@ -0,0 +1,86 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from wheelzy_app.benchmarks import (
+    DEFAULT_TOLERANCE, compare, default_endpoints, load_baseline, run_asgi, run_client,
+    run_http, save_baseline,
+)
+from wheelzy_app.seeding import SEED_PREFIX
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main pages on a seeded fleet (see seed_fleet), in-process or against "
+        "a running server, and compare with a stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="base URL of a running server; in-process when omitted")
+        parser.add_argument(
+            "--asgi", action="store_true",
+            help="in-process through the ASGI handler with --concurrency requests in flight",
+        )
+        parser.add_argument("--requests", type=int, default=100, help="per endpoint")
+        parser.add_argument("--concurrency", type=int, default=8, help="with --url or --asgi")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--baseline", default=os.path.join(settings.BASE_DIR, "benchmarks", "baseline.json")
+        )
+        parser.add_argument("--save-baseline", action="store_true")
+        parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **options):
+        customer = User.objects.filter(
+            username__startswith=f"{SEED_PREFIX}customer_", bookings__isnull=False
+        ).order_by("id").first()
+        owner = User.objects.filter(
+            username__startswith=f"{SEED_PREFIX}owner_", vehicles__isnull=False
+        ).order_by("id").first()
+        if customer is None or owner is None:
+            raise CommandError("No seeded customers/owners found, run seed_fleet first")
+        vehicle = owner.vehicles.order_by("id").first()
+        endpoints = default_endpoints(customer, owner, vehicle)
+
+        if options["url"]:
+            results = run_http(
+                endpoints, options["url"], options["requests"],
+                options["concurrency"], options["warmup"],
+            )
+        elif options["asgi"]:
+            results = run_asgi(
+                endpoints, options["requests"], options["concurrency"], options["warmup"]
+            )
+        else:
+            results = run_client(endpoints, options["requests"], options["warmup"])
+
+        self.stdout.write(
+            f"{'endpoint':<24}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<24}{row['throughput']:>9}{row['p50']:>10}{row['p95']:>10}"
+                f"{row['p99']:>10}{row['errors']:>8}"
+            )
+
+        path = options["baseline"]
+        if options["save_baseline"]:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            save_baseline(path, results)
+            self.stdout.write(f"Saved baseline to {path}")
+            return
+
+        baseline = load_baseline(path)
+        if baseline is None:
+            self.stdout.write(f"No baseline at {path}; run with --save-baseline to record one")
+            return
+        regressions = compare(results, baseline, options["tolerance"])
+        for name, before, now in regressions:
+            self.stderr.write(f"{name}: p95 {before} ms -> {now} ms")
+        if not regressions:
+            self.stdout.write("No regressions against baseline")
+        elif options["fail_on_regression"]:
+            raise CommandError(f"{len(regressions)} endpoint(s) regressed")
@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wheelzy_app.models import Vehicle, normalize_plate
+from wheelzy_app.search import search_ids
+
+NAMES = [
+    "Maruti Swift", "Maruti Zen", "Hyundai i20", "Honda City", "Tata Nexon",
+    "Mahindra Thar", "Toyota Innova", "Bajaj Platina", "TVS Ntorq", "Royal Enfield Classic",
+]
+STATES = ["KL", "TN", "KA", "MH", "DL"]
+
+
+class Command(BaseCommand):
+    help = "Time vehicle search against a synthetic fleet (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vehicles", type=int, default=500000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            plates = self.generate(rng, options["vehicles"])
+            queries = [
+                rng.choice(["swift", "maruti", "royal enf", "nexon", "city"])
+                if i % 2 else self.plate_query(rng.choice(plates))
+                for i in range(options["queries"])
+            ]
+            search_ids(queries[0])
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                search_ids(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            transaction.set_rollback(True)
+
+        timings.sort()
+        pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+        self.stdout.write(
+            f"{options['vehicles']} vehicles, {len(timings)} queries: "
+            f"mean {statistics.mean(timings):.2f} ms, p50 {pct(0.5):.2f} ms, "
+            f"p95 {pct(0.95):.2f} ms, p99 {pct(0.99):.2f} ms"
+        )
+
+    def generate(self, rng, count):
+        plates = []
+        batch = []
+        for i in range(count):
+            plate = f"{rng.choice(STATES)}-{rng.randint(1, 99):02d}-BM-{i:06d}"
+            plates.append(plate)
+            batch.append(Vehicle(
+                vehicle_name=rng.choice(NAMES),
+                vehicle_type="car",
+                number_plate=plate,
+                plate_key=normalize_plate(plate),
+                price_per_hour=rng.randint(50, 2000),
+                seats=4,
+            ))
+            if len(batch) == 5000:
+                Vehicle.objects.bulk_create(batch)
+                batch = []
+        Vehicle.objects.bulk_create(batch)
+        return plates
+
+    def plate_query(self, plate):
+        # typed the way people do: lower case, no dashes
+        return plate.replace("-", " ").lower()
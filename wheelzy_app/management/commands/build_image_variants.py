@@ -0,0 +1,31 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from wheelzy_app.images import generate_variants
+from wheelzy_app.models import DamageReport, Vehicle
+
+
+class Command(BaseCommand):
+    help = "Move existing uploads to content-hashed names and build their WebP variants"
+
+    def handle(self, *args, **options):
+        renamed = variants = 0
+        for model, field in ((Vehicle, "image"), (DamageReport, "images")):
+            rows = model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+            for obj in rows.only("id", field).iterator():
+                field_file = getattr(obj, field)
+                storage = field_file.storage
+                if not storage.exists(field_file.name):
+                    self.stderr.write(f"Missing file for {model.__name__} #{obj.pk}: {field_file.name}")
+                    continue
+                with storage.open(field_file.name) as content:
+                    directory = os.path.dirname(field_file.name)
+                    name = storage.save(os.path.join(directory, os.path.basename(field_file.name)), content)
+                if name != field_file.name:
+                    # identical pictures collapse onto one hashed file; the
+                    # old copies are left on disk for manual cleanup
+                    model.objects.filter(pk=obj.pk).update(**{field: name})
+                    renamed += 1
+                variants += len(generate_variants(storage, name))
+        self.stdout.write(f"Renamed {renamed} uploads, {variants} variants in place")
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from wheelzy_app.fleet_io import IMPORT_BATCH_SIZE, import_vehicles
+
+
+class Command(BaseCommand):
+    help = "Import an owner's vehicles from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--owner", required=True, help="username of the owner")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']}")
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+
+        started = time.perf_counter()
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            result = import_vehicles(owner, stream, fmt, options["batch_size"])
+        elapsed = time.perf_counter() - started
+
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            f"Created {result.created} vehicles, skipped {result.skipped} rows in {elapsed:.1f}s"
+        )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wheelzy_app.analytics import ROLLUP_BATCH_SIZE, rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily per-vehicle analytics rollup from bookings and damage reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vehicle", type=int, action="append", dest="vehicles",
+                            help="only this vehicle (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE,
+                            help="vehicles rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_rollup(options["vehicles"], options["batch_size"])
+        self.stdout.write(f"Wrote {written} rollup rows in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheelzy_app.availability import availability_mismatches, refresh_vehicle_status
+from wheelzy_app.caching import CATALOGUE, bump_version
+from wheelzy_app.models import Vehicle
+from wheelzy_app.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        "Check or rebuild every vehicle's denormalized current_status / next_free_at; "
+        "a rebuild also rewrites the hourly occupancy bitmaps"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="only report vehicles whose columns disagree with their bookings",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["check"]:
+            mismatches = availability_mismatches()
+            for vehicle_id, stored, expected in mismatches[:50]:
+                self.stderr.write(f"Vehicle {vehicle_id}: stored {stored}, expected {expected}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} vehicle(s) out of date")
+            self.stdout.write(f"All vehicles consistent ({time.perf_counter() - started:.1f}s)")
+            return
+
+        ids = list(Vehicle.objects.values_list("id", flat=True))
+        changed = refresh_vehicle_status(ids)
+        if changed:
+            bump_version(CATALOGUE)
+        months = rebuild_occupancy()
+        self.stdout.write(
+            f"Checked {len(ids)} vehicles, fixed {changed}, wrote {months} occupancy months "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
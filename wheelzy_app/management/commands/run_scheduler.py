@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wheelzy_app.scheduler import SCHEDULER_BATCH_SIZE, SCHEDULER_INTERVAL, run_due_transitions
+
+
+class Command(BaseCommand):
+    help = "Expire stale pending bookings and start/flag overdue bookings on schedule"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=SCHEDULER_INTERVAL, help="seconds between runs")
+        parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+        parser.add_argument("--batch-size", type=int, default=SCHEDULER_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        while True:
+            now = timezone.now()
+            # each pass picks up from where the last one stopped
+            counts = run_due_transitions(now, options["batch_size"], since)
+            since = now
+            moved = {step: n for step, n in counts.items() if n}
+            if moved or options["once"]:
+                summary = ", ".join(f"{step}: {n}" for step, n in counts.items())
+                self.stdout.write(summary)
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wheelzy_app.seeding import SEED_PREFIX, clear_seeded, seed_fleet
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic owners, customers, vehicles and bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owners", type=int, default=10)
+        parser.add_argument("--customers", type=int, default=100)
+        parser.add_argument("--vehicles", type=int, default=1000)
+        parser.add_argument("--bookings", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--password", default="password")
+        parser.add_argument(
+            "--clear", action="store_true",
+            help=f"delete users named {SEED_PREFIX}* (and their vehicles and bookings) first",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            self.stdout.write(f"Deleted {clear_seeded()} seeded rows")
+
+        started = time.perf_counter()
+        counts = seed_fleet(
+            owners=options["owners"],
+            customers=options["customers"],
+            vehicles=options["vehicles"],
+            bookings=options["bookings"],
+            seed=options["seed"],
+            password=options["password"],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Created {counts['owners']} owners, {counts['customers']} customers, "
+            f"{counts['vehicles']} vehicles and {counts['bookings']} bookings in {elapsed:.1f}s"
+        )
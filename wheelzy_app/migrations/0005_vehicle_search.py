@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 10:07
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_plate_keys(apps, schema_editor):
+    Vehicle = apps.get_model("wheelzy_app", "Vehicle")
+    for vehicle in Vehicle.objects.only("id", "number_plate"):
+        vehicle.plate_key = re.sub(r"[^0-9a-z]", "", vehicle.number_plate.lower())
+        vehicle.save(update_fields=["plate_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='plate_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_plate_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 10:17
+
+import wheelzy_app.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0005_vehicle_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='damagereport',
+            name='images',
+            field=models.ImageField(blank=True, null=True, storage=wheelzy_app.images.hashed_storage, upload_to='damage/'),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=wheelzy_app.images.hashed_storage, upload_to='vehicles/'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 10:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0006_hashed_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_hours', models.PositiveIntegerField(default=0)),
+                ('price_per_hour', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_per_day', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rules', to='wheelzy_app.vehicle')),
+            ],
+            options={
+                'ordering': ['vehicle', 'min_hours'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 10:47
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+ACTIVE = ("pending", "confirmed", "in_use", "overdue")
+OUT = ("in_use", "overdue")
+
+
+def fill_current_status(apps, schema_editor):
+    # same rules as availability.vehicle_states, frozen for this migration
+    Vehicle = apps.get_model("wheelzy_app", "Vehicle")
+    Booking = apps.get_model("wheelzy_app", "Booking")
+    now = timezone.now()
+    rows = defaultdict(list)
+    for vehicle_id, status, start, end in Booking.objects.filter(
+        Q(end_time__gt=now) | Q(status__in=OUT), status__in=ACTIVE
+    ).order_by("start_time").values_list("vehicle_id", "status", "start_time", "end_time"):
+        rows[vehicle_id].append((status, start, end))
+
+    for vehicle_id, bookings in rows.items():
+        out = [end for status, _, end in bookings if status in OUT]
+        covering = [end for _, start, end in bookings if start <= now < end]
+        if not out and not covering:
+            continue
+        free_at = max(out + covering)
+        for _, start, end in bookings:
+            if start <= free_at < end:
+                free_at = end
+        Vehicle.objects.filter(pk=vehicle_id).update(
+            current_status="in_use" if out else "reserved", next_free_at=free_at
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0008_booking_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='current_status',
+            field=models.CharField(choices=[('available', 'Available'), ('reserved', 'Reserved'), ('in_use', 'In Use')], db_index=True, default='available', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='next_free_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_current_status, migrations.RunPython.noop),
+    ]
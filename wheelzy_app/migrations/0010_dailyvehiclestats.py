@@ -0,0 +1,79 @@
+# Generated by Django 6.0 on 2026-10-18 10:52
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+EARNING = ("confirmed", "in_use", "overdue", "returned")
+
+
+def fill_daily_stats(apps, schema_editor):
+    # same rules as analytics.rebuild_rollup, frozen for this migration
+    Vehicle = apps.get_model("wheelzy_app", "Vehicle")
+    Booking = apps.get_model("wheelzy_app", "Booking")
+    DamageReport = apps.get_model("wheelzy_app", "DamageReport")
+    DailyVehicleStats = apps.get_model("wheelzy_app", "DailyVehicleStats")
+
+    def last_day(end):
+        return timezone.localdate(end - timedelta(microseconds=1))
+
+    cells = defaultdict(lambda: [0, Decimal(0), 0, Decimal(0)])
+    for vehicle_id, start, end, price in Booking.objects.filter(
+        status__in=EARNING
+    ).values_list("vehicle_id", "start_time", "end_time", "total_price").iterator():
+        day = timezone.localdate(start)
+        cells[vehicle_id, day][0] += 1
+        cells[vehicle_id, day][1] += price
+        while day <= last_day(end):
+            lo = max(start, timezone.make_aware(datetime.combine(day, time.min)))
+            day += timedelta(days=1)
+            hi = min(end, timezone.make_aware(datetime.combine(day, time.min)))
+            cells[vehicle_id, day - timedelta(days=1)][2] += (hi - lo).total_seconds()
+    for vehicle_id, end, cost in DamageReport.objects.values_list(
+        "booking__vehicle_id", "booking__end_time", "damage_cost"
+    ).iterator():
+        cells[vehicle_id, last_day(end)][3] += cost
+
+    owners = dict(Vehicle.objects.values_list("pk", "owner_id"))
+    DailyVehicleStats.objects.bulk_create([
+        DailyVehicleStats(
+            vehicle_id=vehicle_id, owner_id=owners[vehicle_id], day=day, bookings=count,
+            revenue=revenue, booked_hours=(Decimal(seconds) / 3600).quantize(Decimal("0.01")),
+            damage_cost=damage,
+        )
+        for (vehicle_id, day), (count, revenue, seconds, damage) in cells.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0009_vehicle_current_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVehicleStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('booked_hours', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('damage_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='wheelzy_app.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'day'], name='stats_owner_day_idx'), models.Index(fields=['day'], name='stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'day'), name='unique_vehicle_day')],
+            },
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
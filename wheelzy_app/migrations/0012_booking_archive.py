@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 11:14
+
+import django.db.models.deletion
+import wheelzy_app.images
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0011_vehicle_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('security_deposit', models.PositiveIntegerField(default=2000)),
+                ('status', models.CharField(choices=[('pending', 'Pending Payment'), ('confirmed', 'Confirmed'), ('in_use', 'In Use'), ('overdue', 'Overdue'), ('returned', 'Returned'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], max_length=20)),
+                ('ordered_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='wheelzy_app.vehicle')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedDamageReport',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('damage_description', models.TextField(blank=True)),
+                ('damage_cost', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('images', models.ImageField(blank=True, null=True, storage=wheelzy_app.images.hashed_storage, upload_to='damage/')),
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='wheelzy_app.archivedbooking')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['user', 'id'], name='archive_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['vehicle', 'start_time'], name='archive_vehicle_start_idx'),
+        ),
+    ]
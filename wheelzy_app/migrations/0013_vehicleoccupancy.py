@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-18 11:19
+
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+ACTIVE = ("pending", "confirmed", "in_use", "overdue")
+
+
+def fill_occupancy(apps, schema_editor):
+    # same rules as occupancy.rebuild_occupancy, frozen for this migration
+    Booking = apps.get_model("wheelzy_app", "Booking")
+    VehicleOccupancy = apps.get_model("wheelzy_app", "VehicleOccupancy")
+
+    def month_start(month):
+        return timezone.make_aware(datetime.combine(month, time.min))
+
+    def next_month(month):
+        return (month + timedelta(days=32)).replace(day=1)
+
+    bitmaps = defaultdict(int)
+    for vehicle_id, start, end in Booking.objects.filter(status__in=ACTIVE).values_list(
+        "vehicle_id", "start_time", "end_time"
+    ).iterator():
+        month = timezone.localdate(start).replace(day=1)
+        while month <= timezone.localdate(end - timedelta(microseconds=1)):
+            lo, hi = month_start(month), month_start(next_month(month))
+            first = int((max(start, lo) - lo).total_seconds()) // 3600
+            last = math.ceil((min(end, hi) - lo).total_seconds() / 3600)
+            if last > first:
+                bitmaps[vehicle_id, month] |= ((1 << (last - first)) - 1) << first
+            month = next_month(month)
+
+    rows = []
+    for (vehicle_id, month), bits in bitmaps.items():
+        hours = int((month_start(next_month(month)) - month_start(month)).total_seconds()) // 3600
+        rows.append(VehicleOccupancy(
+            vehicle_id=vehicle_id, month=month, hours=bits.to_bytes((hours + 7) // 8, "little"),
+        ))
+    VehicleOccupancy.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheelzy_app', '0012_booking_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('hours', models.BinaryField()),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='wheelzy_app.vehicle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'vehicle'], name='occupancy_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'month'), name='unique_vehicle_month')],
+            },
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations
+
+
+def journal_mode(mode):
+    def set_mode(apps, schema_editor):
+        # WAL is stored in the database file, so it is switched once here
+        # rather than on every connection; lets reads continue while a
+        # booking is being written
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={mode}')
+    return set_mode
+
+
+class Migration(migrations.Migration):
+    # the journal mode cannot change inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wheelzy_app', '0014_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(journal_mode('WAL'), journal_mode('DELETE')),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+from django.db import migrations
+
+# same expression as POSTGRES_VECTOR in wheelzy_app/search.py; the planner
+# only uses the index for queries that repeat it exactly
+CREATE_INDEX = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS wheelzy_vehicle_search_gin ON wheelzy_app_vehicle
+    USING gin ((setweight(to_tsvector('english', vehicle_name), 'A')
+                || setweight(to_tsvector('english', number_plate), 'B')))
+"""
+DROP_INDEX = "DROP INDEX CONCURRENTLY IF EXISTS wheelzy_vehicle_search_gin"
+
+
+def run_on_postgres(sql):
+    def run(apps, schema_editor):
+        # SQLite searches through the FTS5 table (search.install_fts)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY keeps the vehicle table writable while the index builds,
+    # and cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wheelzy_app', '0015_sqlite_wal'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(CREATE_INDEX), run_on_postgres(DROP_INDEX)),
+    ]
@@ -1,5 +1,25 @@
-from django.db import models
+import re
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .geo import point_geohash
+from .images import hashed_storage
+
+
+def normalize_plate(value):
+    # "KL-01 ab 1234" and "kl01AB1234" are the same plate
+    return re.sub(r"[^0-9a-z]", "", (value or "").lower())
+
+
+def default_seats(vehicle_type):
+    if vehicle_type == "car":
+        return 4
+    if vehicle_type == "bike":
+        return 2
+    return None
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
@@ -26,32 +46,94 @@ class Vehicle(models.Model):
     vehicle_name = models.CharField(max_length=255)
     vehicle_type = models.CharField(max_length=25, choices=VEHICLE_TYPES)
     number_plate = models.CharField(max_length=50, unique=True)
+    plate_key = models.CharField(max_length=50, db_index=True, editable=False, blank=True)
     price_per_hour = models.PositiveIntegerField()
     seats = models.PositiveIntegerField(help_text="Number of seats", blank=True)
-    image = models.ImageField(upload_to="vehicles/", null=True, blank=True)
+    image = models.ImageField(upload_to="vehicles/", storage=hashed_storage, null=True, blank=True)
+
+    # pickup point; geohash is derived from it in save() and is what
+    # radius searches prefilter on (see geo.within_radius)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    # Availability right now, kept up to date from the booking side (see
+    # availability.refresh_vehicle_status) so listings filter on one column.
+    AVAILABILITY = (
+        ("available", "Available"),
+        ("reserved", "Reserved"),
+        ("in_use", "In Use"),
+    )
+    current_status = models.CharField(
+        max_length=20, choices=AVAILABILITY, default="available", db_index=True, editable=False
+    )
+    # when the current run of bookings ends; empty while available
+    next_free_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    DERIVED_FIELDS = ("current_status", "next_free_at")
+
+    # Last-Modified for vehicle pages; writes that skip save() (see
+    # refresh_vehicle_status) set it themselves. Indexed for the fleet-wide MAX.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def save(self, *args, **kwargs):
         # Auto assign seats
         if not self.seats:
-            if self.vehicle_type == "car":
-                self.seats = 4
-            elif self.vehicle_type == "bike":
-                self.seats = 2
+            self.seats = default_seats(self.vehicle_type)
+        self.plate_key = normalize_plate(self.number_plate)
+        self.geohash = point_geohash(self.latitude, self.longitude)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # an edit form must not write back a stale copy of the
+            # availability columns
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DERIVED_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.vehicle_name} - {self.number_plate}"
 
 
+class PriceRule(models.Model):
+    # Applies to bookings of at least min_hours. A rule may override the
+    # hourly rate, cap each full day at price_per_day, or both.
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name="price_rules")
+    min_hours = models.PositiveIntegerField(default=0)
+    price_per_hour = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_per_day = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ["vehicle", "min_hours"]
+
+    def __str__(self):
+        return f"{self.vehicle_id} from {self.min_hours}h"
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
 class Booking(models.Model):
     STATUS = (
         ("pending", "Pending Payment"),
         ("confirmed", "Confirmed"),
         ("in_use", "In Use"),
+        ("overdue", "Overdue"),
         ("returned", "Returned"),
         ("cancelled", "Cancelled"),
+        ("expired", "Expired"),
     )
 
+    # status -> statuses it may move to; returned, cancelled and expired
+    # are final
+    TRANSITIONS = {
+        "pending": {"confirmed", "cancelled", "expired"},
+        "confirmed": {"in_use", "cancelled"},
+        "in_use": {"returned", "overdue"},
+        "overdue": {"returned"},
+    }
+
     # 👤 Customer who booked
     user = models.ForeignKey(
         User,
@@ -67,24 +149,183 @@ class Booking(models.Model):
     security_deposit = models.PositiveIntegerField(default=2000)
     status = models.CharField(max_length=20, choices=STATUS, default="pending")
     ordered_at = models.DateTimeField(auto_now_add=True)
+    # status moves go through update(), which sets this too
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["vehicle", "status", "start_time", "end_time"],
+                name="booking_availability_idx",
+            ),
+            # the scheduler's "what is due now" scans
+            models.Index(fields=["status", "start_time"], name="booking_status_start_idx"),
+            models.Index(fields=["status", "end_time"], name="booking_status_end_idx"),
+        ]
+
+    def can_transition(self, status):
+        return status in self.TRANSITIONS.get(self.status, ())
+
+    def transition_to(self, status):
+        from .caching import vehicle_changed
+
+        if not self.can_transition(status):
+            raise InvalidTransition(
+                f"Booking #{self.pk} cannot go from {self.status} to {status}"
+            )
+        from .analytics import affects_rollup, refresh_bookings
+        from .availability import refresh_vehicle_status
+        from .occupancy import affects_occupancy, refresh_occupancy
+
+        with transaction.atomic():
+            # only moves the row if nobody else changed its status meanwhile
+            updated = Booking.objects.filter(pk=self.pk, status=self.status).update(
+                status=status, updated_at=timezone.now()
+            )
+            if not updated:
+                raise InvalidTransition(f"Booking #{self.pk} was changed by someone else")
+            refresh_vehicle_status([self.vehicle_id])
+            span = (self.vehicle_id, self.start_time, self.end_time)
+            if affects_rollup(self.status, status):
+                refresh_bookings([span])
+            if affects_occupancy(self.status, status):
+                refresh_occupancy([span])
+        self.status = status
+        vehicle_changed(self.vehicle_id)
 
     def calculate_price(self):
-        hours = (self.end_time - self.start_time).total_seconds() / 3600
-        return round(hours * self.vehicle.price_per_hour, 2)
+        from .pricing import quote
+
+        return quote(self.vehicle_id, self.start_time, self.end_time, fresh=True)
 
     def save(self, *args, **kwargs):
-        self.total_price = self.calculate_price()
+        # price is fixed when the booking is made; later status changes
+        # must not re-price it against newer rules
+        if self._state.adding:
+            self.total_price = self.calculate_price()
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Booking #{self.id} - {self.vehicle.vehicle_name}"
+        # only name the vehicle when it was already loaded (select_related),
+        # so listing bookings never costs a query per row
+        if Booking.vehicle.is_cached(self):
+            return f"Booking #{self.id} - {self.vehicle.vehicle_name}"
+        return f"Booking #{self.id} - vehicle #{self.vehicle_id}"
+
+
+class IdempotencyKey(models.Model):
+    # remembers which booking a submitted form produced, so retried POSTs
+    # return the original booking instead of creating a duplicate
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key"),
+        ]
+
+    def __str__(self):
+        return self.key
 
 
 class DamageReport(models.Model):
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE)
     damage_description = models.TextField(blank=True)
     damage_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    images = models.ImageField(upload_to="damage/", null=True, blank=True)
+    images = models.ImageField(upload_to="damage/", storage=hashed_storage, null=True, blank=True)
+
+    def __str__(self):
+        return f"Damage Report for Booking #{self.booking_id}"
+
+
+class VehicleOccupancy(models.Model):
+    # One bit per hour of a local calendar month, set where a booking that
+    # blocks the vehicle covers any part of the hour (see occupancy.py).
+    # Months without such bookings have no row.
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name="occupancy")
+    # first day of the month
+    month = models.DateField()
+    hours = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["vehicle", "month"], name="unique_vehicle_month"),
+        ]
+        indexes = [
+            # fleet-wide "who is free in March" questions
+            models.Index(fields=["month", "vehicle"], name="occupancy_month_idx"),
+        ]
+
+    def __str__(self):
+        return f"vehicle #{self.vehicle_id} in {self.month:%Y-%m}"
+
+
+class ArchivedBooking(models.Model):
+    # Finished bookings moved out of Booking by archive_bookings, so the
+    # table availability checks and the scheduler scan only holds bookings
+    # still in flight. Rows keep their original id.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_bookings")
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name="archived_bookings")
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    security_deposit = models.PositiveIntegerField(default=2000)
+    status = models.CharField(max_length=20, choices=Booking.STATUS)
+    ordered_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # newest-first history pages
+            models.Index(fields=["user", "id"], name="archive_user_idx"),
+            # analytics rollup refreshes
+            models.Index(fields=["vehicle", "start_time"], name="archive_vehicle_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived booking #{self.id} - vehicle #{self.vehicle_id}"
+
+
+class ArchivedDamageReport(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.OneToOneField(ArchivedBooking, on_delete=models.CASCADE)
+    damage_description = models.TextField(blank=True)
+    damage_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # the same file as the original report; archiving does not copy it
+    images = models.ImageField(upload_to="damage/", storage=hashed_storage, null=True, blank=True)
+
+    def __str__(self):
+        return f"Damage Report for Booking #{self.booking_id}"
+
+
+class DailyVehicleStats(models.Model):
+    # Per vehicle per local day rollup behind the owner and admin
+    # dashboards, rewritten from bookings and damage reports as they change
+    # (see analytics.py). Revenue and the booking count go to the day a
+    # booking starts, booked hours are split over the days it covers and
+    # damage goes to the day it ends.
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name="daily_stats")
+    # copied from the vehicle so an owner's charts read one index range
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="daily_stats", null=True, blank=True
+    )
+    day = models.DateField()
+    bookings = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    booked_hours = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    damage_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["vehicle", "day"], name="unique_vehicle_day"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "day"], name="stats_owner_day_idx"),
+            models.Index(fields=["day"], name="stats_day_idx"),
+        ]
 
     def __str__(self):
-        return f"Damage Report for Booking #{self.booking.id}"
+        return f"vehicle #{self.vehicle_id} on {self.day}"
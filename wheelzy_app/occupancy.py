@@ -0,0 +1,209 @@
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import reduce
+from operator import and_, or_
+
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics import day_start, first_day, last_day
+from .availability import ACTIVE_STATUSES
+from .models import Booking, Vehicle, VehicleOccupancy
+
+# Each month is a bitmap with bit i set when hour i (counted from local
+# midnight on the 1st) is booked. Bitmaps are stored as little-endian
+# bytes and worked on as Python ints, so AND/OR over a whole month is one
+# operation per vehicle: bit i is byte i // 8, bit i % 8 from the lowest.
+
+HOUR_SECONDS = 3600
+OCCUPANCY_BATCH_SIZE = 200
+# Bitmaps cover the months this far either side of the current one, so a
+# refresh writes a bounded number of rows however long a booking is (old
+# data, admin edits); the parts outside are not mapped.
+HORIZON_MONTHS = 60
+
+
+class OccupancyError(ValueError):
+    pass
+
+
+def affects_occupancy(old_status, new_status):
+    return (old_status in ACTIVE_STATUSES) != (new_status in ACTIVE_STATUSES)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def month_bounds(month):
+    return day_start(month), day_start(next_month(month))
+
+
+def month_hours(month):
+    # 743 or 745 across a DST change
+    lo, hi = month_bounds(month)
+    return int((hi - lo).total_seconds()) // HOUR_SECONDS
+
+
+def previous_month(month):
+    return (month - timedelta(days=1)).replace(day=1)
+
+
+def horizon(today=None):
+    # (first, last) month the bitmaps cover
+    first = last = (today or timezone.localdate()).replace(day=1)
+    for _ in range(HORIZON_MONTHS):
+        first, last = previous_month(first), next_month(last)
+    return first, last
+
+
+def parse_month(value, today=None):
+    # first day of ?month=YYYY-MM, this month when missing
+    if not value:
+        return (today or timezone.localdate()).replace(day=1)
+    try:
+        month = date.fromisoformat(f"{value}-01")
+    except ValueError:
+        raise OccupancyError("month must look like 2024-03")
+    first, last = horizon(today)
+    if not first <= month <= last:
+        raise OccupancyError(f"month must be within {HORIZON_MONTHS} months of this one")
+    return month
+
+
+def months_between(start, end, window=None):
+    # the months a booking from start to end touches inside the window
+    # (the horizon by default)
+    first, last = window or horizon()
+    month, last = max(first_day(start).replace(day=1), first), min(last_day(end), last)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def hour_bits(month, spans):
+    # the month's bitmap for (start, end) spans; any part of an hour
+    # marks the whole hour
+    lo, hi = month_bounds(month)
+    bits = 0
+    for start, end in spans:
+        start, end = max(start, lo), min(end, hi)
+        if end <= start:
+            continue
+        first = int((start - lo).total_seconds()) // HOUR_SECONDS
+        last = math.ceil((end - lo).total_seconds() / HOUR_SECONDS)
+        bits |= ((1 << (last - first)) - 1) << first
+    return bits
+
+
+def pack(bits, month):
+    return bits.to_bytes((month_hours(month) + 7) // 8, "little")
+
+
+def unpack(data):
+    return int.from_bytes(data, "little")
+
+
+def _rows(vehicle_id, months, spans):
+    rows = []
+    for month in months:
+        bits = hour_bits(month, spans)
+        if bits:
+            rows.append(VehicleOccupancy(vehicle_id=vehicle_id, month=month, hours=pack(bits, month)))
+    return rows
+
+
+def refresh_occupancy(spans):
+    # spans: (vehicle_id, start_time, end_time) of bookings that changed;
+    # rewrites the months they touch from the vehicle's blocking bookings
+    window = horizon()
+    by_vehicle = defaultdict(set)
+    for vehicle_id, start, end in spans:
+        by_vehicle[vehicle_id].update(months_between(start, end, window))
+    for vehicle_id, months in by_vehicle.items():
+        if not months:
+            continue
+        months = sorted(months)
+        lo, hi = month_bounds(months[0])[0], month_bounds(months[-1])[1]
+        bookings = list(Booking.objects.filter(
+            vehicle_id=vehicle_id, status__in=ACTIVE_STATUSES, start_time__lt=hi, end_time__gt=lo,
+        ).values_list("start_time", "end_time"))
+        with transaction.atomic():
+            VehicleOccupancy.objects.filter(vehicle_id=vehicle_id, month__in=months).delete()
+            VehicleOccupancy.objects.bulk_create(_rows(vehicle_id, months, bookings))
+
+
+def rebuild_occupancy(vehicle_ids=None, batch_size=OCCUPANCY_BATCH_SIZE):
+    # Rewrites every bitmap of the given vehicles (all of them by default).
+    # Returns the number of rows written.
+    vehicles = Vehicle.objects.order_by("pk")
+    if vehicle_ids is not None:
+        vehicles = vehicles.filter(pk__in=vehicle_ids)
+    ids = list(vehicles.values_list("pk", flat=True))
+    if vehicle_ids is None:
+        VehicleOccupancy.objects.exclude(vehicle_id__in=vehicles.values("pk")).delete()
+
+    window = horizon()
+    written = 0
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        spans = defaultdict(list)
+        for vehicle_id, start, end in Booking.objects.filter(
+            vehicle_id__in=batch, status__in=ACTIVE_STATUSES
+        ).values_list("vehicle_id", "start_time", "end_time"):
+            spans[vehicle_id].append((start, end))
+        rows = []
+        for vehicle_id, bookings in spans.items():
+            months = sorted({m for start, end in bookings for m in months_between(start, end, window)})
+            rows += _rows(vehicle_id, months, bookings)
+        with transaction.atomic():
+            VehicleOccupancy.objects.filter(vehicle_id__in=batch).delete()
+            VehicleOccupancy.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+def month_occupancy(vehicle_ids, month):
+    # {vehicle_id: bitmap}; vehicles without a row are free all month
+    bitmaps = dict.fromkeys(vehicle_ids, 0)
+    for vehicle_id, data in VehicleOccupancy.objects.filter(
+        month=month, vehicle_id__in=vehicle_ids
+    ).values_list("vehicle_id", "hours"):
+        bitmaps[vehicle_id] = unpack(data)
+    return bitmaps
+
+
+def hours_mask(month, wanted):
+    # bits for the hours whose local start time passes wanted(datetime)
+    lo = month_bounds(month)[0]
+    bits = 0
+    for hour in range(month_hours(month)):
+        if wanted(timezone.localtime(lo + timedelta(hours=hour))):
+            bits |= 1 << hour
+    return bits
+
+
+def weekend_mask(month):
+    return hours_mask(month, lambda moment: moment.weekday() >= 5)
+
+
+def free_during(vehicle_ids, month, mask):
+    # vehicles with none of the mask's hours booked, e.g.
+    # free_during(ids, date(2024, 3, 1), weekend_mask(date(2024, 3, 1)))
+    # for "free every weekend in March"
+    return [
+        vehicle_id for vehicle_id, bits in month_occupancy(vehicle_ids, month).items()
+        if not bits & mask
+    ]
+
+
+def booked_by_any(bitmaps):
+    # hours at least one of the vehicles is booked
+    return reduce(or_, bitmaps, 0)
+
+
+def booked_by_all(bitmaps):
+    # hours every one of the vehicles is booked
+    bitmaps = list(bitmaps)
+    return reduce(and_, bitmaps) if bitmaps else 0
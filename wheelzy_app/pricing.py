@@ -0,0 +1,138 @@
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import PriceRule, Vehicle
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Plans are cleared by signals in this process; other workers pick up a
+# changed rule after at most this many seconds, so cached plans only serve
+# quotes: the price a booking is saved with is read fresh.
+PLAN_TIMEOUT = 60
+
+MAX_QUOTE_VEHICLES = 100
+MAX_QUOTE_RANGES = 20
+
+_lock = threading.Lock()
+_plans = {}
+_next_prune = 0
+
+
+class PricePlan:
+    # base hourly rate plus (min_hours, price_per_hour, price_per_day)
+    # tiers, sorted so the last matching tier wins
+    def __init__(self, price_per_hour, rules=()):
+        self.price_per_hour = Decimal(price_per_hour)
+        self.rules = sorted(rules, key=lambda rule: rule[0])
+
+    def rates(self, hours):
+        rate, day_rate = self.price_per_hour, None
+        for min_hours, per_hour, per_day in self.rules:
+            if hours < min_hours:
+                break
+            if per_hour is not None:
+                rate = per_hour
+            day_rate = per_day
+        return rate, day_rate
+
+    def price(self, seconds):
+        if seconds <= 0:
+            return ZERO
+        rate, day_rate = self.rates(Decimal(seconds) / HOUR)
+        if day_rate is None:
+            total = Decimal(seconds) * rate / HOUR
+        else:
+            # every full day costs at most the day rate, and so does
+            # the part-day left over
+            days, rest = divmod(seconds, DAY)
+            total = days * min(day_rate, rate * 24)
+            total += min(Decimal(rest) * rate / HOUR, day_rate)
+        return total.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _seconds(start, end):
+    return int((end - start).total_seconds())
+
+
+def read_plans(vehicle_ids, using=None):
+    # {vehicle_id: PricePlan} straight from the database (the router's
+    # choice, possibly a replica, unless `using` is given)
+    vehicles, price_rules = Vehicle.objects.all(), PriceRule.objects.all()
+    if using:
+        vehicles, price_rules = vehicles.using(using), price_rules.using(using)
+    rates = dict(vehicles.filter(id__in=vehicle_ids).values_list("id", "price_per_hour"))
+    rules = {}
+    for row in price_rules.filter(vehicle_id__in=rates).values_list(
+        "vehicle_id", "min_hours", "price_per_hour", "price_per_day"
+    ):
+        rules.setdefault(row[0], []).append(row[1:])
+    return {vehicle_id: PricePlan(rate, rules.get(vehicle_id, ())) for vehicle_id, rate in rates.items()}
+
+
+def _prune(now):
+    # drops expired plans (of vehicles nobody looked at since, or deleted
+    # ones) once per timeout, so the dict does not grow with the fleet's
+    # whole history; call with _lock held
+    global _next_prune
+    if now < _next_prune:
+        return
+    for vehicle_id in [vehicle_id for vehicle_id, (expires, _) in _plans.items() if expires <= now]:
+        del _plans[vehicle_id]
+    _next_prune = now + PLAN_TIMEOUT
+
+
+def load_plans(vehicle_ids):
+    # {vehicle_id: PricePlan}; ids that do not exist are left out
+    now = time.monotonic()
+    plans, missing = {}, []
+    with _lock:
+        for vehicle_id in set(vehicle_ids):
+            cached = _plans.get(vehicle_id)
+            if cached and cached[0] > now:
+                plans[vehicle_id] = cached[1]
+            else:
+                missing.append(vehicle_id)
+    if not missing:
+        return plans
+
+    loaded = read_plans(missing)
+    expires = now + PLAN_TIMEOUT
+    with _lock:
+        _prune(now)
+        for vehicle_id, plan in loaded.items():
+            _plans[vehicle_id] = (expires, plan)
+    plans.update(loaded)
+    return plans
+
+
+def forget_plan(vehicle_id):
+    with _lock:
+        _plans.pop(vehicle_id, None)
+
+
+def quote(vehicle_id, start, end, fresh=False):
+    # fresh: read the plan from the primary instead of the cache, for the
+    # price a booking is saved with
+    plans = read_plans([vehicle_id], DEFAULT_DB_ALIAS) if fresh else load_plans([vehicle_id])
+    plan = plans.get(vehicle_id)
+    if plan is None:
+        raise Vehicle.DoesNotExist(f"Vehicle {vehicle_id} does not exist")
+    return plan.price(_seconds(start, end))
+
+
+def quote_many(vehicle_ids, ranges):
+    # {(vehicle_id, range index): total}; one plan lookup for the whole
+    # batch and each range's length is worked out once
+    plans = load_plans(vehicle_ids)
+    lengths = [_seconds(start, end) for start, end in ranges]
+    return {
+        (vehicle_id, index): plan.price(seconds)
+        for vehicle_id, plan in plans.items()
+        for index, seconds in enumerate(lengths)
+    }
@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# recent requests kept for the latency quantiles on /metrics
+RING_SIZE = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = ContextVar("wheelzy_request_stats", default=None)
+_lock = threading.Lock()
+_ring = deque(maxlen=RING_SIZE)
+# cumulative per view: requests, queries, db, template and total seconds
+_totals = defaultdict(lambda: [0, 0, 0.0, 0.0, 0.0])
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+def query_hook(execute, sql, params, many, context):
+    # Installed on every connection when it is opened. It reads the stats
+    # from a context variable, so queries the async ORM runs in worker
+    # threads are still counted against the request.
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_query_hook(connection):
+    if query_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_hook)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # DjangoTemplates whose top-level renders are timed for the current
+    # request; {% include %} runs inside them and is not counted twice
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or "unnamed"
+
+
+def record(name, stats, total):
+    with _lock:
+        _ring.append((name, total))
+        row = _totals[name]
+        row[0] += 1
+        row[1] += stats.queries
+        row[2] += stats.db_time
+        row[3] += stats.template_time
+        row[4] += total
+
+
+def reset():
+    with _lock:
+        _ring.clear()
+        _totals.clear()
+
+
+def check_budget(name, queries):
+    budget = getattr(settings, "WHEELZY_QUERY_BUDGETS", {}).get(name)
+    if budget is None or queries <= budget:
+        return
+    message = f"{name} ran {queries} queries (budget {budget})"
+    if getattr(settings, "WHEELZY_ENFORCE_QUERY_BUDGETS", False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def server_timing(stats, total):
+    return ", ".join([
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+        f"tpl;dur={stats.template_time * 1000:.1f}",
+        f"total;dur={total * 1000:.1f}",
+    ])
+
+
+class ProfilingMiddleware:
+    # Counts queries and times the DB, templates and the whole request,
+    # per URL name. Keep it first in MIDDLEWARE so the total covers the
+    # rest of the stack.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing = self.finish(request, stats, started)
+        user = getattr(request, "user", None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response["Server-Timing"] = timing
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing = self.finish(request, stats, started)
+        auser = getattr(request, "auser", None)
+        if settings.DEBUG or (auser is not None and (await auser()).is_staff):
+            response["Server-Timing"] = timing
+        return response
+
+    def finish(self, request, stats, started):
+        # records the request and returns its Server-Timing header, which
+        # only staff (or anyone with DEBUG on) get to see
+        total = time.perf_counter() - started
+        name = view_name(request)
+        record(name, stats, total)
+        check_budget(name, stats.queries)
+        return server_timing(stats, total)
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _label(name):
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text():
+    with _lock:
+        totals = {name: list(row) for name, row in _totals.items()}
+        recent = defaultdict(list)
+        for name, seconds in _ring:
+            recent[name].append(seconds)
+
+    lines = []
+    series = [
+        ("wheelzy_requests_total", "Requests handled", 0),
+        ("wheelzy_db_queries_total", "SQL queries run", 1),
+        ("wheelzy_db_seconds_total", "Time spent in SQL", 2),
+        ("wheelzy_template_seconds_total", "Time spent rendering templates", 3),
+        ("wheelzy_request_seconds_total", "Time spent handling requests", 4),
+    ]
+    for metric, help_text, column in series:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name in sorted(totals):
+            value = totals[name][column]
+            if isinstance(value, float):
+                value = f"{value:.6f}"
+            lines.append(f'{metric}{{view="{_label(name)}"}} {value}')
+
+    metric = "wheelzy_request_latency_seconds"
+    lines.append(f"# HELP {metric} Latency over the last {RING_SIZE} requests")
+    lines.append(f"# TYPE {metric} gauge")
+    for name in sorted(recent):
+        for q in QUANTILES:
+            value = _quantile(recent[name], q)
+            lines.append(f'{metric}{{view="{_label(name)}",quantile="{q}"}} {value:.6f}')
+    return "\n".join(lines) + "\n"
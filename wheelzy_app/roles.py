@@ -0,0 +1,82 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+ADMIN = "admin"
+OWNER = "owner"
+CUSTOMER = "customer"
+
+OWNER_GROUP = "owner"
+# Signals drop a role only from the cache of the process that changed the
+# groups, so with a per-process cache other workers keep the old role until
+# the entry expires: a minute at most, as for the cached user (auth.py).
+ROLE_TIMEOUT = 60
+
+# Bumped when a group itself changes (rename, delete, bulk membership edits
+# from the group side), which orphans every cached role at once.
+VERSION_KEY = "role:version"
+
+
+def _cache_key(user_id):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    return f"role:{version}:{user_id}"
+
+
+def get_role(user):
+    if not user.is_authenticated:
+        return None
+    if user.is_superuser:
+        return ADMIN
+    key = _cache_key(user.pk)
+    role = cache.get(key)
+    if role is None:
+        role = OWNER if user.groups.filter(name=OWNER_GROUP).exists() else CUSTOMER
+        cache.set(key, role, ROLE_TIMEOUT)
+    return role
+
+
+def forget_role(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+def forget_all_roles():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+class RoleMiddleware:
+    # request.role, resolved (from cache) only when something reads it;
+    # role_required checks it
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: get_role(request.user))
+        # under ASGI this hands back the coroutine for the caller to await
+        return self.get_response(request)
+
+
+def role_required(*roles, message="Access denied"):
+    def decorator(view):
+        @login_required
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.role not in roles:
+                if message:
+                    messages.error(request, message)
+                return redirect("home")
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,40 @@
+from django.conf import settings
+
+REPLICA = "replica"
+
+# Browsed far more often than they change, and a second or two of replica
+# lag on them is harmless. Bookings always read from the primary so the
+# availability checks see every committed booking.
+CATALOGUE_MODELS = {"vehicle", "pricerule"}
+
+
+class CatalogueReplicaRouter:
+    # Sends catalogue reads to the "replica" alias when one is configured.
+    # select_for_update() and writes go through db_for_write and so always
+    # stay on the primary.
+
+    def db_for_read(self, model, **hints):
+        if REPLICA not in settings.DATABASES:
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # follow relations from the database the object came from
+            return instance._state.db
+        if model._meta.app_label == "wheelzy_app" and model._meta.model_name in CATALOGUE_MODELS:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        databases = {"default", REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False
+        return None
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import ACTIVE_STATUSES, refresh_vehicle_status
+from .bookings import bulk_transition
+from .caching import CATALOGUE, bump_version, vehicle_scope
+from .models import Booking
+
+SCHEDULER_BATCH_SIZE = 500
+# seconds between run_scheduler passes
+SCHEDULER_INTERVAL = 60
+
+
+def due_transitions(now):
+    # (from status, to status, which of those bookings are due)
+    ttl = timedelta(seconds=settings.WHEELZY_PENDING_TTL)
+    grace = timedelta(seconds=settings.WHEELZY_PENDING_GRACE)
+    return [
+        # never paid/confirmed: gone after the TTL, or once the trip has
+        # been due to start for the grace period
+        ("pending", "expired", Q(ordered_at__lte=now - ttl) | Q(start_time__lte=now - grace)),
+        ("confirmed", "in_use", Q(start_time__lte=now)),
+        ("in_use", "overdue", Q(end_time__lte=now)),
+    ]
+
+
+def refresh_passed_bookings(since, now):
+    # Vehicle columns only change with booking writes, but a booking that
+    # starts or ends (while staying pending, say) changes them too: refresh
+    # the vehicles of active bookings that started or ended in (since, now].
+    # Served by the (status, start_time) and (status, end_time) indexes.
+    vehicle_ids = set(Booking.objects.filter(
+        Q(start_time__gt=since, start_time__lte=now) | Q(end_time__gt=since, end_time__lte=now),
+        status__in=ACTIVE_STATUSES,
+    ).values_list("vehicle_id", flat=True))
+    changed = refresh_vehicle_status(vehicle_ids, now)
+    if changed:
+        # no signals here either
+        for vehicle_id in vehicle_ids:
+            bump_version(vehicle_scope(vehicle_id))
+        bump_version(CATALOGUE)
+    return changed
+
+
+def run_due_transitions(now=None, batch_size=SCHEDULER_BATCH_SIZE, since=None):
+    # Moves every due booking on in batched UPDATEs, each short enough not
+    # to hold up bookings being written, then refreshes vehicles whose
+    # bookings started or ended since the previous pass (one interval ago
+    # by default). Returns {"pending->expired": n, ..., "refreshed": n}.
+    now = now or timezone.now()
+    since = since or now - timedelta(seconds=SCHEDULER_INTERVAL)
+    counts = {}
+    for source, target, due in due_transitions(now):
+        counts[f"{source}->{target}"] = bulk_transition(
+            Booking.objects.filter(due), target, [source], now, batch_size
+        )
+    counts["refreshed"] = refresh_passed_bookings(since, now)
+    return counts
@@ -0,0 +1,155 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import normalize_plate
+
+# most relevant matches returned per query
+SEARCH_LIMIT = 500
+# Broad queries ("maruti") match a large share of the fleet; bm25 is only
+# computed for the first this many matches (in rowid order, i.e. oldest
+# vehicles first) so their cost stays flat. Ranking is therefore
+# approximate for queries matching more: a better match further in is
+# missed. Ranking every match costs ~10x at 200k vehicles (p95 8 -> 82 ms).
+RANK_CANDIDATES = 1000
+
+FTS_TABLE = "wheelzy_vehicle_search"
+
+# External-content FTS5 index over Vehicle. Triggers (rather than model
+# signals) keep it in sync so bulk_create, queryset.update() and raw
+# deletes are covered too.
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        vehicle_name, number_plate, plate_key,
+        content='wheelzy_app_vehicle', content_rowid='id',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON wheelzy_app_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, vehicle_name, number_plate, plate_key)
+        VALUES (new.id, new.vehicle_name, new.number_plate, new.plate_key);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON wheelzy_app_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, vehicle_name, number_plate, plate_key)
+        VALUES ('delete', old.id, old.vehicle_name, old.number_plate, old.plate_key);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON wheelzy_app_vehicle BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, vehicle_name, number_plate, plate_key)
+        VALUES ('delete', old.id, old.vehicle_name, old.number_plate, old.plate_key);
+        INSERT INTO {FTS_TABLE}(rowid, vehicle_name, number_plate, plate_key)
+        VALUES (new.id, new.vehicle_name, new.number_plate, new.plate_key);
+    END""",
+]
+
+
+# Postgres: indexed as an expression by migration 0016 and repeated
+# verbatim in queries, so no column or trigger has to keep a stored copy
+POSTGRES_VECTOR = (
+    "(setweight(to_tsvector('english', vehicle_name), 'A')"
+    " || setweight(to_tsvector('english', number_plate), 'B'))"
+)
+
+
+def install_fts(using=connection):
+    # Run after every migrate: SQLite table rebuilds during migrations drop
+    # the triggers, so recreate them and reindex when that happened.
+    if using.vendor != "sqlite":
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f"{FTS_TABLE}_a_"],
+        )
+        complete = cursor.fetchone()[0] == 3
+        for statement in FTS_SQL:
+            cursor.execute(statement)
+        if not complete:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts_query(text):
+    # whole words except the last one, which may still be being typed
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " AND ".join(terms)
+
+
+def looks_like_plate(text):
+    plate = normalize_plate(text)
+    return len(plate) >= 4 and any(c.isdigit() for c in plate)
+
+
+def _fts_ids(cursor, match, limit):
+    # rowid breaks ties, so the order (and the keyset built on it) is stable
+    cursor.execute(
+        f"SELECT rowid FROM ("
+        f"SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s"
+        f") ORDER BY rank, rowid LIMIT %s",
+        [match, max(limit, RANK_CANDIDATES), limit],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _sqlite_ids(text, limit):
+    with connection.cursor() as cursor:
+        if looks_like_plate(text):
+            # a plate prefix is far more selective than its word fragments
+            ids = _fts_ids(cursor, f'plate_key:"{normalize_plate(text)}"*', limit)
+            if ids:
+                return ids
+        match = fts_query(text)
+        return _fts_ids(cursor, match, limit) if match else []
+
+
+def _postgres_ids(text, limit):
+    # The match is served by the GIN index on POSTGRES_VECTOR, the plate
+    # prefix by the varchar_pattern_ops index Django adds for plate_key;
+    # like SQLite, only the first RANK_CANDIDATES matches are ranked.
+    query = "websearch_to_tsquery('english', %s)"
+    matches, params = [f"{POSTGRES_VECTOR} @@ {query}"], [text]
+    plate = normalize_plate(text)
+    if plate:
+        matches.append("plate_key LIKE %s")
+        params.append(f"{plate}%")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM ("
+            f"SELECT id, ts_rank({POSTGRES_VECTOR}, {query}) AS rank FROM wheelzy_app_vehicle"
+            f" WHERE {' OR '.join(matches)} LIMIT %s"
+            f") AS candidates ORDER BY rank DESC, id LIMIT %s",
+            [text, *params, max(limit, RANK_CANDIDATES), limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_ids(text, limit=SEARCH_LIMIT):
+    # vehicle ids ordered by relevance
+    if connection.vendor == "sqlite":
+        return _sqlite_ids(text, limit)
+    if connection.vendor == "postgresql":
+        return _postgres_ids(text, limit)
+    return None
+
+
+def search_vehicles(queryset, text):
+    ids = search_ids(text)
+    if ids is None:
+        # no search index for this database
+        plate = normalize_plate(text)
+        matches = Q(vehicle_name__icontains=text)
+        if plate:
+            matches |= Q(plate_key__contains=plate)
+        return queryset.filter(matches).annotate(search_rank=F("id"))
+    if not ids:
+        return queryset.annotate(search_rank=F("id")).none()
+    # search_rank is the position in the relevance order, unique per row,
+    # so it doubles as the keyset for paging through results
+    return queryset.filter(id__in=ids).annotate(
+        search_rank=Case(
+            *[When(id=pk, then=Value(pos)) for pos, pk in enumerate(ids)],
+            default=Value(len(ids)),
+            output_field=IntegerField(),
+        )
+    )
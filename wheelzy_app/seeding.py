@@ -0,0 +1,164 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .analytics import rebuild_rollup
+from .availability import refresh_vehicle_status
+from .caching import CATALOGUE, bump_version
+from .geo import point_geohash
+from .models import Booking, Vehicle, default_seats, normalize_plate
+from .occupancy import rebuild_occupancy
+from .roles import OWNER_GROUP, forget_all_roles
+
+# every seeded username starts with this, so a seeded fleet can be removed
+SEED_PREFIX = "seed_"
+SEED_BATCH_SIZE = 5000
+
+VEHICLE_NAMES = {
+    "car": [
+        "Maruti Swift", "Maruti Zen", "Hyundai i20", "Honda City", "Tata Nexon",
+        "Mahindra Thar", "Toyota Innova",
+    ],
+    "bike": ["Bajaj Platina", "TVS Ntorq", "Royal Enfield Classic", "Honda Activa"],
+}
+# a city per registration state, so radius searches find clusters
+STATES = {
+    "KL": (9.9312, 76.2673),
+    "TN": (13.0827, 80.2707),
+    "KA": (12.9716, 77.5946),
+    "MH": (19.0760, 72.8777),
+    "DL": (28.6139, 77.2090),
+}
+# pickup points spread this many degrees (about 11 km) around the city
+CITY_SPREAD = 0.1
+
+
+def random_plate(rng, serial, state=None):
+    # serial keeps plates unique however many are drawn
+    state = state or rng.choice(list(STATES))
+    return f"{state}-{rng.randint(1, 99):02d}-{serial:07d}"
+
+
+def random_point(rng, state):
+    lat, lon = STATES[state]
+    return (
+        round(lat + rng.gauss(0, CITY_SPREAD), 6),
+        round(lon + rng.gauss(0, CITY_SPREAD), 6),
+    )
+
+
+def clear_seeded():
+    users = User.objects.filter(username__startswith=SEED_PREFIX)
+    # bookings and vehicles go with their users (CASCADE)
+    deleted, _ = users.delete()
+    bump_version(CATALOGUE)
+    return deleted
+
+
+def seed_fleet(owners=10, customers=100, vehicles=1000, bookings=5000, seed=1,
+               password="password", batch_size=SEED_BATCH_SIZE):
+    # Owners (in the owner group), customers, vehicles spread over the
+    # owners and non-overlapping bookings from a month back onwards, all
+    # via bulk_create. The same seed on the same database gives the same fleet.
+    rng = random.Random(seed)
+    # hashing is the slow part of creating users; every seeded user shares it
+    hashed = make_password(password)
+    serial = (Vehicle.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+    with transaction.atomic():
+        owner_users = _create_users("owner", owners, hashed, batch_size)
+        customer_users = _create_users("customer", customers, hashed, batch_size)
+        group, _ = Group.objects.get_or_create(name=OWNER_GROUP)
+        User.groups.through.objects.bulk_create(
+            [User.groups.through(user_id=u.pk, group_id=group.pk) for u in owner_users],
+            batch_size=batch_size,
+        )
+
+        fleet = []
+        for i in range(vehicles):
+            vehicle_type = "bike" if rng.random() < 0.3 else "car"
+            state = rng.choice(list(STATES))
+            plate = random_plate(rng, serial + i, state)
+            latitude, longitude = random_point(rng, state)
+            fleet.append(Vehicle(
+                owner=rng.choice(owner_users) if owner_users else None,
+                vehicle_name=rng.choice(VEHICLE_NAMES[vehicle_type]),
+                vehicle_type=vehicle_type,
+                number_plate=plate,
+                plate_key=normalize_plate(plate),
+                latitude=latitude,
+                longitude=longitude,
+                geohash=point_geohash(latitude, longitude),
+                price_per_hour=rng.randrange(50, 2000, 10),
+                seats=default_seats(vehicle_type),
+            ))
+        fleet = Vehicle.objects.bulk_create(fleet, batch_size=batch_size)
+
+        created = 0
+        if fleet and customer_users:
+            created = _create_bookings(rng, fleet, customer_users, bookings, batch_size)
+            refresh_vehicle_status([vehicle.pk for vehicle in fleet])
+            rebuild_rollup([vehicle.pk for vehicle in fleet])
+            rebuild_occupancy([vehicle.pk for vehicle in fleet])
+
+    # bulk_create sends no signals
+    forget_all_roles()
+    bump_version(CATALOGUE)
+    return {
+        "owners": len(owner_users),
+        "customers": len(customer_users),
+        "vehicles": len(fleet),
+        "bookings": created,
+    }
+
+
+def _create_users(kind, count, hashed, batch_size):
+    taken = User.objects.filter(username__startswith=f"{SEED_PREFIX}{kind}_").count()
+    users = [
+        User(username=f"{SEED_PREFIX}{kind}_{taken + i}", password=hashed)
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    # SQLite and Postgres return the ids; fetch them where they do not
+    if users and users[0].pk is None:
+        users = list(User.objects.filter(username__in=[u.username for u in users]))
+    return users
+
+
+def _create_bookings(rng, fleet, customers, count, batch_size):
+    # each vehicle gets a chain of bookings separated by gaps, so none of
+    # them overlap and the availability queries see realistic data
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    per_vehicle, extra = divmod(count, len(fleet))
+    batch, created = [], 0
+    for index, vehicle in enumerate(fleet):
+        cursor = now - timedelta(days=30) + timedelta(hours=rng.randint(0, 48))
+        for _ in range(per_vehicle + (index < extra)):
+            hours = rng.randint(1, 72)
+            start, end = cursor, cursor + timedelta(hours=hours)
+            if end < now:
+                status = rng.choice(["returned", "returned", "cancelled"])
+            elif start <= now:
+                status = "in_use"
+            else:
+                status = rng.choice(["pending", "confirmed", "confirmed"])
+            batch.append(Booking(
+                user=rng.choice(customers),
+                vehicle=vehicle,
+                start_time=start,
+                end_time=end,
+                total_price=vehicle.price_per_hour * hours,
+                status=status,
+            ))
+            cursor = end + timedelta(hours=rng.randint(1, 48))
+            if len(batch) >= batch_size:
+                Booking.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+    Booking.objects.bulk_create(batch)
+    return created + len(batch)
@@ -0,0 +1,51 @@
+from rest_framework import serializers
+
+from .models import Vehicle
+from .pricing import MAX_QUOTE_RANGES, MAX_QUOTE_VEHICLES
+
+
+class VehicleSerializer(serializers.ModelSerializer):
+    is_available = serializers.BooleanField(read_only=True)
+    # only set for ?near= searches
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Vehicle
+        fields = [
+            "id",
+            "vehicle_name",
+            "vehicle_type",
+            "number_plate",
+            "price_per_hour",
+            "seats",
+            "image",
+            "is_available",
+            "current_status",
+            "next_free_at",
+            "latitude",
+            "longitude",
+            "distance_km",
+        ]
+
+    def get_distance_km(self, vehicle):
+        distance = getattr(vehicle, "distance", None)
+        return None if distance is None else round(distance, 2)
+
+
+class QuoteRangeSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs["end"] <= attrs["start"]:
+            raise serializers.ValidationError("end must be after start")
+        return attrs
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    vehicle_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_QUOTE_VEHICLES,
+    )
+    ranges = QuoteRangeSerializer(many=True, allow_empty=False, max_length=MAX_QUOTE_RANGES)
@@ -0,0 +1,174 @@
+from django.contrib.auth.models import Group, User
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .analytics import EARNING_STATUSES, refresh_bookings
+from .auth import forget_user
+from .availability import ACTIVE_STATUSES, refresh_vehicle_status
+from .caching import vehicle_changed
+from .events import reset_broker
+from .images import schedule_variants
+from .models import Booking, DailyVehicleStats, DamageReport, PriceRule, UserProfile, Vehicle
+from .occupancy import refresh_occupancy
+from .pricing import forget_plan
+from .profiling import install_query_hook
+from .roles import forget_all_roles, forget_role
+from .search import install_fts
+from .throttling import reset_login_buckets
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    if sender.name == "wheelzy_app":
+        install_fts(connections[using])
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    install_query_hook(connection)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        forget_all_roles()
+    else:
+        forget_role(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    forget_all_roles()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    forget_user(instance.pk)
+    # is_superuser may have flipped; logins only touch last_login
+    if update_fields and set(update_fields) == {"last_login"}:
+        return
+    forget_role(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def user_row_changed(sender, instance, **kwargs):
+    # the cached request.user carries its profile
+    forget_user(instance.pk if sender is User else instance.user_id)
+
+
+@receiver(setting_changed)
+def settings_changed(sender, setting, **kwargs):
+    if setting == "WHEELZY_LOGIN_RATES":
+        reset_login_buckets()
+    elif setting == "WHEELZY_EVENT_BROKER":
+        reset_broker()
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle(sender, instance, **kwargs):
+    forget_plan(instance.pk)
+    vehicle_changed(instance.pk)
+
+
+@receiver(post_save, sender=PriceRule)
+@receiver(post_delete, sender=PriceRule)
+def invalidate_price_rules(sender, instance, **kwargs):
+    # listed card prices come from the plan, so cached pages go too
+    forget_plan(instance.vehicle_id)
+    vehicle_changed(instance.vehicle_id)
+
+
+SPAN_FIELDS = ("vehicle_id", "start_time", "end_time")
+
+
+def booking_spans(instance):
+    # (vehicle_id, start, end) the write touched: the saved span plus the
+    # one it replaced, when an edit moved the booking
+    span = tuple(getattr(instance, name) for name in SPAN_FIELDS)
+    previous = getattr(instance, "_previous_span", None)
+    return [span] if previous in (None, span) else [span, previous]
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_span(sender, instance, update_fields=None, **kwargs):
+    # an edit (in the admin, say) may move the booking to another vehicle
+    # or other dates, which frees up the old ones
+    instance._previous_span = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not {"vehicle", "vehicle_id", "start_time", "end_time"} & set(update_fields):
+        return
+    instance._previous_span = Booking.objects.filter(pk=instance.pk).values_list(*SPAN_FIELDS).first()
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_vehicle(sender, instance, **kwargs):
+    # any booking write can flip the vehicle's availability; post_save runs
+    # inside the caller's transaction, so the columns commit with it
+    vehicle_ids = {vehicle_id for vehicle_id, _, _ in booking_spans(instance)}
+    refresh_vehicle_status(vehicle_ids)
+    for vehicle_id in vehicle_ids:
+        vehicle_changed(vehicle_id)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_booking_stats(sender, instance, created=False, **kwargs):
+    # a new pending booking earns nothing yet, so booking a vehicle does
+    # not pay for a rollup refresh
+    if created and instance.status not in EARNING_STATUSES:
+        return
+    refresh_bookings(booking_spans(instance))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_booking_occupancy(sender, instance, created=False, **kwargs):
+    # a new booking that does not block the vehicle leaves the bitmaps alone
+    if instance.status in ACTIVE_STATUSES or not created:
+        refresh_occupancy(booking_spans(instance))
+
+
+@receiver(post_save, sender=DamageReport)
+@receiver(post_delete, sender=DamageReport)
+def refresh_damage_stats(sender, instance, **kwargs):
+    refresh_bookings(
+        Booking.objects.filter(pk=instance.booking_id).values_list(
+            "vehicle_id", "start_time", "end_time"
+        )
+    )
+
+
+@receiver(post_save, sender=Vehicle)
+def move_vehicle_stats(sender, instance, created, **kwargs):
+    # the rollup keeps a copy of the owner
+    if not created:
+        DailyVehicleStats.objects.filter(vehicle=instance).exclude(
+            owner_id=instance.owner_id
+        ).update(owner_id=instance.owner_id)
+
+
+@receiver(post_save, sender=Vehicle)
+def vehicle_image_variants(sender, instance, update_fields=None, **kwargs):
+    # saves that leave the image alone (a price edit) skip it; others find
+    # the variants marker and return without decoding the original
+    if update_fields is not None and "image" not in update_fields:
+        return
+    if instance.image:
+        transaction.on_commit(lambda: schedule_variants(instance.image))
+
+
+@receiver(post_save, sender=DamageReport)
+def damage_image_variants(sender, instance, **kwargs):
+    if instance.images:
+        transaction.on_commit(lambda: schedule_variants(instance.images))
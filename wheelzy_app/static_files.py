@@ -0,0 +1,202 @@
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse,
+)
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli for .br variants
+    brotli = None
+
+# text files worth keeping a compressed copy of
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml")
+MIN_COMPRESS_SIZE = 512
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# files whose name does not change with their content
+REVALIDATE = "public, max-age=300, must-revalidate"
+
+# app.3f2a8c9d1b7e.css from ManifestStaticFilesStorage
+HASHED_STATIC = re.compile(r"\.[0-9a-f]{12}\.\w+$")
+# HashedStorage uploads and their _640w.webp variants
+HASHED_MEDIA = re.compile(r"(^|/)[0-9a-f]{20}(_\d+w)?\.\w+$")
+
+CHUNK_SIZE = 64 * 1024
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def compress_file(path):
+    # writes path.gz (and path.br) next to the file when that saves bytes;
+    # mtime=0 keeps the gzip output identical between deploys
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    written = []
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # collectstatic writes content-hashed copies (home.3f2a8c9d1b7e.css) and
+    # a .gz/.br copy of each text file for serve_static to hand out as is
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress_file(self.path(name))
+
+
+def _encoded(request, path, compress):
+    # (file to send, Content-Encoding) for what the client accepts
+    if compress:
+        accepted = request.headers.get("Accept-Encoding", "")
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return path + suffix, encoding
+    return path, None
+
+
+def _byte_range(header, size):
+    # (start, end) inclusive for a single "bytes=" range, None to send the
+    # whole file, or "unsatisfiable"
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile(response, path, root):
+    # let the front server (nginx, Apache) stream the file; it handles
+    # ranges itself
+    mode = getattr(settings, "WHEELZY_SENDFILE", None)
+    if mode == "x-sendfile":
+        response["X-Sendfile"] = path
+    elif mode == "x-accel-redirect":
+        prefix = settings.WHEELZY_SENDFILE_PREFIX.rstrip("/")
+        response["X-Accel-Redirect"] = f"{prefix}/{os.path.relpath(path, root)}"
+    else:
+        return False
+    return True
+
+
+def serve_file(request, path, root, immutable, compress=True):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found")
+
+    send_path, encoding = _encoded(request, full_path, compress)
+    stat = os.stat(send_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    headers = {
+        "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Accept-Ranges": "bytes",
+    }
+    if compress:
+        headers["Vary"] = "Accept-Encoding"
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    byte_range = None
+    if "Range" in request.headers and encoding is None:
+        if_range = request.headers.get("If-Range")
+        if if_range is None or if_range == etag:
+            byte_range = _byte_range(request.headers["Range"], stat.st_size)
+
+    if byte_range == "unsatisfiable":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    sent = HttpResponse(content_type=content_type)
+    if _sendfile(sent, send_path, root):
+        response = sent
+    elif byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(send_path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        response = FileResponse(open(send_path, "rb"), content_type=content_type)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def serve_static(request, path):
+    return serve_file(request, path, settings.STATIC_ROOT, bool(HASHED_STATIC.search(path)))
+
+
+def serve_media(request, path):
+    # images are already compressed
+    return serve_file(
+        request, path, settings.MEDIA_ROOT, bool(HASHED_MEDIA.search(path)), compress=False
+    )
+
+
+def urlpatterns():
+    # /static/ and /media/ for deployments without a front server doing it
+    patterns = []
+    for prefix, view in ((settings.STATIC_URL, serve_static), (settings.MEDIA_URL, serve_media)):
+        prefix = prefix.lstrip("/")
+        if prefix and "://" not in prefix:
+            patterns.append(re_path(rf"^{re.escape(prefix)}(?P<path>.+)$", view))
+    return patterns
@@ -0,0 +1,21 @@
+from django import template
+from django.utils.html import format_html
+
+from ..images import available_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, alt="", css_class="", sizes="100vw", lazy=True):
+    # <img> with a WebP srcset when variants exist, the original otherwise
+    srcset = ", ".join(f"{url} {width}w" for width, url in available_variants(field_file))
+    return format_html(
+        '<img src="{}"{} sizes="{}" class="{}" alt="{}" loading="{}" decoding="async">',
+        field_file.url,
+        format_html(' srcset="{}"', srcset) if srcset else "",
+        sizes,
+        css_class,
+        alt,
+        "lazy" if lazy else "eager",
+    )
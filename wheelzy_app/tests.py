@@ -1,3 +1,1596 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import EstimatedCountPaginator
+from .analytics import rebuild_rollup
+from .auth import load_user
+from .archive import booking_history
+from .availability import (
+    availability_mismatches, available_vehicles, is_free, refresh_vehicle_status,
+)
+from .benchmarks import compare, default_endpoints, run_client
+from .bookings import BookingError, VehicleUnavailable, bulk_transition, create_booking
+from .caching import CATALOGUE, cache_stats, get_version, vehicle_scope
+from .events import AVAILABILITY, RESET, get_broker, reset_broker
+from . import fleet_io, pricing
+from .fleet_io import import_vehicles
+from .conditional import validators
+from .catalogue import PAGE_SIZE, catalogue_order, keyset_page, vehicle_catalogue
+from .geo import distance_km, encode
+from .images import available_variants, generate_variants, variant_name, variants_marker
+from .occupancy import (
+    HORIZON_MONTHS, OccupancyError, booked_by_all, booked_by_any, free_during, horizon, month_hours,
+    months_between, parse_month, rebuild_occupancy, unpack, weekend_mask,
+)
+from .models import (
+    ArchivedBooking, ArchivedDamageReport, Booking, DailyVehicleStats, DamageReport, IdempotencyKey,
+    InvalidTransition, PriceRule, UserProfile, Vehicle, VehicleOccupancy,
+)
+from .pricing import quote, quote_many
+from .profiling import QueryBudgetExceeded
+from .roles import CUSTOMER, OWNER, get_role
+from .routers import CatalogueReplicaRouter
+from .scheduler import run_due_transitions
+from .search import FTS_TABLE, RANK_CANDIDATES, search_ids
+from .seeding import seed_fleet
+from .throttling import TokenBucket
+
+
+def make_vehicle(plate, **kwargs):
+    kwargs.setdefault("vehicle_name", f"Vehicle {plate}")
+    kwargs.setdefault("vehicle_type", "car")
+    kwargs.setdefault("price_per_hour", 100)
+    return Vehicle.objects.create(number_plate=plate, **kwargs)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.now = timezone.now().replace(microsecond=0)
+        self.car = make_vehicle("KL-01-1111")
+        self.bike = make_vehicle("KL-01-2222", vehicle_type="bike")
+        Booking.objects.create(
+            user=self.user,
+            vehicle=self.car,
+            start_time=self.now + timedelta(hours=2),
+            end_time=self.now + timedelta(hours=4),
+        )
+
+    def test_future_booking_does_not_block_now(self):
+        self.assertTrue(is_free(self.car, self.now, self.now))
+        self.assertTrue(is_free(self.car, self.now, self.now + timedelta(hours=2)))
+
+    def test_overlapping_window_is_blocked(self):
+        start = self.now + timedelta(hours=3)
+        self.assertFalse(is_free(self.car, start, start + timedelta(hours=2)))
+        self.assertFalse(is_free(self.car, start, start))
+
+    def test_finished_bookings_are_ignored(self):
+        Booking.objects.filter(vehicle=self.car).update(status="returned")
+        start = self.now + timedelta(hours=3)
+        self.assertTrue(is_free(self.car, start, start + timedelta(hours=1)))
+
+    def test_available_vehicles(self):
+        start = self.now + timedelta(hours=1)
+        end = self.now + timedelta(hours=3)
+        self.assertEqual(list(available_vehicles(start, end)), [self.bike])
+        self.assertEqual(
+            list(available_vehicles(start, end, {"vehicle_type": "car"})), []
+        )
+
+
+class VehicleListQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(self.user)
+        # loads the session and user into the cache
+        self.client.get(reverse("my_bookings"))
+
+    def add_fleet(self, count, offset=0):
+        now = timezone.now()
+        # cache versions move on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(offset, offset + count):
+                vehicle = make_vehicle(f"KL-04-{i:04d}")
+                if i % 2:
+                    Booking.objects.create(
+                        user=self.user,
+                        vehicle=vehicle,
+                        start_time=now - timedelta(hours=1),
+                        end_time=now + timedelta(hours=1),
+                    )
+
+    def list_page_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("all_vehicles"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_constant_in_fleet_size(self):
+        self.add_fleet(3)
+        small, _ = self.list_page_queries()
+        self.add_fleet(30, offset=3)
+        large, response = self.list_page_queries()
+        self.assertEqual(small, large)
+        # first page only: every other vehicle is booked
+        self.assertContains(response, "bg-success", count=PAGE_SIZE // 2)
+        self.assertContains(response, "bg-danger", count=PAGE_SIZE // 2)
+
+    def test_available_only_filter(self):
+        self.add_fleet(4)
+        response = self.client.get(reverse("all_vehicles"), {"available": "1"})
+        self.assertEqual(len(response.context["vehicles"]), 2)
+
+
+class CatalogueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(self.user)
+        for i, price in enumerate([300, 100, 200, 100, 500]):
+            make_vehicle(f"KL-05-{i:04d}", price_per_hour=price)
+
+    def test_html_pages_follow_keyset(self):
+        for i in range(5, PAGE_SIZE + 5):
+            make_vehicle(f"KL-05-{i:04d}")
+        first = self.client.get(reverse("all_vehicles"), {"type": "car"})
+        self.assertEqual(len(first.context["vehicles"]), PAGE_SIZE)
+        self.assertIn("type=car", first.context["next_query"])
+        second = self.client.get(reverse("all_vehicles") + "?" + first.context["next_query"])
+        self.assertEqual(len(second.context["vehicles"]), 5)
+        self.assertIsNone(second.context["next_query"])
+        seen = [v.id for v in first.context["vehicles"] + second.context["vehicles"]]
+        self.assertEqual(seen, list(Vehicle.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_api_cursor_by_price(self):
+        url = reverse("api_vehicles")
+        prices = []
+        params = {"ordering": "price_per_hour,id", "page_size": 2}
+        while url:
+            data = self.client.get(url, params).json()
+            prices += [v["price_per_hour"] for v in data["results"]]
+            url, params = data["next"], None
+        self.assertEqual(prices, [100, 100, 200, 300, 500])
+        self.assertIn("is_available", data["results"][0])
+
+    def test_api_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse("api_vehicles"))
+        self.assertEqual(response.status_code, 403)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.swift = make_vehicle("KL-07-AB-1234", vehicle_name="Maruti Swift")
+        self.zen = make_vehicle("KL 07 CD 9999", vehicle_name="Maruti Zen")
+        self.ntorq = make_vehicle("TN-09-XY-4321", vehicle_name="TVS Ntorq", vehicle_type="bike")
+
+    def test_name_prefix(self):
+        self.assertEqual(set(search_ids("marut")), {self.swift.id, self.zen.id})
+        self.assertEqual(search_ids("maruti sw"), [self.swift.id])
+
+    def test_plate_ignores_spaces_dashes_and_case(self):
+        self.assertEqual(search_ids("kl07ab1234"), [self.swift.id])
+        self.assertEqual(search_ids("KL-07 cd"), [self.zen.id])
+        self.assertEqual(search_ids("tn 09"), [self.ntorq.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.ntorq.vehicle_name = "Honda Activa"
+        self.ntorq.save()
+        self.assertEqual(search_ids("ntorq"), [])
+        self.assertEqual(search_ids("activa"), [self.ntorq.id])
+        self.zen.delete()
+        self.assertEqual(search_ids("zen"), [])
+
+    def test_broad_queries_rank_the_first_candidates(self):
+        # more matches than RANK_CANDIDATES; the shortest name ranks best
+        Vehicle.objects.bulk_create([
+            Vehicle(vehicle_name="Maruti Swift Dzire VXi", vehicle_type="car", number_plate=f"KL-30-{i:05d}",
+                    price_per_hour=100, seats=4)
+            for i in range(RANK_CANDIDATES + 10)
+        ])
+        best_late = make_vehicle("KL-31-0001", vehicle_name="Maruti")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid LIMIT %s",
+                ['"maruti"*', RANK_CANDIDATES],
+            )
+            candidates = [row[0] for row in cursor.fetchall()]
+        ids = search_ids("maruti", limit=20)
+        # the shorter setUp names rank first (tied, so by id), only the
+        # candidates are ranked, and the order is repeatable
+        self.assertEqual(ids[:2], [self.swift.id, self.zen.id])
+        self.assertTrue(set(ids) <= set(candidates))
+        self.assertNotIn(best_late.id, ids)
+        self.assertEqual(search_ids("maruti", limit=20), ids)
+        self.assertEqual(search_ids("maruti swift", limit=20)[:1], [self.swift.id])
+
+    def test_list_page_search(self):
+        user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(user)
+        response = self.client.get(reverse("all_vehicles"), {"q": "swift"})
+        self.assertEqual(list(response.context["vehicles"]), [self.swift])
+        response = self.client.get(reverse("api_vehicles"), {"q": "nothing-like-this"})
+        self.assertEqual(response.json()["results"], [])
+
+
+class RoleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("someone", password="pass")
+        self.owner_group = Group.objects.create(name="owner")
+
+    def test_cached_role_costs_no_queries(self):
+        self.assertEqual(get_role(self.user), CUSTOMER)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_role(self.user), CUSTOMER)
+
+    def test_group_changes_invalidate(self):
+        self.assertEqual(get_role(self.user), CUSTOMER)
+        self.user.groups.add(self.owner_group)
+        self.assertEqual(get_role(self.user), OWNER)
+        self.owner_group.user_set.remove(self.user)
+        self.assertEqual(get_role(self.user), CUSTOMER)
+
+    def test_owner_pages(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("owner_vehicle_list"))
+        self.assertRedirects(response, reverse("home"))
+        self.user.groups.add(self.owner_group)
+        response = self.client.get(reverse("owner_vehicle_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.role, OWNER)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(self.user)
+        self.vehicle = make_vehicle("KL-08-1111")
+
+    def vehicle_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        sql = [q["sql"] for q in ctx.captured_queries]
+        return [q for q in sql if "wheelzy_app_vehicle" in q], response
+
+    def test_repeat_hits_skip_vehicle_queries(self):
+        before = cache_stats().get("vehicle_list", {"hits": 0, "misses": 0})
+        for url in (reverse("all_vehicles"), reverse("vehicle_details", args=[self.vehicle.id])):
+            first, _ = self.vehicle_queries(url)
+            second, response = self.vehicle_queries(url)
+            self.assertTrue(first)
+            self.assertEqual(second, [])
+            self.assertContains(response, self.vehicle.vehicle_name)
+        after = cache_stats()["vehicle_list"]
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+
+    def test_booking_invalidates_cached_pages(self):
+        detail = reverse("vehicle_details", args=[self.vehicle.id])
+        self.assertContains(self.client.get(reverse("all_vehicles")), "bg-success")
+        self.assertContains(self.client.get(detail), "Book Now")
+        catalogue_version = get_version(CATALOGUE)
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                user=self.user,
+                vehicle=self.vehicle,
+                start_time=now - timedelta(hours=1),
+                end_time=now + timedelta(hours=1),
+            )
+            # not committed yet: a page rendered now from the old rows must
+            # not be cached under a new version
+            self.assertEqual(get_version(CATALOGUE), catalogue_version)
+        self.assertContains(self.client.get(reverse("all_vehicles")), "bg-danger")
+        self.assertContains(self.client.get(detail), "Unavailable")
+
+    def test_bulk_moves_bump_versions_on_commit(self):
+        booking = create_booking(self.user, self.vehicle.id, timezone.now() + timedelta(hours=1),
+                                 timezone.now() + timedelta(hours=2))
+        version = get_version(vehicle_scope(self.vehicle.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bulk_transition(Booking.objects.filter(pk=booking.pk), "confirmed")
+                self.assertEqual(get_version(vehicle_scope(self.vehicle.id)), version)
+        self.assertNotEqual(get_version(vehicle_scope(self.vehicle.id)), version)
+
+    def test_filters_are_cached_separately(self):
+        make_vehicle("KL-08-2222", vehicle_type="bike", vehicle_name="Bike Two")
+        cars = self.client.get(reverse("all_vehicles"), {"type": "car"})
+        bikes = self.client.get(reverse("all_vehicles"), {"type": "bike"})
+        self.assertNotContains(cars, "Bike Two")
+        self.assertContains(bikes, "Bike Two")
+
+
+def make_upload(name="car.png", width=800):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (width, width // 2), "red").save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media, WHEELZY_IMAGE_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_same_content_is_stored_once(self):
+        first = make_vehicle("KL-09-1111", image=make_upload("zen.png"))
+        second = make_vehicle("KL-09-2222", image=make_upload("zen_copy.png"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^vehicles/[0-9a-f]{20}\.png$")
+
+    def test_variants_and_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle = make_vehicle("KL-09-3333", image=make_upload(width=800))
+        storage = vehicle.image.storage
+        stem = vehicle.image.name[:-4]
+        self.assertTrue(storage.exists(f"{stem}_320w.webp"))
+        self.assertTrue(storage.exists(f"{stem}_640w.webp"))
+        self.assertTrue(storage.exists(f"{stem}_1024w.webp"))
+        self.assertFalse(storage.exists(f"{stem}_2048w.webp"))
+
+        html = Template(
+            "{% load responsive_images %}{% responsive_image v.image alt='Car' %}"
+        ).render(Context({"v": vehicle}))
+        self.assertIn('loading="lazy"', html)
+        self.assertIn("_320w.webp 320w", html)
+        self.assertIn("_1024w.webp 1024w", html)
+
+    def test_srcset_is_only_remembered_once_generation_finished(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle = make_vehicle("KL-09-4444", image=make_upload(width=800))
+        storage, name = vehicle.image.storage, vehicle.image.name
+        # as if the page rendered while the job had only written 320w
+        for target in (variants_marker(name), variant_name(name, 640), variant_name(name, 1024)):
+            storage.delete(target)
+        self.assertEqual([w for w, _ in available_variants(vehicle.image)], [320])
+        generate_variants(storage, name)
+        self.assertEqual([w for w, _ in available_variants(vehicle.image)], [320, 640, 1024])
+
+        # with the marker in place, later saves never open the original
+        storage.delete(name)
+        vehicle.price_per_hour = 120
+        with self.assertNoLogs("wheelzy_app.images", "WARNING"), self.captureOnCommitCallbacks(execute=True):
+            vehicle.save()
+
+
+class FleetImportExportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="pass")
+        self.owner.groups.add(Group.objects.create(name="owner"))
+        make_vehicle("KL-10-0001")
+        self.client.force_login(self.owner)
+
+    def test_csv_import_validates_rows(self):
+        data = (
+            "vehicle_name,vehicle_type,number_plate,price_per_hour,seats\n"
+            "Swift,car,KL-10-1000,250,\n"
+            "Ntorq,Bike,KL-10-1001,80,\n"
+            "Taken,car,KL-10-0001,100,4\n"
+            "Again,car,KL-10-1000,100,4\n"
+            "Truck,truck,KL-10-1002,100,2\n"
+            "Cheap,car,KL-10-1003,free,4\n"
+        )
+        upload = SimpleUploadedFile("fleet.csv", data.encode(), content_type="text/csv")
+        response = self.client.post(reverse("import_vehicles"), {"file": upload})
+        self.assertEqual(len(response.context["errors"]), 4)
+        swift = Vehicle.objects.get(number_plate="KL-10-1000")
+        self.assertEqual((swift.owner, swift.seats, swift.plate_key), (self.owner, 4, "kl101000"))
+        self.assertEqual(Vehicle.objects.get(number_plate="KL-10-1001").seats, 2)
+        self.assertEqual(Vehicle.objects.filter(owner=self.owner).count(), 2)
+
+    def test_jsonl_import_in_batches(self):
+        lines = "\n".join(
+            json.dumps({
+                "vehicle_name": f"Car {i}", "vehicle_type": "car",
+                "number_plate": f"KL-11-{i:04d}", "price_per_hour": 100,
+            })
+            for i in range(25)
+        )
+        result = import_vehicles(self.owner, BytesIO(lines.encode()), "jsonl", batch_size=10)
+        self.assertEqual((result.created, result.skipped), (25, 0))
+        self.assertEqual(search_ids("kl110024"), [Vehicle.objects.get(number_plate="KL-11-0024").id])
+
+    def test_plate_taken_after_the_check_is_reported(self):
+        # the first check misses KL-10-0001, as it would if another writer
+        # added it in between
+        check = fleet_io._without_taken
+        calls = []
+
+        def racy_check(batch, result):
+            calls.append(batch)
+            return batch if len(calls) == 1 else check(batch, result)
+
+        lines = "\n".join(
+            json.dumps({"vehicle_name": "Car", "vehicle_type": "car", "number_plate": plate, "price_per_hour": 100})
+            for plate in ("KL-10-0001", "KL-10-2000", "KL-10-2001")
+        )
+        fleet_io._without_taken = racy_check
+        try:
+            result = import_vehicles(self.owner, BytesIO(lines.encode()), "jsonl")
+        finally:
+            fleet_io._without_taken = check
+        self.assertEqual((result.created, result.skipped), (2, 1))
+        self.assertEqual(result.errors, ["Line 1: number plate KL-10-0001 already exists"])
+        self.assertEqual(Vehicle.objects.filter(owner=self.owner).count(), 2)
+
+    def test_streaming_exports(self):
+        make_vehicle("KL-12-0001", owner=self.owner, vehicle_name="Mine", latitude=9.5, longitude=76.25)
+        response = self.client.get(reverse("export_vehicles"))
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(body.splitlines(), [
+            "vehicle_name,vehicle_type,number_plate,price_per_hour,seats,latitude,longitude",
+            "Mine,car,KL-12-0001,100,4,9.5,76.25",
+        ])
+        response = self.client.get(reverse("export_bookings"), {"format": "jsonl"})
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-04-1111")
+        cache.clear()
+
+    async def test_vehicle_details_over_asgi(self):
+        # staff, so the response carries Server-Timing
+        await User.objects.filter(pk=self.user.pk).aupdate(is_staff=True)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("vehicle_details", args=[self.vehicle.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.vehicle.vehicle_name)
+        # async ORM queries run in a worker thread and are still counted
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+        missing = await self.async_client.get(reverse("vehicle_details", args=[9999]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_booking_over_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        start = timezone.localtime() + timedelta(days=1)
+        response = await self.async_client.post(reverse("book_vehicle", args=[self.vehicle.id]), {
+            "start_time": f"{start:%Y-%m-%dT%H:%M}",
+            "end_time": f"{start + timedelta(hours=2):%Y-%m-%dT%H:%M}",
+            "idempotency_key": "async-key",
+        })
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        self.assertEqual(await Booking.objects.filter(user=self.user).acount(), 1)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.vehicle = make_vehicle("KL-03-1111", price_per_hour=99)
+        self.start = timezone.now().replace(microsecond=0)
+
+    def test_hourly_price_is_exact(self):
+        end = self.start + timedelta(minutes=20)
+        self.assertEqual(quote(self.vehicle.id, self.start, end), Decimal("33.00"))
+
+    def test_tiers_and_day_rate(self):
+        PriceRule.objects.create(vehicle=self.vehicle, min_hours=6, price_per_hour=Decimal("80"))
+        PriceRule.objects.create(vehicle=self.vehicle, min_hours=24, price_per_day=Decimal("1500"))
+        self.assertEqual(
+            quote(self.vehicle.id, self.start, self.start + timedelta(hours=6)), Decimal("480.00")
+        )
+        # two days at the day rate plus 3 hours at the tier rate
+        end = self.start + timedelta(days=2, hours=3)
+        self.assertEqual(quote(self.vehicle.id, self.start, end), Decimal("3240.00"))
+
+    def test_bookings_are_priced_from_fresh_rows(self):
+        user = User.objects.create_user("customer", password="pass")
+        end = self.start + timedelta(hours=2)
+        self.assertEqual(quote(self.vehicle.id, self.start, end), Decimal("198.00"))
+        # another worker changed the price: no signal reaches this process
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(price_per_hour=120)
+        self.assertEqual(quote(self.vehicle.id, self.start, end), Decimal("198.00"))
+        booking = create_booking(user, self.vehicle.id, self.start + timedelta(hours=1), end + timedelta(hours=1))
+        self.assertEqual(booking.total_price, Decimal("240.00"))
+
+    def test_expired_plans_are_pruned(self):
+        other = make_vehicle("KL-03-2222")
+        quote(self.vehicle.id, self.start, self.start)
+        # nobody asked for this plan since it expired
+        pricing._plans[self.vehicle.id] = (0, pricing._plans[self.vehicle.id][1])
+        pricing._next_prune = 0
+        quote(other.id, self.start, self.start)
+        self.assertNotIn(self.vehicle.id, pricing._plans)
+        self.assertIn(other.id, pricing._plans)
+
+    def test_quote_api_prices_every_vehicle_and_range(self):
+        other = make_vehicle("KL-03-2222", price_per_hour=50)
+        user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(user)
+        ranges = [
+            {"start": self.start.isoformat(), "end": (self.start + timedelta(hours=h)).isoformat()}
+            for h in (1, 2, 3)
+        ]
+        response = self.client.post(
+            reverse("api_quotes"),
+            {"vehicle_ids": [self.vehicle.id, other.id, 9999], "ranges": ranges},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["quotes"]), 6)
+        self.assertEqual(data["missing"], [9999])
+        self.assertEqual(data["quotes"][-1]["total_price"], "150.00")
+
+    def test_quote_many_skips_unknown_vehicles(self):
+        totals = quote_many([self.vehicle.id, 9999], [(self.start, self.start + timedelta(hours=1))])
+        self.assertEqual(totals, {(self.vehicle.id, 0): Decimal("99.00")})
+
+
+class BookingServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-02-1111")
+        self.start = timezone.now() + timedelta(hours=1)
+        self.end = self.start + timedelta(hours=3)
+
+    def test_overlapping_booking_is_rejected(self):
+        create_booking(self.user, self.vehicle.id, self.start, self.end)
+        with self.assertRaises(VehicleUnavailable):
+            create_booking(
+                self.user, self.vehicle.id,
+                self.start + timedelta(hours=1), self.end + timedelta(hours=1)
+            )
+
+    def test_idempotency_key_replays_original_booking(self):
+        first = create_booking(self.user, self.vehicle.id, self.start, self.end, "abc")
+        again = create_booking(self.user, self.vehicle.id, self.start, self.end, "abc")
+        self.assertEqual(first.pk, again.pk)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_key_reused_for_other_vehicle_is_rejected(self):
+        other = make_vehicle("KL-02-2222")
+        create_booking(self.user, self.vehicle.id, self.start, self.end, "abc")
+        with self.assertRaises(BookingError):
+            create_booking(self.user, other.id, self.start, self.end, "abc")
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @override_settings(WHEELZY_MAX_BOOKING_DAYS=30)
+    def test_booking_length_is_capped(self):
+        with self.assertRaises(BookingError):
+            create_booking(self.user, self.vehicle.id, self.start, self.start + timedelta(days=31))
+        create_booking(self.user, self.vehicle.id, self.start, self.start + timedelta(days=30))
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("book_vehicle", args=[self.vehicle.id]), {
+            "start_time": "9999-12-01T00:00", "end_time": "9999-12-31T23:59",
+        })
+        self.assertRedirects(response, reverse("book_vehicle", args=[self.vehicle.id]))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_retried_post_creates_one_booking(self):
+        self.client.force_login(self.user)
+        data = {
+            "start_time": self.start.strftime("%Y-%m-%dT%H:%M"),
+            "end_time": self.end.strftime("%Y-%m-%dT%H:%M"),
+            "idempotency_key": "form-1",
+        }
+        url = reverse("book_vehicle", args=[self.vehicle.id])
+        self.client.post(url, data)
+        self.client.post(url, data)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_malformed_idempotency_key_is_rejected(self):
+        self.client.force_login(self.user)
+        data = {
+            "start_time": self.start.strftime("%Y-%m-%dT%H:%M"),
+            "end_time": self.end.strftime("%Y-%m-%dT%H:%M"),
+        }
+        url = reverse("book_vehicle", args=[self.vehicle.id])
+        for key in ("k" * 65, "two words", "key\u00e9"):
+            self.assertEqual(self.client.post(url, data, HTTP_IDEMPOTENCY_KEY=key).status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="k" * 64).status_code, 302)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 20
+
+    def test_one_winner_under_contention(self):
+        vehicle = make_vehicle("KL-03-1111")
+        users = [
+            User.objects.create(username=f"racer{i}")
+            for i in range(self.THREADS)
+        ]
+        start = timezone.now() + timedelta(hours=1)
+        end = start + timedelta(hours=2)
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def attempt(user):
+            try:
+                barrier.wait()
+                create_booking(user, vehicle.id, start, end)
+                results.append("won")
+            except VehicleUnavailable:
+                results.append("lost")
+            except Exception as exc:
+                results.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(u,)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results.count("won"), 1, results)
+        self.assertEqual(results.count("lost"), self.THREADS - 1, results)
+        self.assertEqual(Booking.objects.filter(vehicle=vehicle).count(), 1)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_metrics(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("home")))
+        self.assertNotIn("Server-Timing", self.client.get(reverse("my_bookings")))
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse("home"))
+        self.assertIn('desc="', response["Server-Timing"])
+        self.assertIn("total;dur=", response["Server-Timing"])
+        self.assertIn("Server-Timing", self.client.get(reverse("my_bookings")))
+
+        metrics = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape")
+        self.assertEqual(metrics.status_code, 403)
+        with override_settings(WHEELZY_METRICS_TOKEN="scrape"):
+            metrics = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape").content.decode()
+        self.assertRegex(metrics, r'wheelzy_requests_total\{view="home"\} [1-9]')
+        self.assertIn('wheelzy_request_latency_seconds{view="home",quantile="0.95"}', metrics)
+
+    def test_metrics_hidden_from_other_clients(self):
+        # not even from 127.0.0.1, which is what a local proxy looks like
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        with override_settings(WHEELZY_METRICS_TOKEN="scrape"):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+        with override_settings(WHEELZY_METRICS_IPS=["127.0.0.1"]):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    @override_settings(WHEELZY_ENFORCE_QUERY_BUDGETS=True, WHEELZY_QUERY_BUDGETS={"home": 0})
+    def test_enforced_budget_raises(self):
+        cache.clear()
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("home"))
+
+    @override_settings(WHEELZY_ENFORCE_QUERY_BUDGETS=True)
+    def test_listing_pages_stay_within_budget(self):
+        owner = User.objects.create_user("owner", password="pass")
+        Group.objects.get_or_create(name=OWNER)[0].user_set.add(owner)
+        vehicles = [make_vehicle(f"KL-09-{i:04}", owner=owner) for i in range(30)]
+        start = timezone.now() + timedelta(days=1)
+        for vehicle in vehicles[:10]:
+            Booking.objects.create(
+                user=self.user, vehicle=vehicle,
+                start_time=start, end_time=start + timedelta(hours=2)
+            )
+        cache.clear()
+        window = f"?start={start:%Y-%m-%dT%H:%M}&end={start + timedelta(hours=3):%Y-%m-%dT%H:%M}"
+        for url in (reverse("home"), reverse("all_vehicles") + window, reverse("my_bookings"), reverse("api_vehicles")):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.force_login(owner)
+        for url in (reverse("owner_vehicle_list"), reverse("owner_vehicle_bookings")):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_booking_str_does_not_fetch_vehicle(self):
+        vehicle = make_vehicle("KL-09-9999")
+        booking = Booking.objects.create(
+            user=self.user, vehicle=vehicle,
+            start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1)
+        )
+        booking = Booking.objects.get(pk=booking.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(booking), f"Booking #{booking.pk} - vehicle #{vehicle.pk}")
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seed_fleet_builds_consistent_data(self):
+        counts = seed_fleet(owners=2, customers=5, vehicles=20, bookings=130, seed=7)
+        self.assertEqual(counts, {"owners": 2, "customers": 5, "vehicles": 20, "bookings": 130})
+        owner = User.objects.get(username="seed_owner_0")
+        self.assertEqual(get_role(owner), OWNER)
+        for vehicle in Vehicle.objects.all():
+            rows = list(vehicle.booking_set.order_by("start_time"))
+            for before, after in zip(rows, rows[1:]):
+                self.assertLessEqual(before.end_time, after.start_time)
+
+    def test_client_benchmark_reports_percentiles(self):
+        seed_fleet(owners=1, customers=2, vehicles=5, bookings=20)
+        customer = User.objects.filter(username__startswith="seed_customer_", bookings__isnull=False).first()
+        owner = User.objects.get(username="seed_owner_0")
+        endpoints = default_endpoints(customer, owner, owner.vehicles.first())
+        results = run_client(endpoints, requests=3, warmup=1)
+        self.assertEqual(set(results), {e.name for e in endpoints})
+        for row in results.values():
+            self.assertEqual(row["errors"], 0)
+            self.assertLessEqual(row["p50"], row["p99"])
+
+    def test_compare_flags_slow_endpoints(self):
+        baseline = {"home": {"p95": 10.0}, "my_bookings": {"p95": 10.0}}
+        results = {"home": {"p95": 12.0}, "my_bookings": {"p95": 20.0}, "new": {"p95": 1.0}}
+        self.assertEqual(compare(results, baseline, tolerance=0.25), [("my_bookings", 10.0, 20.0)])
+
+
+class DatabaseConfigTests(TestCase):
+    def test_sqlite_pragmas_applied_on_connect(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_router_sends_catalogue_reads_to_replica(self):
+        router = CatalogueReplicaRouter()
+        self.assertIsNone(router.db_for_read(Vehicle))
+        # the router only looks the alias up, so no connection is needed
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", "Overriding setting DATABASES", UserWarning)
+            with override_settings(DATABASES={**settings.DATABASES, "replica": {}}):
+                self.assertEqual(router.db_for_read(Vehicle), "replica")
+                self.assertIsNone(router.db_for_read(Booking))
+                vehicle = make_vehicle("KL-06-1111")
+                self.assertEqual(router.db_for_read(Vehicle, instance=vehicle), "default")
+                self.assertEqual(router.db_for_write(Vehicle), "default")
+                self.assertFalse(router.allow_migrate("replica", "wheelzy_app"))
+
+
+class BookingLifecycleTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="pass")
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-07-1111", owner=self.owner)
+        self.now = timezone.now()
+
+    def book(self, start_hours, end_hours, status="pending", vehicle=None):
+        return Booking.objects.create(
+            user=self.user, vehicle=vehicle or self.vehicle, status=status,
+            start_time=self.now + timedelta(hours=start_hours),
+            end_time=self.now + timedelta(hours=end_hours),
+        )
+
+    def test_transitions_are_guarded(self):
+        booking = self.book(1, 2)
+        with self.assertRaises(InvalidTransition):
+            booking.transition_to("in_use")
+        stale = Booking.objects.get(pk=booking.pk)
+        booking.transition_to("confirmed")
+        with self.assertRaises(InvalidTransition):
+            # still thinks the booking is pending
+            stale.transition_to("cancelled")
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, "confirmed")
+
+    def test_scheduler_moves_due_bookings_in_batches(self):
+        stale = self.book(5, 6)
+        Booking.objects.filter(pk=stale.pk).update(ordered_at=self.now - timedelta(days=1))
+        fresh = self.book(8, 9)
+        # short notice: the owner still has the grace period to confirm
+        short_notice = self.book(-0.1, 2, vehicle=make_vehicle("KL-07-5555"))
+        missed = [self.book(-1, 3, vehicle=make_vehicle(f"KL-07-2{i}")) for i in range(3)]
+        started = self.book(-1, 1, status="confirmed", vehicle=make_vehicle("KL-07-3333"))
+        late = self.book(-3, -1, status="in_use", vehicle=make_vehicle("KL-07-4444"))
+
+        counts = run_due_transitions(now=self.now, batch_size=2)
+        self.assertEqual(
+            counts, {"pending->expired": 4, "confirmed->in_use": 1, "in_use->overdue": 1, "refreshed": 0}
+        )
+
+        status = dict(Booking.objects.values_list("pk", "status"))
+        self.assertEqual(status[stale.pk], "expired")
+        self.assertEqual(status[fresh.pk], "pending")
+        self.assertEqual(status[short_notice.pk], "pending")
+        self.assertTrue(all(status[b.pk] == "expired" for b in missed))
+        self.assertEqual(status[started.pk], "in_use")
+        self.assertEqual(status[late.pk], "overdue")
+        self.assertTrue(is_free(self.vehicle, self.now + timedelta(hours=5), self.now + timedelta(hours=6)))
+
+    def test_owner_confirms_and_customer_cancels(self):
+        booking = self.book(1, 2)
+        url = reverse("change_booking_status", args=[booking.pk])
+
+        self.client.force_login(self.user)
+        self.client.post(url, {"status": "confirmed"})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "pending")
+
+        self.client.force_login(self.owner)
+        self.client.post(url, {"status": "confirmed"})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "confirmed")
+
+        self.client.force_login(self.user)
+        self.client.post(url, {"status": "cancelled"})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "cancelled")
+
+
+class CurrentStatusTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-08-1111")
+        self.now = timezone.now()
+
+    def book(self, start_hours, end_hours, status="confirmed"):
+        return Booking.objects.create(
+            user=self.user, vehicle=self.vehicle, status=status,
+            start_time=self.now + timedelta(hours=start_hours),
+            end_time=self.now + timedelta(hours=end_hours),
+        )
+
+    def state(self):
+        return Vehicle.objects.values_list("current_status", "next_free_at").get(pk=self.vehicle.pk)
+
+    def test_columns_follow_booking_writes(self):
+        self.assertEqual(self.state(), ("available", None))
+        first = self.book(-1, 2)
+        chained = self.book(2, 5)
+        self.assertEqual(self.state(), ("reserved", chained.end_time))
+
+        first.transition_to("in_use")
+        self.assertEqual(self.state()[0], "in_use")
+        first.transition_to("returned")
+        chained.transition_to("cancelled")
+        self.assertEqual(self.state(), ("available", None))
+
+    def test_vehicle_edit_keeps_current_status(self):
+        stale = Vehicle.objects.get(pk=self.vehicle.pk)
+        self.book(-1, 2)
+        stale.vehicle_name = "Renamed"
+        stale.save()
+        self.assertEqual(self.state()[0], "reserved")
+
+    def test_available_filter_skips_booking_scan(self):
+        self.book(-1, 2)
+        free = make_vehicle("KL-08-2222")
+        with CaptureQueriesContext(connection) as queries:
+            ids = [v.id for v in vehicle_catalogue({"available": "1"})]
+        self.assertEqual(ids, [free.id])
+        self.assertNotIn("wheelzy_app_booking", queries[0]["sql"])
+
+    def test_checker_and_rebuild(self):
+        booking = self.book(-1, 2)
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(current_status="available", next_free_at=None)
+        self.assertEqual(
+            availability_mismatches(),
+            [(self.vehicle.pk, ("available", None), ("reserved", booking.end_time))],
+        )
+        call_command("rebuild_availability", stdout=StringIO())
+        self.assertEqual(availability_mismatches(), [])
+
+    def test_scheduler_refreshes_bookings_that_started(self):
+        # still pending inside the grace period, so no transition writes it
+        booking = self.book(0.01, 2, status="pending")
+        self.assertEqual(self.state(), ("available", None))
+        counts = run_due_transitions(now=self.now + timedelta(minutes=1))
+        self.assertEqual(counts["refreshed"], 1)
+        self.assertEqual(self.state(), ("reserved", booking.end_time))
+        self.assertEqual(run_due_transitions(now=self.now + timedelta(minutes=2))["refreshed"], 0)
+
+    def test_stored_columns_are_read_from_the_primary(self):
+        booking = self.book(-1, 2)
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(current_status="available", next_free_at=None)
+        # vehicle reads now route to a replica that cannot be reached
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", "Overriding setting DATABASES", UserWarning)
+            with override_settings(DATABASES={**settings.DATABASES, "replica": {}}):
+                self.assertEqual(len(availability_mismatches()), 1)
+                self.assertEqual(refresh_vehicle_status([self.vehicle.pk]), 1)
+        self.assertEqual(self.state(), ("reserved", booking.end_time))
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="pass")
+        self.owner.groups.add(Group.objects.create(name="owner"))
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-09-1111", owner=self.owner)
+        self.day = date(2026, 3, 1)
+
+    def book(self, start, hours, status="confirmed", vehicle=None):
+        start = timezone.make_aware(datetime.combine(self.day, datetime.min.time())) + start
+        return Booking.objects.create(
+            user=self.user, vehicle=vehicle or self.vehicle, status=status,
+            start_time=start, end_time=start + timedelta(hours=hours),
+        )
+
+    def cells(self):
+        return list(
+            DailyVehicleStats.objects.order_by("day").values_list(
+                "day", "bookings", "revenue", "booked_hours", "damage_cost"
+            )
+        )
+
+    def test_rollup_follows_bookings_and_damage(self):
+        # 20:00 to 04:00 the next day at 100/h
+        booking = self.book(timedelta(hours=20), 8, status="pending")
+        self.assertEqual(self.cells(), [])
+        booking.transition_to("confirmed")
+        next_day = self.day + timedelta(days=1)
+        self.assertEqual(self.cells(), [
+            (self.day, 1, Decimal("800.00"), Decimal("4.00"), Decimal("0.00")),
+            (next_day, 0, Decimal("0.00"), Decimal("4.00"), Decimal("0.00")),
+        ])
+
+        DamageReport.objects.create(booking=booking, damage_cost=250)
+        self.assertEqual(self.cells()[1][4], Decimal("250.00"))
+        expected = self.cells()
+        self.assertEqual(rebuild_rollup(), 2)
+        self.assertEqual(self.cells(), expected)
+
+        booking.transition_to("cancelled")
+        self.assertEqual(self.cells(), [(next_day, 0, Decimal("0.00"), Decimal("0.00"), Decimal("250.00"))])
+
+    def test_edits_move_the_rollup(self):
+        booking = self.book(timedelta(hours=10), 2)
+        later = self.day + timedelta(days=5)
+        booking.start_time += timedelta(days=5)
+        booking.end_time += timedelta(days=5)
+        booking.save()
+        self.assertEqual(self.cells(), [(later, 1, Decimal("200.00"), Decimal("2.00"), Decimal("0.00"))])
+
+        other = make_vehicle("KL-09-3333", owner=self.owner)
+        booking.vehicle = other
+        booking.save()
+        self.assertEqual(
+            list(DailyVehicleStats.objects.values_list("vehicle_id", "day", "bookings")), [(other.pk, later, 1)]
+        )
+
+    def test_owner_endpoints(self):
+        self.book(timedelta(hours=10), 2)
+        self.book(timedelta(days=40), 3)
+        other = make_vehicle("KL-09-2222", owner=User.objects.create_user("other"))
+        self.book(timedelta(hours=10), 5, vehicle=other)
+        self.client.force_login(self.owner)
+
+        response = self.client.get(
+            reverse("owner_analytics_daily"), {"from": "2026-03-01", "to": "2026-03-03"}
+        )
+        data = response.json()
+        self.assertEqual(data["labels"], ["2026-03-01", "2026-03-02", "2026-03-03"])
+        self.assertEqual(data["series"]["revenue"], [200.0, 0, 0])
+        self.assertEqual(data["totals"]["booked_hours"], 2.0)
+
+        monthly = self.client.get(
+            reverse("owner_analytics_daily"), {"from": "2026-03-01", "to": "2026-04-30", "group": "month"}
+        ).json()
+        self.assertEqual(monthly["labels"], ["2026-03-01", "2026-04-01"])
+        self.assertEqual(monthly["series"]["bookings"], [1, 1])
+
+        vehicles = self.client.get(
+            reverse("owner_analytics_vehicles"), {"from": "2026-03-01", "to": "2026-03-01"}
+        ).json()["vehicles"]
+        self.assertEqual([v["vehicle_id"] for v in vehicles], [self.vehicle.pk])
+        self.assertEqual(vehicles[0]["utilization"], round(2 * 100 / 24, 1))
+
+        bad = self.client.get(reverse("owner_analytics_daily"), {"from": "2026-03-05", "to": "2026-03-01"})
+        self.assertEqual(bad.status_code, 400)
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+
+    def test_geohash_encoding(self):
+        self.assertEqual(encode(57.64911, 10.40744), "u4pruydqq")
+        vehicle = make_vehicle("KL-10-1111", latitude=57.64911, longitude=10.40744)
+        self.assertEqual(vehicle.geohash, "u4pruydqq")
+
+    def test_near_filter_returns_nearest_first(self):
+        far = make_vehicle("KL-10-0001", latitude=10.4, longitude=76.27)
+        near = make_vehicle("KL-10-0002", latitude=9.96, longitude=76.28)
+        here = make_vehicle("KL-10-0003", latitude=9.9312, longitude=76.2673)
+        make_vehicle("KL-10-0004")
+
+        vehicles = list(vehicle_catalogue({"near": "9.9312,76.2673", "radius": "10"}).order_by("distance"))
+        self.assertEqual([v.id for v in vehicles], [here.id, near.id])
+        self.assertAlmostEqual(vehicles[1].distance, distance_km(9.9312, 76.2673, 9.96, 76.28), places=6)
+        self.assertNotIn(far.id, [v.id for v in vehicle_catalogue({"near": "9.9312,76.2673"})])
+        # malformed points are ignored rather than failing the page
+        self.assertEqual(vehicle_catalogue({"near": "north"}).count(), 4)
+
+    def test_distance_pages_break_ties(self):
+        depot = [make_vehicle(f"KL-10-2{i}", latitude=9.95, longitude=76.3) for i in range(3)]
+        closer = make_vehicle("KL-10-3000", latitude=9.94, longitude=76.3)
+        params = {"near": "9.93,76.3"}
+        queryset = vehicle_catalogue(params)
+        self.assertEqual(catalogue_order(params), "distance")
+
+        seen, after = [], None
+        while True:
+            page, after = keyset_page(queryset, after=after, size=2, key="distance")
+            seen += [v.id for v in page]
+            if after is None:
+                break
+        self.assertEqual(seen, [closer.id] + [v.id for v in depot])
+
+    def test_search_across_the_antimeridian(self):
+        vehicle = make_vehicle("KL-10-4000", latitude=0.0, longitude=-179.99)
+        ids = [v.id for v in vehicle_catalogue({"near": "0,179.99", "radius": "5"})]
+        self.assertEqual(ids, [vehicle.id])
+
+    def test_api_reports_distance(self):
+        make_vehicle("KL-10-5000", latitude=9.94, longitude=76.27)
+        self.client.force_login(self.user)
+        data = self.client.get(reverse("api_vehicles"), {"near": "9.9312,76.2673"}).json()
+        self.assertEqual(len(data["results"]), 1)
+        self.assertEqual(
+            data["results"][0]["distance_km"], round(distance_km(9.9312, 76.2673, 9.94, 76.27), 2)
+        )
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.media = tempfile.mkdtemp()
+        override = override_settings(STATIC_ROOT=self.static, MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.static)
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        storage = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "wheelzy_app.static_files.CompressedManifestStaticFilesStorage"},
+        }
+        with override_settings(STORAGES=storage):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            url = Template("{% load static %}{% static 'css/home.css' %}").render(Context())
+        self.assertRegex(url, r"^/static/css/home\.[0-9a-f]{12}\.css$")
+        name = url[len("/static/"):]
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        with open(f"{self.static}/{name}", "rb") as f:
+            self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), f.read())
+
+        again = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        plain = self.client.get("/static/css/home.css")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("must-revalidate", plain["Cache-Control"])
+
+    def test_media_ranges_and_sendfile(self):
+        os.makedirs(f"{self.media}/vehicles")
+        name = "vehicles/" + "a" * 20 + ".png"
+        with open(f"{self.media}/{name}", "wb") as f:
+            f.write(bytes(range(100)))
+
+        response = self.client.get(f"/media/{name}", HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+        self.assertIn("immutable", response["Cache-Control"])
+        tail = self.client.get(f"/media/{name}", HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(tail.streaming_content), bytes(range(95, 100)))
+        self.assertEqual(self.client.get(f"/media/{name}", HTTP_RANGE="bytes=200-").status_code, 416)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+
+        with override_settings(WHEELZY_SENDFILE="x-accel-redirect", WHEELZY_SENDFILE_PREFIX="/protected/"):
+            response = self.client.get(f"/media/{name}")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{name}")
+        self.assertEqual(response.content, b"")
+
+
+@override_settings(AUTHENTICATION_BACKENDS=["wheelzy_app.auth.CachedModelBackend"])
+class AuthHotPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("customer", password="pass")
+
+    def test_authenticated_requests_skip_user_and_session_tables(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("my_bookings"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("my_bookings"))
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            self.assertNotIn("auth_user", query["sql"])
+            self.assertNotIn("django_session", query["sql"])
+
+    def test_cached_user_follows_profile_and_password_changes(self):
+        self.assertFalse(hasattr(load_user(self.user.pk), "profile"))
+        self.assertFalse(hasattr(load_user(self.user.pk), "profile"))
+        UserProfile.objects.create(user=self.user, phone_number="123", address="Kochi")
+        with self.assertNumQueries(1):
+            self.assertEqual(load_user(self.user.pk).profile.phone_number, "123")
+        with self.assertNumQueries(0):
+            cached = load_user(self.user.pk)
+            self.assertEqual((cached.username, cached.profile.address), ("customer", "Kochi"))
+            self.assertEqual(cached.get_session_auth_hash(), self.user.get_session_auth_hash())
+        # no password hash in the cache; saving the cached user keeps it
+        self.assertNotIn(self.user.password, repr(cache.get(f"authuser:{self.user.pk}")))
+        cached.first_name = "Asha"
+        cached.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password("pass"))
+
+        self.client.force_login(self.user)
+        self.user.set_password("changed")
+        self.user.save()
+        # the session hash no longer matches, so the old session is gone
+        response = self.client.get(reverse("my_bookings"))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(capacity=2, rate=0.5, max_keys=2)
+        self.assertEqual(bucket.take("a", now=0), 0)
+        self.assertEqual(bucket.take("a", now=0), 0)
+        self.assertEqual(bucket.take("a", now=0), 2)
+        self.assertEqual(bucket.take("a", now=2), 0)
+        bucket.take("b", now=2)
+        bucket.take("c", now=2)
+        # "a" was evicted and starts full again
+        self.assertEqual(bucket.take("a", now=2), 0)
+
+    @override_settings(WHEELZY_LOGIN_RATES={"ip": (100, 60), "username": (2, 60)})
+    def test_login_is_throttled_before_hashing(self):
+        form = {"username": "Customer", "password": "wrong", "role": "customer"}
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse("login"), form).status_code, 302)
+        response = self.client.post(reverse("login"), {**form, "password": "pass"})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response["Retry-After"]), range(1, 31))
+        # another account from the same address is unaffected, and so is
+        # this account from another address
+        other = {**form, "username": "someone-else"}
+        self.assertEqual(self.client.post(reverse("login"), other).status_code, 302)
+        self.assertEqual(self.client.post(reverse("login"), form, REMOTE_ADDR="10.0.0.2").status_code, 302)
+
+    @override_settings(
+        WHEELZY_LOGIN_RATES={"ip": (2, 60), "username": (100, 60)}, WHEELZY_CLIENT_IP_HEADER="HTTP_X_FORWARDED_FOR"
+    )
+    def test_login_throttle_behind_a_proxy(self):
+        form = {"username": "customer", "password": "wrong", "role": "customer"}
+
+        def attempt(forwarded):
+            # every request reaches the app from the proxy on localhost
+            return self.client.post(
+                reverse("login"), form, REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR=forwarded
+            ).status_code
+
+        self.assertEqual([attempt("10.0.0.1") for _ in range(3)], [302, 302, 429])
+        self.assertEqual(attempt("10.0.0.2"), 302)
+        # a forged first entry does not buy a fresh bucket
+        self.assertEqual(attempt("192.0.2.7, 10.0.0.1"), 429)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("root", password="pass")
+        self.client.force_login(self.admin)
+        self.client.get(reverse("admin:index"))
+        self.customer = User.objects.create_user("customer", password="pass")
+        self.now = timezone.now()
+
+    def add_bookings(self, count, offset=0):
+        bookings = []
+        for i in range(offset, offset + count):
+            vehicle = make_vehicle(f"KL-13-{i:04d}")
+            booking = Booking.objects.create(
+                user=self.customer, vehicle=vehicle,
+                start_time=self.now + timedelta(hours=1), end_time=self.now + timedelta(hours=3),
+            )
+            DamageReport.objects.create(booking=booking, damage_cost=10)
+            bookings.append(booking)
+        return bookings
+
+    def changelist_queries(self, model):
+        url = reverse(f"admin:wheelzy_app_{model}_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        self.add_bookings(2)
+        small = [self.changelist_queries(m) for m in ("booking", "damagereport", "vehicle")]
+        self.add_bookings(10, offset=2)
+        self.assertEqual([self.changelist_queries(m) for m in ("booking", "damagereport", "vehicle")], small)
+        booking = Booking.objects.first()
+        for page in ("booking", "vehicle"):
+            obj = booking if page == "booking" else booking.vehicle
+            url = reverse(f"admin:wheelzy_app_{page}_change", args=[obj.pk])
+            self.assertEqual(self.client.get(url).status_code, 200)
+        search = self.client.get(reverse("admin:wheelzy_app_vehicle_changelist"), {"q": "KL-13-0003"})
+        self.assertEqual(search.context["cl"].result_count, 1)
+
+    def test_bulk_actions_move_allowed_bookings_only(self):
+        pending, other = self.add_bookings(2)
+        other.transition_to("confirmed")
+        response = self.client.post(reverse("admin:wheelzy_app_booking_changelist"), {
+            "action": "expire_bookings",
+            "_selected_action": [pending.pk, other.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        status = dict(Booking.objects.values_list("pk", "status"))
+        self.assertEqual(status, {pending.pk: "expired", other.pk: "confirmed"})
+        self.assertEqual(
+            Vehicle.objects.get(pk=pending.vehicle_id).current_status, "available"
+        )
+
+    def change_booking(self, booking, **changes):
+        url = reverse("admin:wheelzy_app_booking_change", args=[booking.pk])
+        data = {
+            "user": booking.user_id, "vehicle": booking.vehicle_id, "security_deposit": booking.security_deposit,
+        }
+        for name in ("start_time", "end_time"):
+            value = timezone.localtime(changes.pop(name, getattr(booking, name)))
+            data[f"{name}_0"], data[f"{name}_1"] = value.date().isoformat(), value.time().isoformat()
+        data.update(changes)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_moving_a_booking_frees_the_old_vehicle(self):
+        booking = Booking.objects.create(
+            user=self.customer, vehicle=make_vehicle("KL-13-0001"), status="confirmed",
+            start_time=self.now - timedelta(hours=1), end_time=self.now + timedelta(hours=3),
+        )
+        spare = make_vehicle("KL-13-0002")
+        old = booking.vehicle_id
+        self.assertEqual(Vehicle.objects.get(pk=old).current_status, "reserved")
+
+        self.change_booking(booking, vehicle=spare.pk)
+        status = dict(Vehicle.objects.values_list("pk", "current_status"))
+        self.assertEqual(status, {old: "available", spare.pk: "reserved"})
+
+    def test_change_form_leaves_status_alone(self):
+        booking, = self.add_bookings(1)
+        self.change_booking(booking, status="returned")
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, "pending")
+
+    def test_large_counts_are_estimated(self):
+        self.add_bookings(3)
+        queryset = Booking.objects.order_by("pk")
+        paginator = type("Small", (EstimatedCountPaginator,), {"count_limit": 2})
+        self.assertEqual(paginator(queryset, 50).count, Booking.objects.latest("pk").pk)
+        self.assertEqual(paginator(queryset.filter(status="pending"), 50).count, 2)
+        self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 3)
+
+
+class LiveAvailabilityTests(TestCase):
+    def setUp(self):
+        reset_broker()
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-14-0001")
+
+    async def next_event(self, subscription):
+        return await asyncio.wait_for(subscription.get(), 1)
+
+    async def test_broker_fans_out_across_threads_and_replays(self):
+        broker = get_broker()
+        first = broker.subscribe([AVAILABILITY])
+        second = broker.subscribe([AVAILABILITY])
+        # sync views publish from worker threads
+        thread = threading.Thread(target=broker.publish, args=(AVAILABILITY, {"vehicle_id": 1}))
+        thread.start()
+        thread.join()
+        for subscription in (first, second):
+            self.assertEqual(await self.next_event(subscription), (1, AVAILABILITY, {"vehicle_id": 1}))
+        first.close()
+        broker.publish(AVAILABILITY, {"vehicle_id": 2})
+        self.assertEqual(broker.subscriber_count, 1)
+
+        # a reconnecting client gets what it missed, or a reset if that is gone
+        replay = broker.subscribe([AVAILABILITY], last_id=1)
+        self.assertEqual((await self.next_event(replay))[0], 2)
+        gone = broker.subscribe([AVAILABILITY], last_id=99)
+        self.assertEqual((await self.next_event(gone))[1], RESET)
+
+    async def test_booking_writes_publish_deltas_after_commit(self):
+        subscription = get_broker().subscribe([AVAILABILITY])
+        now = timezone.now()
+
+        def book():
+            with self.captureOnCommitCallbacks(execute=True):
+                booking = Booking.objects.create(
+                    user=self.user, vehicle=self.vehicle, status="confirmed",
+                    start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=2),
+                )
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.transition_to("cancelled")
+
+        await sync_to_async(book)()
+        _, topic, delta = await self.next_event(subscription)
+        self.assertEqual((topic, delta["vehicle_id"], delta["status"]), (AVAILABILITY, self.vehicle.pk, "reserved"))
+        self.assertEqual(delta["next_free_at"], (now + timedelta(hours=2)).isoformat())
+        self.assertEqual((await self.next_event(subscription))[2]["status"], "available")
+
+    async def test_stream_sends_matching_vehicles(self):
+        response = await self.async_client.get(
+            reverse("availability_events"), {"ids": f"{self.vehicle.pk},x"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        chunks = response.streaming_content
+        self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+        broker = get_broker()
+        broker.publish(AVAILABILITY, {"vehicle_id": self.vehicle.pk + 1, "status": "reserved"})
+        broker.publish(AVAILABILITY, {"vehicle_id": self.vehicle.pk, "status": "reserved"})
+        message = (await asyncio.wait_for(anext(chunks), 1)).decode()
+        self.assertEqual(message.splitlines()[:2], ["id: 2", "event: availability"])
+        self.assertEqual(json.loads(message.splitlines()[2][6:])["vehicle_id"], self.vehicle.pk)
+        await chunks.aclose()
+
+    def test_stream_needs_asgi(self):
+        response = self.client.get(reverse("availability_events"))
+        self.assertEqual(response.status_code, 204)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="pass")
+        self.owner.groups.add(Group.objects.create(name="owner"))
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-15-0001", owner=self.owner)
+        self.now = timezone.now()
+
+    def book(self, days_ago, status="returned"):
+        start = self.now - timedelta(days=days_ago, hours=3)
+        return Booking.objects.create(
+            user=self.user, vehicle=self.vehicle, status=status,
+            start_time=start, end_time=start + timedelta(hours=2),
+        )
+
+    def cells(self):
+        return list(DailyVehicleStats.objects.order_by("day").values_list("day", "revenue", "damage_cost"))
+
+    def test_finished_bookings_move_with_their_damage_reports(self):
+        old = self.book(120)
+        DamageReport.objects.create(booking=old, damage_cost=300)
+        IdempotencyKey.objects.create(user=self.user, key="k", booking=old)
+        kept = [self.book(120, "confirmed"), self.book(10, "cancelled")]
+        rollup = self.cells()
+
+        out = StringIO()
+        call_command("archive_bookings", days=90, batch_size=1, stdout=out)
+        self.assertIn("Archived 1 bookings", out.getvalue())
+        self.assertEqual(set(Booking.objects.values_list("pk", flat=True)), {b.pk for b in kept})
+        archived = ArchivedBooking.objects.get()
+        self.assertEqual((archived.pk, archived.total_price, archived.ordered_at), (old.pk, old.total_price, old.ordered_at))
+        self.assertEqual(ArchivedDamageReport.objects.get().booking_id, old.pk)
+        self.assertFalse(DamageReport.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # the rollup, rebuilt or not, still counts the archived booking
+        self.assertEqual(self.cells(), rollup)
+        rebuild_rollup()
+        self.assertEqual(self.cells(), rollup)
+        self.client.force_login(self.owner)
+        export = b"".join(self.client.get(reverse("export_bookings")).streaming_content).decode()
+        self.assertEqual(len(export.strip().splitlines()), 4)
+
+    def test_history_pages_through_both_tables(self):
+        bookings = [self.book(days) for days in (50, 40, 30, 20, 10)]
+        call_command("archive_bookings", days=25, stdout=StringIO())
+        self.assertEqual(ArchivedBooking.objects.count(), 3)
+
+        ids = [b.pk for b in reversed(bookings)]
+        page, older = booking_history({"user": self.user}, size=2)
+        self.assertEqual([b.pk for b in page], ids[:2])
+        page, older = booking_history({"user": self.user}, before=older, size=2)
+        self.assertEqual([b.pk for b in page], ids[2:4])
+        page, older = booking_history({"user": self.user}, before=older, size=2)
+        self.assertEqual(([b.pk for b in page], older), (ids[4:], None))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my_bookings"))
+        self.assertEqual([b.pk for b in response.context["bookings"]], ids)
+        self.assertIsNone(response.context["older"])
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("owner_vehicle_bookings"), {"before": ids[1]})
+        self.assertEqual([b.pk for b in response.context["bookings"]], ids[2:])
+
+
+class OccupancyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-16-0001")
+        self.march = date(2030, 3, 1)
+
+    def at(self, day, hour=0, minute=0):
+        return timezone.make_aware(datetime(2030, 3, day, hour, minute))
+
+    def book(self, start, end, status="confirmed", vehicle=None):
+        return Booking.objects.create(
+            user=self.user, vehicle=vehicle or self.vehicle, status=status, start_time=start, end_time=end,
+        )
+
+    def bitmaps(self):
+        return {
+            month: unpack(hours)
+            for month, hours in VehicleOccupancy.objects.filter(vehicle=self.vehicle).values_list("month", "hours")
+        }
+
+    def test_bitmaps_follow_bookings(self):
+        # 22:30 on the 31st to 02:00 on 1 April: hours 742-743, then 0-1
+        booking = self.book(self.at(31, 22, 30), self.at(31, 22) + timedelta(hours=4))
+        self.book(self.at(2, 1), self.at(2, 3), status="pending")
+        self.book(self.at(5), self.at(6), status="cancelled")
+        march_bits = (0b11 << 742) | (0b11 << 25)
+        self.assertEqual(self.bitmaps(), {self.march: march_bits, date(2030, 4, 1): 0b11})
+        self.assertEqual(month_hours(self.march), 744)
+
+        incremental = self.bitmaps()
+        VehicleOccupancy.objects.all().delete()
+        rebuild_occupancy()
+        self.assertEqual(self.bitmaps(), incremental)
+
+        booking.transition_to("cancelled")
+        self.assertEqual(self.bitmaps(), {self.march: 0b11 << 25})
+
+    def test_edits_clear_the_old_span(self):
+        booking = self.book(self.at(2, 1), self.at(2, 3))
+        # moved to 1 April, 01:00-02:00
+        booking.start_time, booking.end_time = self.at(31, 1) + timedelta(days=1), self.at(31, 2) + timedelta(days=1)
+        booking.save()
+        self.assertEqual(self.bitmaps(), {date(2030, 4, 1): 1 << 1})
+
+        booking.vehicle = make_vehicle("KL-16-0009")
+        booking.save()
+        self.assertEqual(self.bitmaps(), {})
+
+    def test_fleet_questions_are_bitwise(self):
+        # 2 March 2030 is a Saturday
+        weekend_car = make_vehicle("KL-16-0002")
+        self.book(self.at(2, 10), self.at(2, 12), vehicle=weekend_car)
+        self.book(self.at(6, 10), self.at(6, 12))
+        ids = [self.vehicle.pk, weekend_car.pk, make_vehicle("KL-16-0003").pk]
+        self.assertEqual(free_during(ids, self.march, weekend_mask(self.march)), [self.vehicle.pk, ids[2]])
+
+        mask = weekend_mask(self.march)
+        self.assertEqual(bin(mask).count("1"), 10 * 24)
+        bitmaps = [unpack(h) for h in VehicleOccupancy.objects.values_list("hours", flat=True)]
+        self.assertEqual(bin(booked_by_any(bitmaps)).count("1"), 4)
+        self.assertEqual(booked_by_all(bitmaps), 0)
+
+    def test_refresh_stays_inside_the_horizon(self):
+        # written straight to the table, as old data or the admin could
+        today = date(2026, 10, 18)
+        start = timezone.make_aware(datetime(1900, 1, 1))
+        end = timezone.make_aware(datetime(9999, 12, 31))
+        self.assertEqual(len(list(months_between(start, end, horizon(today)))), 2 * HORIZON_MONTHS + 1)
+        # pending, so the rollup stays out of it
+        self.book(start, end, status="pending")
+        self.assertEqual(VehicleOccupancy.objects.count(), 2 * HORIZON_MONTHS + 1)
+        self.assertEqual(rebuild_occupancy(), 2 * HORIZON_MONTHS + 1)
+        with self.assertRaises(OccupancyError):
+            parse_month("9999-12", today)
+
+    def test_calendar_api(self):
+        self.book(self.at(1, 5), self.at(1, 7, 30))
+        self.client.force_login(self.user)
+        url = reverse("api_vehicle_calendar", args=[self.vehicle.pk])
+        data = self.client.get(url, {"month": "2030-03"}).json()
+        self.assertEqual((data["month"], data["hours"], data["bit_order"]), ("2030-03", 744, "little"))
+        bitmap = base64.b64decode(data["bitmap"])
+        self.assertEqual(len(bitmap), 93)
+        self.assertEqual(int.from_bytes(bitmap, "little"), 0b111 << 5)
+
+        empty = base64.b64decode(self.client.get(url, {"month": "2030-04"}).json()["bitmap"])
+        self.assertEqual(empty, bytes(90))
+        self.assertEqual(self.client.get(url, {"month": "March"}).status_code, 400)
+        missing = reverse("api_vehicle_calendar", args=[self.vehicle.pk + 100])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("customer", password="pass")
+        self.vehicle = make_vehicle("KL-17-0001")
+        self.now = timezone.now()
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                user=self.user, vehicle=self.vehicle, status="confirmed",
+                start_time=self.now - timedelta(hours=1), end_time=self.now + timedelta(hours=1),
+            )
+
+    # with the user cached too, as in deployments sharing the cache
+    @override_settings(AUTHENTICATION_BACKENDS=["wheelzy_app.auth.CachedModelBackend"])
+    def test_pages_answer_304_without_queries(self):
+        self.client.force_login(self.user)
+        for url in (reverse("home"), reverse("all_vehicles"), reverse("vehicle_details", args=[self.vehicle.pk])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("no-cache", response["Cache-Control"])
+            with self.assertNumQueries(0):
+                again = self.revalidate(url, response)
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again["ETag"], response["ETag"])
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(since.status_code, 304)
+
+        detail = reverse("vehicle_details", args=[self.vehicle.pk])
+        before = self.client.get(detail)
+        self.book()
+        after = self.revalidate(detail, before)
+        self.assertEqual(after.status_code, 200)
+        self.assertContains(after, "Unavailable")
+        self.assertEqual(self.client.get(reverse("vehicle_details", args=[999])).status_code, 404)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+    def test_pages_render_with_the_cache_disabled(self):
+        # nothing cached, so the async views load the user themselves
+        self.client.force_login(self.user)
+        for url in (reverse("home"), reverse("all_vehicles"), reverse("vehicle_details", args=[self.vehicle.pk])):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_api_responses_are_conditional(self):
+        self.client.force_login(self.user)
+        listing = self.client.get(reverse("api_vehicles"))
+        self.assertEqual(self.revalidate(reverse("api_vehicles"), listing).status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse("api_vehicles"), {"type": "bike"}, HTTP_IF_NONE_MATCH=listing["ETag"]).status_code,
+            200,
+        )
+
+        url = reverse("api_vehicle_calendar", args=[self.vehicle.pk])
+        month = f"{timezone.localdate():%Y-%m}"
+        calendar = self.client.get(url, {"month": month})
+        self.assertEqual(self.revalidate(url, calendar, month=month).status_code, 304)
+        self.book()
+        changed = self.revalidate(url, calendar, month=month)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], calendar["ETag"])
+
+    def test_updated_at_follows_writes_that_skip_save(self):
+        booking = self.book()
+        vehicle_changed_at = Vehicle.objects.get(pk=self.vehicle.pk).updated_at
+        self.assertGreaterEqual(vehicle_changed_at, booking.updated_at)
+        booking.transition_to("cancelled")
+        booking.refresh_from_db()
+        self.assertGreater(booking.updated_at, booking.ordered_at)
+        self.assertGreater(Vehicle.objects.get(pk=self.vehicle.pk).updated_at, vehicle_changed_at)
+
+    def test_validators_expire_with_the_fragment_cache(self):
+        etag, last_modified = validators(["v1"], now=1000)
+        self.assertEqual(validators(["v1"], now=1010), (etag, last_modified))
+        self.assertNotEqual(validators(["v1"], now=1000 + 60)[0], etag)
+        self.assertNotEqual(validators(["v2"], now=1000)[0], etag)
+        changed = datetime.fromtimestamp(1030).astimezone()
+        self.assertEqual(validators(["v1"], changed, now=1035)[1], 1030)
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TokenBucket:
+    # In-process token buckets, one per key: each holds up to `capacity`
+    # tokens and regains `rate` per second. Only the most recently used
+    # `max_keys` keys are kept, so a flood of new keys cannot eat memory.
+    def __init__(self, capacity, rate, max_keys=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        # 0 when a token was taken, otherwise seconds until one is free
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def _bucket(name):
+    capacity, per_seconds = settings.WHEELZY_LOGIN_RATES[name]
+    return TokenBucket(capacity, capacity / per_seconds)
+
+
+_login_buckets = {}
+_setup_lock = threading.Lock()
+
+
+def login_buckets():
+    with _setup_lock:
+        if not _login_buckets:
+            _login_buckets.update({name: _bucket(name) for name in settings.WHEELZY_LOGIN_RATES})
+    return _login_buckets
+
+
+def reset_login_buckets():
+    with _setup_lock:
+        _login_buckets.clear()
+
+
+def client_ip(request):
+    # the proxy appends the address it saw, so earlier entries in the
+    # header are whatever the client chose to send
+    header = settings.WHEELZY_CLIENT_IP_HEADER
+    forwarded = request.META.get(header, "") if header else ""
+    ip = forwarded.rsplit(",", 1)[-1].strip()
+    return ip or request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def login_retry_after(request, username):
+    # Charges one login attempt against the client address and against the
+    # username tried from it; returns how many seconds to wait if either is
+    # used up. Runs before authenticate(), so throttled attempts never reach
+    # the hasher.
+    ip = client_ip(request)
+    keys = {
+        "ip": ip,
+        "username": (ip, (username or "").strip().lower()),
+    }
+    wait = 0
+    for name, bucket in login_buckets().items():
+        wait = max(wait, bucket.take(keys[name]))
+    return wait
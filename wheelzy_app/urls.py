@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api, static_files
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -19,6 +19,19 @@ urlpatterns = [
     path("owner_vehicle_list/", views.owner_vehicles, name="owner_vehicle_list"),
     path("my_bookings/", views.my_bookings, name="my_bookings"),
     path("owner_vehicle_bookings/", views.owner_bookings, name="owner_vehicle_bookings"),
+    path("booking/<int:booking_id>/status/", views.change_booking_status, name="change_booking_status"),
+    path("owner/import/", views.import_fleet, name="import_vehicles"),
+    path("owner/export/vehicles/", views.export_fleet, name="export_vehicles"),
+    path("owner/export/bookings/", views.export_fleet_bookings, name="export_bookings"),
+    path("owner/analytics/daily/", views.owner_analytics_daily, name="owner_analytics_daily"),
+    path("owner/analytics/vehicles/", views.owner_analytics_vehicles, name="owner_analytics_vehicles"),
+    path("admin_dashboard/analytics/", views.admin_analytics, name="admin_analytics"),
+    path("cache_stats/", views.cache_stats_view, name="cache_stats"),
+    path("metrics", views.metrics, name="metrics"),
+    path("events/availability/", views.availability_events, name="availability_events"),
+    path("api/vehicles/", api.VehicleListAPI.as_view(), name="api_vehicles"),
+    path("api/quotes/", api.QuoteAPI.as_view(), name="api_quotes"),
+    path("api/vehicles/<int:vehicle_id>/calendar/", api.VehicleCalendarAPI.as_view(), name="api_vehicle_calendar"),
     
 
     # path('payment_page/', views.vehicle_details, name="payment_page"),
@@ -26,4 +39,6 @@ urlpatterns = [
 
 
 if settings.DEBUG:  
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+elif settings.WHEELZY_SERVE_FILES:
+    urlpatterns += static_files.urlpatterns()
\ No newline at end of file
@@ -1,13 +1,48 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import asyncio
+import math
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
-from .models import Vehicle, Booking, DamageReport, UserProfile
-from datetime import datetime
+from .models import (
+    ArchivedDamageReport, Vehicle, Booking, DailyVehicleStats, DamageReport, InvalidTransition,
+    UserProfile,
+)
+from .analytics import (
+    AnalyticsError, date_range, owner_breakdown, time_series, vehicle_breakdown,
+)
+from .archive import booking_history
+from .availability import ais_free
+from .bookings import BookingError, VehicleUnavailable, create_booking, valid_idempotency_key
+from .roles import ADMIN, OWNER, get_role, role_required
+from .throttling import client_ip, login_retry_after
+from .fleet_io import export_bookings, export_vehicles, import_vehicles
+from .geo import parse_point
+from .pricing import quote_many
+from .profiling import prometheus_text
+from .events import AVAILABILITY, format_event, get_broker
+from .caching import CATALOGUE, acached_fragment, aget_version, cache_stats, vehicle_scope
+from .conditional import achanged_at, afleet_changed_at, not_modified, set_validators, validators
+from .catalogue import (
+    LIST_FIELDS, akeyset_page, catalogue_order, parse_datetime_input, requested_window,
+    vehicle_catalogue,
+)
+import uuid
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
+SSE_HEARTBEAT = 15
+SSE_RETRY_SECONDS = 5
+MAX_STREAM_IDS = 200
+
 
 def register(request):
     if request.method == "POST":
@@ -59,14 +94,22 @@ def login_view(request):
         username = request.POST.get("username")
         password = request.POST.get("password")
         selected_role = request.POST.get("role") 
+        retry_after = login_retry_after(request, username)
+        if retry_after:
+            messages.error(request, "Too many login attempts. Please try again shortly.")
+            response = render(request, "login.html", status=429)
+            response["Retry-After"] = math.ceil(retry_after)
+            return response
         user = authenticate(request, username=username, password=password)
 
         if user is None:
             messages.error(request, "Invalid username or password")
             return redirect("login")
 
+        role = get_role(user)
+
         if selected_role == "admin":
-            if not user.is_superuser:
+            if role != ADMIN:
                 messages.error(request, "You are not an admin")
                 return redirect("login")
 
@@ -74,7 +117,7 @@ def login_view(request):
             return redirect("admin_dashboard")
 
         if selected_role == "owner":
-            if not user.groups.filter(name="owner").exists():
+            if role != OWNER:
                 messages.error(request, "You are not registered as an owner")
                 return redirect("login")
 
@@ -82,7 +125,7 @@ def login_view(request):
             return redirect("owner_dashboard")
 
         if selected_role == "customer":
-            if user.is_superuser or user.groups.filter(name="owner").exists():
+            if role in (ADMIN, OWNER):
                 messages.error(request, "Please login using the correct role")
                 return redirect("login")
 
@@ -99,128 +142,296 @@ def logout_view(request):
     logout(request)
     return redirect("login")
 
-@login_required
+@role_required(OWNER, message=None)
 def owner_dashboard(request):
-    if not request.user.groups.filter(name="owner").exists():
-        return redirect("home")
     return render(request, "owner_dashboard.html")
 
 @login_required
 def admin_dashboard(request):
     return render(request, "admin_dashboard.html")
 
-
-def home(request):
-    vehicles = Vehicle.objects.all()
-
-    active_bookings = Booking.objects.filter(
-        status__in=["pending", "confirmed", "in_use"]
-    ).values_list("vehicle_id", flat=True)
-
-    return render(request, "home.html", {
-        "vehicles": vehicles,
-        "booked_vehicle_ids": active_bookings
-    })
+# chart data for the dashboards, read from the daily rollup
+@role_required(OWNER, message=None)
+def owner_analytics_daily(request):
+    try:
+        first, last, group = date_range(request.GET)
+    except AnalyticsError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    stats = DailyVehicleStats.objects.filter(owner=request.user)
+    vehicle_id = request.GET.get("vehicle")
+    if vehicle_id:
+        if not vehicle_id.isdigit():
+            return JsonResponse({"error": "vehicle must be an id"}, status=400)
+        stats = stats.filter(vehicle_id=vehicle_id)
+    return JsonResponse(time_series(stats, first, last, group))
+
+@role_required(OWNER, message=None)
+def owner_analytics_vehicles(request):
+    try:
+        first, last, _ = date_range(request.GET)
+    except AnalyticsError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse(vehicle_breakdown(request.user, first, last))
+
+@role_required(ADMIN)
+def admin_analytics(request):
+    try:
+        first, last, group = date_range(request.GET)
+    except AnalyticsError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    data = time_series(DailyVehicleStats.objects.all(), first, last, group)
+    data["owners"] = owner_breakdown(first, last)["owners"]
+    return JsonResponse(data)
+
+@role_required(ADMIN)
+def cache_stats_view(request):
+    return JsonResponse(cache_stats())
+
+# Prometheus scrape endpoint; open to superusers, WHEELZY_METRICS_TOKEN
+# and WHEELZY_METRICS_IPS
+def metrics(request):
+    token = settings.WHEELZY_METRICS_TOKEN
+    allowed = (
+        request.user.is_superuser
+        or (token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"))
+        or client_ip(request) in settings.WHEELZY_METRICS_IPS
+    )
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(prometheus_text(), content_type="text/plain; version=0.0.4")
+
+
+def _event_ids(value):
+    # ?ids=1,2,3 limits a stream to the vehicles on the page
+    ids = set()
+    for part in (value or "").split(",")[:MAX_STREAM_IDS]:
+        if part.strip().isdigit():
+            ids.add(int(part))
+    return ids
+
+
+# Server-Sent Events: {vehicle_id, status, next_free_at} whenever a
+# booking changes what a vehicle's card shows. Each open stream is one
+# coroutine, so this needs an ASGI server.
+async def availability_events(request):
+    if not isinstance(request, ASGIRequest):
+        # 204 tells EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    broker = get_broker()
+    if broker.subscriber_count >= settings.WHEELZY_SSE_MAX_STREAMS:
+        response = HttpResponse(status=503)
+        response["Retry-After"] = SSE_RETRY_SECONDS
+        return response
+    ids = _event_ids(request.GET.get("ids"))
+    last_id = request.headers.get("Last-Event-ID", "")
+    last_id = int(last_id) if last_id.isdigit() else None
+
+    async def stream():
+        subscription = broker.subscribe([AVAILABILITY], last_id)
+        loop = asyncio.get_running_loop()
+        # streams are recycled; the browser reconnects with Last-Event-ID
+        closes_at = loop.time() + settings.WHEELZY_SSE_MAX_SECONDS
+        try:
+            yield f"retry: {SSE_RETRY_SECONDS * 1000}\n\n"
+            while (left := closes_at - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), min(SSE_HEARTBEAT, left))
+                except TimeoutError:
+                    # keeps proxies from timing the connection out
+                    yield ": ping\n\n"
+                    continue
+                if ids and event[1] == AVAILABILITY and event[2]["vehicle_id"] not in ids:
+                    continue
+                yield format_event(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx would otherwise buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def home(request):
+    # the page is the same for every visitor, so cache it whole
+    async def build():
+        # home.html lists no vehicles, so building it costs no query
+        return await sync_to_async(render_to_string)("home.html", {}, request)
+
+    version = await aget_version(CATALOGUE)
+    etag, last_modified = validators(
+        [version], await achanged_at(CATALOGUE, version, afleet_changed_at)
+    )
+    response = not_modified(request, etag, last_modified, private=False)
+    if response is not None:
+        return response
+    response = HttpResponse(await acached_fragment("home", CATALOGUE, build))
+    return set_validators(response, etag, last_modified, private=False)
 
 @login_required
-def all_vehicle(request):
-    vehicles = Vehicle.objects.all()
-
-    search_query = request.GET.get("q")
-    vehicle_type = request.GET.get("type")
-    seats = request.GET.get("seats")
-    available = request.GET.get("available")
-    if search_query:
-        vehicles = vehicles.filter(vehicle_name__icontains=search_query) | \
-                   vehicles.filter(number_plate__icontains=search_query)
-    if vehicle_type:
-        vehicles = vehicles.filter(vehicle_type=vehicle_type)
-    if seats:
-        vehicles = vehicles.filter(seats=seats)
-    booked_vehicle_ids = Booking.objects.filter(
-        status__in=["pending", "confirmed", "in_use"]
-    ).values_list("vehicle_id", flat=True)
-    if available == "1":
-        vehicles = vehicles.exclude(id__in=booked_vehicle_ids)
-
-    return render(request, "vehicle_list.html", {
-        "vehicles": vehicles,
-        "booked_vehicle_ids": booked_vehicle_ids
+async def all_vehicle(request):
+    async def build():
+        # search runs its match query while building the queryset
+        catalogue = await sync_to_async(vehicle_catalogue)(request.GET)
+        vehicles, next_after = await akeyset_page(
+            catalogue,
+            after=request.GET.get("after"),
+            key=catalogue_order(request.GET)
+        )
+
+        # with a date range picked, show the trip total on every card
+        start, end = requested_window(request.GET)
+        if end > start:
+            totals = await sync_to_async(quote_many)([v.id for v in vehicles], [(start, end)])
+            for v in vehicles:
+                v.trip_price = totals.get((v.id, 0))
+
+        params = request.GET.copy()
+        params.pop("after", None)
+        first_query = params.urlencode()
+        next_query = None
+        if next_after is not None:
+            params["after"] = next_after
+            next_query = params.urlencode()
+
+        return await sync_to_async(render_to_string)("vehicle_cards.html", {
+            "vehicles": vehicles,
+            "first_query": first_query,
+            "next_query": next_query
+        }, request)
+
+    version = await aget_version(CATALOGUE)
+    etag, last_modified = validators(
+        [version, request.GET.urlencode(), (await request.auser()).pk],
+        await achanged_at(CATALOGUE, version, afleet_changed_at),
+    )
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    vehicle_cards = await acached_fragment(
+        "vehicle_list", CATALOGUE, build, params=request.GET
+    )
+    response = await sync_to_async(render)(request, "vehicle_list.html", {
+        "vehicle_cards": vehicle_cards
     })
+    return set_validators(response, etag, last_modified)
 
 # view a vehicle details for user
 @login_required
-def vehicle_details(request, id):
-    vehicle = get_object_or_404(Vehicle, id=id)
-
-    is_booked = Booking.objects.filter(
-        vehicle=vehicle,
-        status__in=["pending", "confirmed", "in_use"]
-    ).exists()
-
-    return render(request, "vehicle_detail.html", {
-        "vehicle": vehicle,
-        "is_booked": is_booked
+async def vehicle_details(request, id):
+    async def build():
+        now = timezone.now()
+        # the vehicle row and its booking check don't depend on each other
+        vehicle, free = await asyncio.gather(
+            Vehicle.objects.filter(id=id).afirst(),
+            ais_free(id, now, now),
+        )
+        if vehicle is None:
+            raise Http404("No Vehicle matches the given query.")
+
+        return await sync_to_async(render_to_string)("vehicle_detail_card.html", {
+            "vehicle": vehicle,
+            "is_booked": not free
+        }, request)
+
+    # the version is read before anything is built, so a change made
+    # meanwhile can only make the page newer than its ETag, never older
+    version = await aget_version(vehicle_scope(id))
+    changed_at = await achanged_at(
+        vehicle_scope(id), version,
+        Vehicle.objects.filter(id=id).values_list("updated_at", flat=True).afirst,
+    )
+    if changed_at is None:
+        raise Http404("No Vehicle matches the given query.")
+    etag, last_modified = validators([version, (await request.auser()).pk], changed_at)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    vehicle_card = await acached_fragment("vehicle_detail", vehicle_scope(id), build)
+    response = await sync_to_async(render)(request, "vehicle_detail.html", {
+        "vehicle_card": vehicle_card,
+        "vehicle_id": id,
     })
+    return set_validators(response, etag, last_modified)
 
 
 # book a vehicle by user
 @login_required
-def book_vehicle(request, vehicle_id):
-    vehicle = get_object_or_404(Vehicle, id=vehicle_id)
+async def book_vehicle(request, vehicle_id):
+    user, vehicle = await asyncio.gather(
+        request.auser(),
+        aget_object_or_404(Vehicle.objects.select_related("owner__profile"), id=vehicle_id),
+    )
     owner = vehicle.owner
     owner_profile = None
     if owner:
         owner_profile = getattr(owner, "profile", None)
-    if vehicle.owner == request.user:
+    if vehicle.owner_id == user.pk:
         messages.error(request, "You cannot book your own vehicle")
         return redirect("vehicle_details", vehicle.id)
     if request.method == "POST":
-        start_time = request.POST.get("start_time")
-        end_time = request.POST.get("end_time")
-        start = datetime.fromisoformat(start_time)
-        end = datetime.fromisoformat(end_time)
-        if end <= start:
-            messages.error(request, "End time must be after start time")
+        start = parse_datetime_input(request.POST.get("start_time"))
+        end = parse_datetime_input(request.POST.get("end_time"))
+        if start is None or end is None:
+            messages.error(request, "Please enter a valid start and end time")
             return redirect("book_vehicle", vehicle.id)
-        if Booking.objects.filter(
-            vehicle=vehicle,
-            status__in=["pending", "confirmed", "in_use"]
-        ).exists():
-            messages.error(request, "This vehicle is already booked")
-            return redirect("vehicle_details", vehicle.id)
-        Booking.objects.create(
-            user=request.user,
-            vehicle=vehicle,
-            start_time=start,
-            end_time=end,
-            status="pending"
+        idempotency_key = (
+            request.headers.get("Idempotency-Key")
+            or request.POST.get("idempotency_key")
         )
+        if idempotency_key and not valid_idempotency_key(idempotency_key):
+            # checked up front: a key too long for its column would only
+            # fail on insert, after the booking row was written
+            return HttpResponse("Invalid Idempotency-Key", status=400)
+        try:
+            await sync_to_async(create_booking)(
+                user,
+                vehicle.id,
+                start,
+                end,
+                idempotency_key=idempotency_key
+            )
+        except VehicleUnavailable as exc:
+            messages.error(request, str(exc))
+            return redirect("vehicle_details", vehicle.id)
+        except BookingError as exc:
+            messages.error(request, str(exc))
+            return redirect("book_vehicle", vehicle.id)
         messages.success(request, "Booking created successfully!")
         return redirect("home")
-    return render(request, "booking_form.html", {
+    return await sync_to_async(render)(request, "booking_form.html", {
         "vehicle": vehicle,
         "owner": owner,
-        "owner_profile": owner_profile
+        "owner_profile": owner_profile,
+        "max_booking_days": settings.WHEELZY_MAX_BOOKING_DAYS,
+        "idempotency_key": uuid.uuid4().hex
     })
 
 # list all bookings
 @login_required
 def my_bookings(request):
-    bookings = Booking.objects.filter(user=request.user).select_related("vehicle").order_by("-ordered_at")
-    return render(request, "my_bookings.html", {"bookings": bookings})
+    # newest first, live and archived, a page at a time
+    bookings, older = booking_history({"user": request.user}, request.GET.get("before"))
+    return render(request, "my_bookings.html", {
+        "bookings": bookings,
+        "older": older,
+    })
 
 # return a vehicle
 @login_required
 def return_vehicle(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related("vehicle"), id=booking_id)
 
     if request.method == "POST":
         damage_cost = float(request.POST.get("damage_cost", 0))
         damage_desc = request.POST.get("damage_desc", "")
 
-        booking.status = "returned"
-        booking.save()
+        try:
+            booking.transition_to("returned")
+        except InvalidTransition as exc:
+            messages.error(request, str(exc))
+            return redirect("my_bookings")
 
         DamageReport.objects.create(
             booking=booking,
@@ -237,16 +448,46 @@ def return_vehicle(request, booking_id):
 
     return render(request, "return_vehicle.html", {"booking": booking})
 
+# owners confirm or decline pending bookings; customers cancel their own
+@login_required
+def change_booking_status(request, booking_id):
+    if request.method != "POST":
+        return redirect("home")
+    booking = get_object_or_404(Booking.objects.select_related("vehicle"), id=booking_id)
+    status = request.POST.get("status")
+    is_owner = booking.vehicle.owner_id == request.user.id
+    allowed = (
+        (is_owner and status in ("confirmed", "cancelled"))
+        or (booking.user_id == request.user.id and status == "cancelled")
+    )
+    if not allowed:
+        messages.error(request, "Access denied")
+        return redirect("home")
+    try:
+        booking.transition_to(status)
+    except InvalidTransition as exc:
+        messages.error(request, str(exc))
+    else:
+        messages.success(request, f"Booking #{booking.id} {booking.get_status_display().lower()}")
+    return redirect("owner_vehicle_bookings" if is_owner else "my_bookings")
+
 # admin/owner view damage details
 @login_required
 def damage_details(request, booking_id):
-    report = get_object_or_404(DamageReport, booking_id=booking_id)
+    report = DamageReport.objects.filter(booking_id=booking_id).first()
+    if report is None:
+        report = get_object_or_404(ArchivedDamageReport, booking_id=booking_id)
     return render(request, "damage_details.html", {"report": report})
 
 # add vehicles by owners
 @login_required
 def add_vehicle(request):
     if request.method == 'POST':
+        try:
+            latitude, longitude = parse_point(request.POST.get("latitude"), request.POST.get("longitude"))
+        except ValueError:
+            messages.error(request, "Please enter a valid pickup latitude and longitude")
+            return redirect("add_vehicle")
         vehicle = Vehicle.objects.create(
             owner=request.user,
             vehicle_name=request.POST.get("vehicle_name"),
@@ -255,6 +496,8 @@ def add_vehicle(request):
             seats=request.POST.get("number_of_seats"),
             price_per_hour=request.POST.get("price_per_hour"),
             image=request.FILES.get("image"),
+            latitude=latitude,
+            longitude=longitude,
         )
         messages.success(request, "Vehicle added successfully!")
         return redirect("owner_dashboard")
@@ -268,6 +511,13 @@ def update_vehicle(request, id):
         messages.error(request, "You are not allowed to edit this vehicle")
         return redirect("home")
     if request.method == "POST":
+        try:
+            vehicle.latitude, vehicle.longitude = parse_point(
+                request.POST.get("latitude"), request.POST.get("longitude")
+            )
+        except ValueError:
+            messages.error(request, "Please enter a valid pickup latitude and longitude")
+            return redirect("update_vehicle", id=vehicle.id)
         vehicle.vehicle_name = request.POST.get("vehicle_name")
         vehicle.vehicle_type = request.POST.get("vehicle_type")
         vehicle.number_plate = request.POST.get("number_plate")
@@ -289,12 +539,8 @@ def delete_vehicle(request, id):
     return redirect("home")
 
 
-@login_required
+@role_required(OWNER)
 def owner_vehicles(request):
-    if not request.user.groups.filter(name="owner").exists():
-        messages.error(request, "Access denied")
-        return redirect("home")
-
     vehicles = Vehicle.objects.filter(owner=request.user)
 
     return render(request, "owner_vehicles_list.html", {
@@ -302,14 +548,52 @@ def owner_vehicles(request):
     })
 
 
-@login_required
+@role_required(OWNER)
 def owner_bookings(request):
-    if not request.user.groups.filter(name="owner").exists():
-        messages.error(request, "Access denied")
-        return redirect("home")
-    bookings = Booking.objects.filter(
-        vehicle__owner=request.user
-    ).select_related("vehicle", "user").order_by("-ordered_at")
+    bookings, older = booking_history(
+        {"vehicle__owner": request.user}, request.GET.get("before"), related=("vehicle", "user")
+    )
     return render(request, "owner_bookings.html", {
-        "bookings": bookings
-    })
\ No newline at end of file
+        "bookings": bookings,
+        "older": older,
+    })
+
+
+# bulk import vehicles from a CSV / JSONL upload
+@role_required(OWNER)
+def import_fleet(request):
+    errors = []
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if not upload:
+            messages.error(request, "Please choose a file to import")
+            return redirect("import_vehicles")
+        fmt = "jsonl" if upload.name.endswith((".jsonl", ".ndjson")) else "csv"
+        result = import_vehicles(request.user, upload.file, fmt)
+        errors = result.errors
+        if result.created:
+            messages.success(request, f"Imported {result.created} vehicles")
+        if result.skipped:
+            messages.error(request, f"Skipped {result.skipped} rows")
+        if not errors:
+            return redirect("owner_vehicle_list")
+    return render(request, "import_vehicles.html", {"errors": errors})
+
+
+def _export_response(rows, filename, fmt):
+    content_type = "application/x-ndjson" if fmt == "jsonl" else "text/csv"
+    response = StreamingHttpResponse(rows, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+@role_required(OWNER)
+def export_fleet(request):
+    fmt = "jsonl" if request.GET.get("format") == "jsonl" else "csv"
+    return _export_response(export_vehicles(request.user, fmt), "vehicles", fmt)
+
+
+@role_required(OWNER)
+def export_fleet_bookings(request):
+    fmt = "jsonl" if request.GET.get("format") == "jsonl" else "csv"
+    return _export_response(export_bookings(request.user, fmt), "bookings", fmt)